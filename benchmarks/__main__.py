@@ -0,0 +1,113 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run the benchmarks and write the results as JSON
+
+Usage: python -m benchmarks [--sizes 1000,10000,100000] [--postgres]
+           [--output results.json]
+
+Every run records the commit it was made at, so the JSON files of two commits
+can be compared to spot regressions. With --postgres, the benchmarks also run
+against a throwaway PostgreSQL container started with testcontainers.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import subprocess  # nosec
+import sys
+import tempfile
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.dao_latency import bench_dao
+from benchmarks.scheduler_throughput import bench_scheduler
+
+
+def current_commit() -> Optional[str]:
+    """Get the commit the benchmarks are run at, if known."""
+    try:
+        return subprocess.run(  # nosec
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_postgres(stack: ExitStack) -> str:
+    """Start a throwaway PostgreSQL container and return its async URL."""
+    from testcontainers.postgres import (  # pylint: disable=import-outside-toplevel
+        PostgresContainer,
+    )
+
+    container = stack.enter_context(PostgresContainer("postgres:14"))
+    url = container.get_connection_url()
+    return "postgresql+asyncpg://" + url.split("://", 1)[1]
+
+
+async def run_all(backends: Dict[str, str], sizes: List[int]) -> List[Dict[str, Any]]:
+    """Run every benchmark for every backend and size."""
+    results = []
+    for backend, db_url in backends.items():
+        for size in sizes:
+            for bench in (bench_scheduler, bench_dao):
+                result = await bench(db_url, size)
+                result["backend"] = backend
+                print(json.dumps(result), file=sys.stderr)
+                results.append(result)
+    return results
+
+
+def run(argv: Optional[List[str]] = None) -> None:
+    """Run the benchmarks as configured by the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default="1000,10000,100000",
+        help="comma-separated numbers of queued executions",
+    )
+    parser.add_argument(
+        "--postgres",
+        action="store_true",
+        help="also benchmark against a PostgreSQL container",
+    )
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"))
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    with ExitStack() as stack, tempfile.TemporaryDirectory() as workdir:
+        backends = {"sqlite": f"sqlite+aiosqlite:///{Path(workdir) / 'bench.db'}"}
+        if args.postgres:
+            backends["postgresql"] = start_postgres(stack)
+        results = asyncio.run(run_all(backends, sizes))
+
+    report = {
+        "commit": current_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,91 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Shared helpers of the benchmarks"""
+
+import math
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Sequence
+from uuid import uuid4
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from exec_manager.config import Config
+from exec_manager.dao.db_models import Base, Execution
+from exec_manager.dao.engine import create_engine, create_session_factory
+from exec_manager.models import ExecutionStatus
+
+# number of rows inserted per statement when populating the database:
+INSERT_BATCH_SIZE = 5000
+
+
+def percentiles(samples: Sequence[float]) -> Dict[str, float]:
+    """Summarize samples in seconds by their median, p99 and maximum."""
+    if not samples:
+        return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+
+    def rank(share: float) -> float:
+        return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+    return {"p50": rank(0.5), "p99": rank(0.99), "max": ordered[-1]}
+
+
+@asynccontextmanager
+async def fresh_database(db_url: str) -> AsyncIterator[sessionmaker]:
+    """Provide a session factory for a database with all tables created empty,
+    dropping them again afterwards."""
+    engine = create_engine(Config(db_url=db_url))
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+    try:
+        yield create_session_factory(engine)
+    finally:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+
+
+async def populate(
+    session_factory: sessionmaker, count: int, owners: int = 10
+) -> List[str]:
+    """Insert the given number of queued no-op executions spread over several
+    owners and return their ids."""
+    start = datetime.utcnow() - timedelta(seconds=count)
+    ids = [uuid4().hex for _ in range(count)]
+    async with session_factory() as session:
+        async with session.begin():
+            for offset in range(0, count, INSERT_BATCH_SIZE):
+                await session.execute(
+                    insert(Execution),
+                    [
+                        {
+                            "id": execution_id,
+                            "owner": f"owner-{index % owners}",
+                            "status": ExecutionStatus.QUEUED.value,
+                            "priority": 0,
+                            "command": ["true"],
+                            "created_at": start + timedelta(seconds=index),
+                            "updated_at": start + timedelta(seconds=index),
+                        }
+                        for index, execution_id in enumerate(
+                            ids[offset : offset + INSERT_BATCH_SIZE], start=offset
+                        )
+                    ],
+                )
+    return ids
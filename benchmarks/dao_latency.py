@@ -0,0 +1,69 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Latency of the main DAO queries"""
+
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from benchmarks.common import fresh_database, percentiles, populate
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.dao.job_claims import JobClaimer
+from exec_manager.models import ExecutionStatus
+
+
+async def _time(
+    operation: Callable[[], Awaitable[Any]], repetitions: int
+) -> Dict[str, float]:
+    """Run an operation repeatedly and summarize its latencies."""
+    samples: List[float] = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        await operation()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+async def bench_dao(db_url: str, rows: int, repetitions: int = 200) -> Dict[str, Any]:
+    """Time the main queries against a table holding the given number of
+    queued executions."""
+    async with fresh_database(db_url) as session_factory:
+        ids = await populate(session_factory, rows)
+        dao = ExecutionDao(session_factory)
+        claimer = JobClaimer(session_factory, replica_id="bench", lease_duration=600)
+        rng = random.Random(0)
+        page = await dao.list(limit=50)
+
+        operations: Dict[str, Callable[[], Awaitable[Any]]] = {
+            "create": lambda: dao.create(["true"], "bench"),
+            "get": lambda: dao.get(rng.choice(ids)),
+            "get_status": lambda: dao.get_status(rng.choice(ids)),
+            "list_first_page": lambda: dao.list(limit=50),
+            "list_next_page": lambda: dao.list(limit=50, cursor=page.next_cursor),
+            "list_by_owner": lambda: dao.list(owner="owner-1", limit=50),
+            "queued_counts": dao.queued_counts,
+            "set_status": lambda: dao.set_status(
+                rng.choice(ids), ExecutionStatus.QUEUED
+            ),
+            "claim_10": lambda: claimer.claim(10),
+            "list_active": lambda: dao.list_active("bench"),
+        }
+        latencies = {
+            name: await _time(operation, repetitions)
+            for name, operation in operations.items()
+        }
+
+    return {"benchmark": "dao_latency", "rows": rows, "latency_seconds": latencies}
@@ -0,0 +1,94 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Throughput of the scheduler driving synthetic no-op executions"""
+
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from benchmarks.common import fresh_database, percentiles, populate
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.dao.job_claims import JobClaimer
+from exec_manager.dao.state_writer import StateWriter
+from exec_manager.models import ExecutionStatus
+from exec_manager.resources import ResourceAccountant, Resources
+from exec_manager.scheduler import QueuedExecution, Scheduler
+from exec_manager.workflow import WorkflowRunner
+
+
+class NoopScheduler(Scheduler):
+    """A scheduler completing executions right away instead of starting their
+    processes, so that only the overhead of scheduling is measured"""
+
+    def __init__(self, *args, expected: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dispatch_latencies: List[float] = []
+        self.queue_waits: List[float] = []
+        self._expected = expected
+        self.all_done = asyncio.Event()
+
+    async def _run_process(self, execution: QueuedExecution, dispatched: float) -> None:
+        now = time.perf_counter()
+        self.dispatch_latencies.append(now - dispatched)
+        self.queue_waits.append(now - execution.queued_at)
+        self._writer.update(
+            execution.execution_id, status=ExecutionStatus.SUCCEEDED, exit_code=0
+        )
+        if len(self.dispatch_latencies) >= self._expected:
+            self.all_done.set()
+
+
+async def bench_scheduler(
+    db_url: str, queued: int, *, max_in_flight: int = 200
+) -> Dict[str, Any]:
+    """Run the given number of queued no-op executions to completion and report
+    the throughput and the latency of dispatching them."""
+    async with fresh_database(db_url) as session_factory:
+        await populate(session_factory, queued)
+        writer = StateWriter(session_factory, flush_interval=0.05, max_batch=1000)
+        with tempfile.TemporaryDirectory() as state_dir:
+            scheduler = NoopScheduler(
+                ExecutionDao(session_factory),
+                writer,
+                JobClaimer(session_factory, replica_id="bench", lease_duration=600),
+                WorkflowRunner(ResourceAccountant(Resources(cpus=1, memory_mb=1))),
+                max_in_flight=max_in_flight,
+                max_queued=max_in_flight,
+                heartbeat_interval=60,
+                claim_interval=0.01,
+                state_dir=Path(state_dir),
+                expected=queued,
+            )
+            writer.start()
+            start = time.perf_counter()
+            running = asyncio.ensure_future(scheduler.run())
+            await scheduler.all_done.wait()
+            await writer.flush()
+            elapsed = time.perf_counter() - start
+            running.cancel()
+            await asyncio.gather(running, return_exceptions=True)
+            await writer.close()
+
+    return {
+        "benchmark": "scheduler_throughput",
+        "queued": queued,
+        "seconds": elapsed,
+        "executions_per_second": queued / elapsed,
+        "dispatch_latency_seconds": percentiles(scheduler.dispatch_latencies),
+        "claim_to_start_seconds": percentiles(scheduler.queue_waits),
+    }
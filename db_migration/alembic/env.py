@@ -67,7 +67,14 @@ def run_migrations_online():
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        # Every revision is committed on its own, so that revisions which have
+        # to work outside of a transaction (see exec_manager.dao.migration_helpers)
+        # do not commit half of a preceding revision:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            transaction_per_migration=True,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,109 @@
+"""initial schema
+
+Revision ID: 3f1c2a9d7b10
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+import exec_manager.dao.types
+
+# revision identifiers, used by Alembic.
+revision = "3f1c2a9d7b10"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "executions",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("owner", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("command", exec_manager.dao.types.Payload(), nullable=False),
+        sa.Column("workflow", exec_manager.dao.types.Payload(), nullable=True),
+        sa.Column("pid", sa.Integer(), nullable=True),
+        sa.Column("exit_code", sa.Integer(), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+        sa.Column("lease_owner", sa.String(), nullable=True),
+        sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_executions_created_at",
+        "executions",
+        ["created_at", "id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_executions_status_created_at",
+        "executions",
+        ["status", "created_at", "id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_executions_owner_created_at",
+        "executions",
+        ["owner", "created_at", "id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_executions_active_lease_owner",
+        "executions",
+        ["lease_owner"],
+        unique=False,
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+        sqlite_where=sa.text("status IN ('queued', 'running')"),
+    )
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(
+            "CREATE INDEX ix_executions_workflow ON executions USING gin (workflow jsonb_path_ops)"
+        )
+    op.create_table(
+        "call_cache_entries",
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("outputs", exec_manager.dao.types.Payload(), nullable=False),
+        sa.Column("files", exec_manager.dao.types.Payload(), nullable=False),
+        sa.Column("size_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("last_used_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index(
+        op.f("ix_call_cache_entries_last_used_at"),
+        "call_cache_entries",
+        ["last_used_at"],
+        unique=False,
+    )
+    op.create_table(
+        "step_completions",
+        sa.Column("execution_id", sa.String(), nullable=False),
+        sa.Column("node_id", sa.String(), nullable=False),
+        sa.Column("outputs", exec_manager.dao.types.Payload(), nullable=False),
+        sa.Column("completed_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["execution_id"],
+            ["executions.id"],
+        ),
+        sa.PrimaryKeyConstraint("execution_id", "node_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("step_completions")
+    op.drop_index(
+        op.f("ix_call_cache_entries_last_used_at"), table_name="call_cache_entries"
+    )
+    op.drop_table("call_cache_entries")
+    if op.get_bind().dialect.name == "postgresql":
+        op.drop_index("ix_executions_workflow", table_name="executions")
+    op.drop_index("ix_executions_active_lease_owner", table_name="executions")
+    op.drop_index("ix_executions_owner_created_at", table_name="executions")
+    op.drop_index("ix_executions_status_created_at", table_name="executions")
+    op.drop_index("ix_executions_created_at", table_name="executions")
+    op.drop_table("executions")
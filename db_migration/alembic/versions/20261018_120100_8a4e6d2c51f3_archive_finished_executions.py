@@ -0,0 +1,47 @@
+"""archive finished executions
+
+Revision ID: 8a4e6d2c51f3
+Revises: 3f1c2a9d7b10
+Create Date: 2026-10-18 12:01:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+import exec_manager.dao.types
+
+# revision identifiers, used by Alembic.
+revision = "8a4e6d2c51f3"
+down_revision = "3f1c2a9d7b10"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "executions_archive",
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("owner", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("command", exec_manager.dao.types.Payload(), nullable=False),
+        sa.Column("workflow", exec_manager.dao.types.Payload(), nullable=True),
+        sa.Column("pid", sa.Integer(), nullable=True),
+        sa.Column("exit_code", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("archived_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_executions_archive_owner_created_at",
+        "executions_archive",
+        ["owner", "created_at"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_executions_archive_owner_created_at", table_name="executions_archive"
+    )
+    op.drop_table("executions_archive")
@@ -0,0 +1,42 @@
+"""execution outbox
+
+Revision ID: c7d2e94b1a06
+Revises: 8a4e6d2c51f3
+Create Date: 2026-10-18 12:02:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c7d2e94b1a06"
+down_revision = "8a4e6d2c51f3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "execution_outbox",
+        sa.Column(
+            "seq",
+            sa.BigInteger().with_variant(sa.Integer(), "sqlite"),
+            autoincrement=True,
+            nullable=False,
+        ),
+        sa.Column("execution_id", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("seq"),
+    )
+    op.create_index(
+        op.f("ix_execution_outbox_created_at"),
+        "execution_outbox",
+        ["created_at"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_execution_outbox_created_at"), table_name="execution_outbox")
+    op.drop_table("execution_outbox")
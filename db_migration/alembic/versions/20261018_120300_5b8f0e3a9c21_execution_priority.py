@@ -0,0 +1,50 @@
+"""execution priority
+
+Revision ID: 5b8f0e3a9c21
+Revises: c7d2e94b1a06
+Create Date: 2026-10-18 12:03:00.000000
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from exec_manager.dao.migration_helpers import (
+    create_index_concurrently,
+    drop_index_concurrently,
+    lock_timeout,
+)
+
+# revision identifiers, used by Alembic.
+revision = "5b8f0e3a9c21"
+down_revision = "c7d2e94b1a06"
+branch_labels = None
+depends_on = None
+
+# seconds to wait for the lock on the executions table before giving up:
+LOCK_TIMEOUT = 5.0
+
+
+def upgrade():
+    # A constant server default lets PostgreSQL add the column without
+    # rewriting the table, but it still needs a brief exclusive lock:
+    with lock_timeout(LOCK_TIMEOUT):
+        op.add_column(
+            "executions",
+            sa.Column(
+                "priority", sa.Integer(), server_default=sa.text("0"), nullable=False
+            ),
+        )
+    create_index_concurrently(
+        "ix_executions_claimable",
+        "executions",
+        [sa.text("priority DESC"), "created_at"],
+        postgresql_where=sa.text("status IN ('queued', 'running')"),
+        sqlite_where=sa.text("status IN ('queued', 'running')"),
+    )
+
+
+def downgrade():
+    drop_index_concurrently("ix_executions_claimable", "executions")
+    with lock_timeout(LOCK_TIMEOUT):
+        with op.batch_alter_table("executions") as batch_op:
+            batch_op.drop_column("priority")
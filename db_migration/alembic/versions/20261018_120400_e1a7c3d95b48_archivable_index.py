@@ -0,0 +1,33 @@
+"""archivable index
+
+Revision ID: e1a7c3d95b48
+Revises: 5b8f0e3a9c21
+Create Date: 2026-10-18 12:04:00.000000
+
+"""
+import sqlalchemy as sa
+
+from exec_manager.dao.migration_helpers import (
+    create_index_concurrently,
+    drop_index_concurrently,
+)
+
+# revision identifiers, used by Alembic.
+revision = "e1a7c3d95b48"
+down_revision = "5b8f0e3a9c21"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_index_concurrently(
+        "ix_executions_archivable",
+        "executions",
+        ["updated_at"],
+        postgresql_where=sa.text("status IN ('succeeded', 'failed', 'cancelled')"),
+        sqlite_where=sa.text("status IN ('succeeded', 'failed', 'cancelled')"),
+    )
+
+
+def downgrade():
+    drop_index_concurrently("ix_executions_archivable", "executions")
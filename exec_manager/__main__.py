@@ -15,10 +15,31 @@
 
 """Entrypoint of the package"""
 
+import argparse
+import logging
+from typing import List, Optional
 
-def run():
+from exec_manager import __version__
+
+
+def run(argv: Optional[List[str]] = None):
     """Run the service"""
-    ...
+    parser = argparse.ArgumentParser(prog="my-microservice")
+    parser.add_argument("--version", action="version", version=__version__)
+    parser.parse_args(argv)
+
+    # The config, the DB layer and the executor stack are only imported once it
+    # is clear that the service is going to start, so that trivial invocations
+    # return quickly:
+    # pylint: disable=import-outside-toplevel
+    import asyncio
+
+    from exec_manager.config import Config
+    from exec_manager.service import serve
+
+    config = Config()
+    logging.basicConfig(level=config.log_level)
+    asyncio.run(serve(config))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Admission control of new executions"""
+
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    from exec_manager.dao.executions import ExecutionDao
+
+
+class AdmissionRejectedError(RuntimeError):
+    """Thrown when a submission is shed because too many executions are queued.
+    `retry_after` is the number of seconds after which retrying makes sense."""
+
+    def __init__(self, reason: str, retry_after: float):
+        message = (
+            f"The submission was rejected: {reason}. Retry after {retry_after:g}s."
+        )
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionMetrics:
+    """Statistics on the decisions of the admission controller"""
+
+    admitted: int = 0
+    rejected_owner: int = 0
+    rejected_total: int = 0
+
+
+class AdmissionController:  # pylint: disable=too-many-instance-attributes
+    """Rejects submissions while an owner or the whole service has too many
+    executions queued.
+
+    The queued executions are counted in the database, so the limits hold for
+    all replicas together. To keep submissions cheap, the counts are reused for
+    `count_ttl` seconds and incremented locally for every admitted submission in
+    the meantime, so a burst cannot overshoot the limits of this replica.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        dao: "ExecutionDao",
+        *,
+        max_queued_per_owner: int,
+        max_queued_total: int,
+        retry_after: float,
+        count_ttl: float = 1.0,
+        metrics: Optional[AdmissionMetrics] = None,
+    ):
+        """Initialize with the limits and the number of seconds suggested to
+        rejected clients before retrying."""
+        self._dao = dao
+        self._max_queued_per_owner = max_queued_per_owner
+        self._max_queued_total = max_queued_total
+        self._retry_after = retry_after
+        self._count_ttl = count_ttl
+        self.metrics = metrics or AdmissionMetrics()
+        self._counts: Dict[str, int] = {}
+        self._counted_at: Optional[float] = None
+
+    async def admit(self, owner: str) -> None:
+        """Admit a submission of the given owner or raise an
+        AdmissionRejectedError."""
+        now = time.monotonic()
+        if self._counted_at is None or now - self._counted_at >= self._count_ttl:
+            self._counts = await self._dao.queued_counts()
+            self._counted_at = now
+
+        if sum(self._counts.values()) >= self._max_queued_total:
+            self.metrics.rejected_total += 1
+            raise AdmissionRejectedError(
+                "too many executions are queued", self._retry_after
+            )
+        if self._counts.get(owner, 0) >= self._max_queued_per_owner:
+            self.metrics.rejected_owner += 1
+            raise AdmissionRejectedError(
+                f"owner '{owner}' has too many executions queued", self._retry_after
+            )
+        self._counts[owner] = self._counts.get(owner, 0) + 1
+        self.metrics.admitted += 1
@@ -0,0 +1,218 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Content-addressed cache of the outputs of workflow steps"""
+
+import asyncio
+import hashlib
+import json
+import shutil
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from exec_manager.dao.db_models import CallCacheEntry
+from exec_manager.dao.engine import DB_QUERY_SECONDS
+from exec_manager.metrics import timed
+
+
+def call_cache_key(
+    tool: Mapping[str, Any],
+    inputs: Mapping[str, Any],
+    input_checksums: Mapping[str, str],
+    image: Optional[str],
+) -> str:
+    """Hash everything that determines the outputs of a step: the definition of
+    the tool, the resolved input values, the checksums of the input files and the
+    container image it runs in."""
+    canonical = json.dumps(
+        {
+            "tool": tool,
+            "inputs": inputs,
+            "input_checksums": input_checksums,
+            "image": image,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+@dataclass
+class CacheMetrics:
+    """Statistics on the use of the call cache"""
+
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    bytes_evicted: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """Share of lookups that were answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+@dataclass(frozen=True)
+class CachedCall:
+    """The outputs of a step as stored in the cache"""
+
+    outputs: Dict[str, Any]
+    files: Dict[str, Path]
+
+
+def _copy_files(files: Mapping[str, Path], target: Path) -> int:
+    """Copy the output files into a new entry directory, returning their total
+    size. The directory is populated under a temporary name and renamed at the
+    end, so a half-written entry is never visible. If the entry directory has
+    been created concurrently, the existing one is kept."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=target.parent, prefix=".staging-"))
+    size = 0
+    try:
+        for name, source in files.items():
+            shutil.copyfile(source, staging / name)
+            size += (staging / name).stat().st_size
+        if not target.is_dir():
+            staging.rename(target)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return size
+
+
+class CallCache:
+    """Stores the outputs of steps on disk, addressed by their call cache key.
+
+    Every entry is a directory holding the output files, indexed by a row in the
+    database that records its size and when it was last used. When storing an
+    entry pushes the total size above `max_bytes`, the least recently used entries
+    are evicted until it fits again.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        *,
+        cache_dir: Path,
+        max_bytes: int,
+        metrics: Optional[CacheMetrics] = None,
+    ):
+        """Initialize the cache storing its files below `cache_dir`."""
+        self._session_factory = session_factory
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self.metrics = metrics or CacheMetrics()
+        self._evict_lock = asyncio.Lock()
+
+    def _entry_dir(self, key: str) -> Path:
+        """The directory holding the files of an entry."""
+        return self._cache_dir / key[:2] / key
+
+    @timed(DB_QUERY_SECONDS)
+    async def lookup(self, key: str) -> Optional[CachedCall]:
+        """Get the cached outputs for the given key, or None on a miss."""
+        entry_dir = self._entry_dir(key)
+        async with self._session_factory() as session:
+            async with session.begin():
+                entry = await session.get(CallCacheEntry, key)
+                if entry is None or not entry_dir.is_dir():
+                    self.metrics.misses += 1
+                    return None
+                entry.last_used_at = datetime.utcnow()
+        self.metrics.hits += 1
+        return CachedCall(
+            outputs=entry.outputs,
+            files={name: entry_dir / name for name in entry.files},
+        )
+
+    @timed(DB_QUERY_SECONDS)
+    async def store(
+        self, key: str, outputs: Mapping[str, Any], files: Mapping[str, Path]
+    ) -> None:
+        """Store the outputs of a step. The given files are copied into the
+        cache. Storing a key that is already cached only marks it as used."""
+        entry_dir = self._entry_dir(key)
+        async with self._session_factory() as session:
+            async with session.begin():
+                result = await session.execute(
+                    update(CallCacheEntry)
+                    .where(CallCacheEntry.key == key)
+                    .values(last_used_at=datetime.utcnow())
+                )
+                if result.rowcount:
+                    return
+
+        loop = asyncio.get_running_loop()
+        size = await loop.run_in_executor(None, _copy_files, files, entry_dir)
+        try:
+            async with self._session_factory() as session:
+                async with session.begin():
+                    session.add(
+                        CallCacheEntry(
+                            key=key,
+                            outputs=dict(outputs),
+                            files=list(files),
+                            size_bytes=size,
+                        )
+                    )
+        except IntegrityError:
+            # stored by someone else in the meantime
+            return
+        self.metrics.stores += 1
+        await self._evict()
+
+    @timed(DB_QUERY_SECONDS)
+    async def _evict(self) -> None:
+        """Evict the least recently used entries until the cache fits into its
+        size limit."""
+        async with self._evict_lock:
+            async with self._session_factory() as session:
+                async with session.begin():
+                    total = await session.scalar(
+                        select(func.coalesce(func.sum(CallCacheEntry.size_bytes), 0))
+                    )
+                    if total <= self._max_bytes:
+                        return
+                    result = await session.execute(
+                        select(CallCacheEntry.key, CallCacheEntry.size_bytes).order_by(
+                            CallCacheEntry.last_used_at
+                        )
+                    )
+                    evicted = []
+                    for key, size in result:
+                        if total <= self._max_bytes:
+                            break
+                        evicted.append(key)
+                        total -= size
+                        self.metrics.evictions += 1
+                        self.metrics.bytes_evicted += size
+                    await session.execute(
+                        delete(CallCacheEntry).where(CallCacheEntry.key.in_(evicted))
+                    )
+
+            loop = asyncio.get_running_loop()
+            for key in evicted:
+                await loop.run_in_executor(
+                    None, shutil.rmtree, self._entry_dir(key), True
+                )
@@ -0,0 +1,152 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parallel checksumming of large input files"""
+
+import asyncio
+import hashlib
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# identifies the content of a file as long as it is not modified:
+FileIdentity = Tuple[str, int, int, int]
+
+DEFAULT_ALGORITHMS = ("md5", "sha256")
+
+
+def file_identity(path: Path) -> FileIdentity:
+    """Get the path, inode, size and modification time of a file."""
+    stat = os.stat(path)
+    return (str(path.resolve()), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def hash_file(path: Path, algorithms: Sequence[str], chunk_size: int) -> Dict[str, str]:
+    """Hash a file with all given algorithms in a single pass over a read-only
+    memory map of the file, feeding every chunk to all digests before moving on.
+    hashlib releases the GIL while digesting large buffers, so several files are
+    hashed truly in parallel on different threads."""
+    digests = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size > 0:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for start in range(0, len(view), chunk_size):
+                        chunk = view[start : start + chunk_size]
+                        for digest in digests.values():
+                            digest.update(chunk)
+                        chunk.release()
+                finally:
+                    view.release()
+    return {algorithm: digest.hexdigest() for algorithm, digest in digests.items()}
+
+
+class Checksummer:
+    """Computes checksums of files on a thread pool and remembers them.
+
+    Every file is hashed on its own worker thread, so several files are
+    processed at the same time. Each file is read only once, however many
+    algorithms are requested, as every chunk is fed to all of their digests.
+
+    Results are memoized by path, inode, size and modification time, so files
+    that did not change are never hashed again. The memo holds at most
+    `memo_size` files, evicting the least recently used.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_workers: int,
+        chunk_size: int = 8 * 1024**2,
+        memo_size: int = 10000
+    ):
+        """Initialize the checksummer with its own thread pool."""
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="checksum"
+        )
+        self._chunk_size = chunk_size
+        self._memo_size = memo_size
+        self._memo: "OrderedDict[FileIdentity, Dict[str, str]]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    def close(self) -> None:
+        """Shut down the thread pool."""
+        self._executor.shutdown()
+
+    def checksum_files(
+        self, paths: Iterable[Path], algorithms: Sequence[str] = DEFAULT_ALGORITHMS
+    ) -> Dict[Path, Dict[str, str]]:
+        """Get the checksums of all given files using all given algorithms."""
+        results: Dict[Path, Dict[str, str]] = {}
+        jobs: List[Tuple[Path, FileIdentity, "Future[Dict[str, str]]"]] = []
+        for path in paths:
+            identity = file_identity(path)
+            known = self._recall(identity)
+            results[path] = {
+                algorithm: known[algorithm]
+                for algorithm in algorithms
+                if algorithm in known
+            }
+            missing = [algorithm for algorithm in algorithms if algorithm not in known]
+            if missing:
+                future = self._executor.submit(
+                    hash_file, path, missing, self._chunk_size
+                )
+                jobs.append((path, identity, future))
+
+        # the memo may be smaller than the number of files, so the results are
+        # collected here rather than read back from it:
+        for path, identity, future in jobs:
+            checksums = future.result()
+            results[path].update(checksums)
+            self._remember(identity, checksums)
+        return results
+
+    def checksum(
+        self, path: Path, algorithms: Sequence[str] = DEFAULT_ALGORITHMS
+    ) -> Dict[str, str]:
+        """Get the checksums of a single file using all given algorithms."""
+        return self.checksum_files([path], algorithms)[path]
+
+    async def checksum_files_async(
+        self, paths: Iterable[Path], algorithms: Sequence[str] = DEFAULT_ALGORITHMS
+    ) -> Dict[Path, Dict[str, str]]:
+        """Like `checksum_files` but without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self.checksum_files, list(paths), algorithms
+        )
+
+    def _recall(self, identity: FileIdentity) -> Dict[str, str]:
+        """Get the memoized checksums of a file."""
+        with self._memo_lock:
+            known = self._memo.get(identity)
+            if known is None:
+                return {}
+            self._memo.move_to_end(identity)
+            return dict(known)
+
+    def _remember(self, identity: FileIdentity, checksums: Dict[str, str]) -> None:
+        """Memoize checksums of a file."""
+        with self._memo_lock:
+            self._memo.setdefault(identity, {}).update(checksums)
+            self._memo.move_to_end(identity)
+            while len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
@@ -0,0 +1,121 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Config Parameter Modeling and Parsing"""
+
+import socket
+from typing import Dict, Optional
+
+from pydantic import BaseSettings
+
+
+class Config(BaseSettings):
+    """Config parameters and their defaults."""
+
+    # async SQLAlchemy URL of the database holding the executions:
+    db_url: str = "sqlite+aiosqlite:///./exec_manager.db"
+    # connections kept open in the pool:
+    db_pool_size: int = 10
+    # connections that may be opened on top of the pool size under load:
+    db_max_overflow: int = 20
+    # seconds to wait for a free connection before failing:
+    db_pool_timeout: float = 30.0
+    # seconds after which a pooled connection is replaced, -1 to disable:
+    db_pool_recycle: int = 1800
+    # test connections for liveness when checking them out:
+    db_pool_pre_ping: bool = True
+    # maximum number of executions running at the same time:
+    max_in_flight_executions: int = 100
+    # maximum number of executions waiting for a free slot,
+    # submissions block once the queue is full:
+    max_queued_executions: int = 1000
+    # submissions are rejected while this many executions are queued in total
+    # or by the submitting owner, clients are told to retry after some seconds:
+    max_queued_total: int = 100000
+    max_queued_per_owner: int = 10000
+    admission_retry_after: float = 30.0
+    # identifies this replica when holding leases on executions,
+    # must be unique among all replicas sharing the database:
+    replica_id: str = socket.gethostname()
+    # seconds for which a claimed execution is reserved for this replica
+    # without the lease being renewed:
+    lease_duration: float = 60.0
+    # seconds to wait before claiming again when no execution was claimable:
+    claim_interval: float = 1.0
+    # CPUs and memory available to workflow steps on this host,
+    # detected if not set:
+    host_cpus: Optional[float] = None
+    host_memory_mb: Optional[int] = None
+    # ratio by which the CPUs of the host may be overcommitted:
+    cpu_overcommit: float = 1.0
+    # seconds after which a waiting step stops being overtaken by
+    # smaller steps that fit into the free resources:
+    backfill_starvation_timeout: float = 300.0
+    # seconds to wait before the first retry of a failed step,
+    # doubled for every further retry up to the maximum:
+    step_retry_backoff: float = 1.0
+    step_retry_backoff_max: float = 60.0
+    # directory in which child processes leave their exit codes,
+    # must survive restarts of the service for reattaching to them:
+    state_dir: str = "./exec_manager_state"
+    # directory holding the captured output of executions:
+    logs_dir: str = "./exec_manager_logs"
+    # weights of the shares of owners in the slots of a replica and in claiming,
+    # owners not listed here have a weight of 1:
+    owner_weights: Dict[str, float] = {}
+    # seconds between heartbeats of a running execution:
+    heartbeat_interval: float = 10.0
+    # seconds for which state updates are collected before being written:
+    state_flush_interval: float = 0.5
+    # number of executions with pending updates that triggers an early write:
+    state_flush_max_batch: int = 500
+    # directory holding the outputs of cached steps:
+    call_cache_dir: str = "./call_cache"
+    # size limit of the call cache in bytes,
+    # least recently used entries are evicted beyond it:
+    call_cache_max_bytes: int = 100 * 1024**3
+    # seconds between checks of the change feed outbox for events whose
+    # notification got lost, also the interval of pruning the outbox:
+    change_feed_poll_interval: float = 5.0
+    # seconds for which published events are kept in the outbox:
+    change_feed_retention: float = 3600.0
+    # seconds after which finished executions are moved to the archive table:
+    archive_after: float = 7 * 24 * 3600.0
+    # seconds between runs of the archiver:
+    archive_interval: float = 3600.0
+    # maximum number of executions archived per transaction:
+    archive_batch_size: int = 1000
+    # threads used for checksumming input files:
+    checksum_workers: int = 4
+    # address at which metrics are served in the Prometheus text format,
+    # no metrics are served if the port is not set:
+    metrics_host: str = "127.0.0.1"
+    metrics_port: Optional[int] = 9464
+    # seconds between counts of the queued and running executions for the
+    # metrics, about the interval at which they are scraped:
+    status_count_interval: float = 15.0
+    # profile the service and trace executions from the start, profiling can
+    # also be switched on and off at runtime by sending SIGUSR2:
+    profiling: bool = False
+    # directory receiving the sampled profiles and the traces:
+    profile_dir: str = "./exec_manager_profiles"
+    # seconds between samples of the event loop thread while profiling:
+    profile_sample_interval: float = 0.005
+    log_level: str = "INFO"
+
+    class Config:
+        """Settings for the pydantic BaseSettings"""
+
+        env_prefix = "exec_manager_"
@@ -0,0 +1,136 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Archival of finished executions"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import DateTime, bindparam, delete, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from exec_manager.dao.db_models import ArchivedExecution, Execution, StepCompletion
+from exec_manager.dao.engine import DB_QUERY_SECONDS
+from exec_manager.metrics import timed
+from exec_manager.models import ExecutionStatus
+
+TERMINAL_STATUSES = (
+    ExecutionStatus.SUCCEEDED.value,
+    ExecutionStatus.FAILED.value,
+    ExecutionStatus.CANCELLED.value,
+)
+
+# The columns copied from the executions table into the archive:
+ARCHIVED_COLUMNS = (
+    "id",
+    "owner",
+    "status",
+    "command",
+    "workflow",
+    "pid",
+    "exit_code",
+    "created_at",
+    "updated_at",
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Archiver:
+    """Moves executions that finished longer ago than the retention period from
+    the executions table into the archive table.
+
+    Executions are moved in batches, each in its own short transaction, so
+    archiving a large backlog never holds locks on many rows at once. Every batch
+    is read from the partial index of finished executions by their last update,
+    so it costs the same no matter how many executions are left.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        *,
+        retention: float,
+        batch_size: int,
+    ):
+        """Initialize with a factory returning new async sessions, the seconds
+        for which finished executions stay in the executions table and the
+        maximum number of executions moved per transaction."""
+        self._session_factory = session_factory
+        self._retention = timedelta(seconds=retention)
+        self._batch_size = batch_size
+
+    async def archive(self) -> int:
+        """Archive all executions that are due and return their number."""
+        cutoff = datetime.utcnow() - self._retention
+        archived = 0
+        while True:
+            moved = await self._archive_batch(cutoff)
+            archived += moved
+            if moved < self._batch_size:
+                return archived
+
+    @timed(DB_QUERY_SECONDS)
+    async def _archive_batch(self, cutoff: datetime) -> int:
+        """Move one batch of executions finished before the cutoff."""
+        due = (
+            select(Execution.id)
+            .where(
+                # rendered as literals to match the predicate of the index:
+                Execution.status.in_(
+                    bindparam(
+                        "terminal_statuses",
+                        list(TERMINAL_STATUSES),
+                        expanding=True,
+                        literal_execute=True,
+                    )
+                ),
+                Execution.updated_at < cutoff,
+            )
+            .order_by(Execution.updated_at)
+            .limit(self._batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with self._session_factory() as session:
+            async with session.begin():
+                ids = list((await session.execute(due)).scalars())
+                if not ids:
+                    return 0
+                columns = [getattr(Execution, name) for name in ARCHIVED_COLUMNS]
+                columns.append(literal(datetime.utcnow(), DateTime))
+                await session.execute(
+                    insert(ArchivedExecution).from_select(
+                        ARCHIVED_COLUMNS + ("archived_at",),
+                        select(*columns).where(Execution.id.in_(ids)),
+                    )
+                )
+                await session.execute(
+                    delete(StepCompletion).where(StepCompletion.execution_id.in_(ids))
+                )
+                await session.execute(delete(Execution).where(Execution.id.in_(ids)))
+        return len(ids)
+
+    async def run(self, interval: float) -> None:
+        """Archive due executions every interval seconds until cancelled."""
+        while True:
+            try:
+                archived = await self.archive()
+                if archived:
+                    logger.info("Archived %d finished executions", archived)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to archive finished executions")
+            await asyncio.sleep(interval)
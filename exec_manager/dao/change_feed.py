@@ -0,0 +1,286 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Push notifications of execution status changes via a transactional outbox"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from exec_manager.dao.db_models import OutboxEvent
+from exec_manager.dao.engine import DB_QUERY_SECONDS
+from exec_manager.metrics import timed
+from exec_manager.models import ExecutionStatus
+
+# The PostgreSQL channel on which committed changes are announced:
+CHANNEL = "execution_events"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ExecutionEvent:
+    """A change of the status of an execution"""
+
+    seq: int
+    execution_id: str
+    status: ExecutionStatus
+
+
+class Subscription:
+    """The events delivered to one subscriber, iterated with `async for`.
+
+    At most `max_queue` events are buffered. When a subscriber falls further
+    behind, the oldest events are dropped and counted in `dropped`, so that a
+    slow consumer never holds up the others or grows the memory usage. A
+    subscriber that missed events should read the current state from the DB.
+    """
+
+    def __init__(self, subscribers: Set["Subscription"], max_queue: int):
+        """Initialize with the set of subscribers of the feed to register in."""
+        self._subscribers = subscribers
+        self._queue: "asyncio.Queue[ExecutionEvent]" = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+        subscribers.add(self)
+
+    def push(self, event: ExecutionEvent) -> None:
+        """Buffer an event, dropping the oldest one if the buffer is full."""
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(event)
+
+    def close(self) -> None:
+        """Stop receiving events."""
+        self._subscribers.discard(self)
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> ExecutionEvent:
+        return await self._queue.get()
+
+
+class ChangeFeed:  # pylint: disable=too-many-instance-attributes
+    """Records status changes in the outbox table and relays them to
+    subscribers.
+
+    Writers record changes in the transaction that makes them and call
+    `committed` afterwards. The relay reads new outbox entries as soon as it is
+    woken up, either in-process by `committed` or, on PostgreSQL, by a NOTIFY
+    sent on commit by any replica. It also checks every `poll_interval` seconds
+    in case a notification got lost. Events are hints: subscribers may miss
+    some and must treat the DB as the source of truth.
+
+    Sequence numbers are taken when a change is recorded, but transactions
+    commit in any order, so a number may become visible after higher ones were
+    delivered. The numbers skipped by a delivery are kept as open gaps and read
+    again on every later delivery, which delivers their events late, until they
+    show up or `gap_timeout` seconds have passed. Numbers of transactions that
+    were rolled back never show up; giving up on a gap is counted in `skipped`.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        engine: AsyncEngine,
+        session_factory: Callable[[], AsyncSession],
+        *,
+        poll_interval: float,
+        retention: float,
+        batch_size: int = 500,
+        gap_timeout: float = 10.0,
+        max_gaps: int = 1000,
+    ):
+        """Initialize the feed. Call `run` to start relaying events."""
+        self._engine = engine
+        self._session_factory = session_factory
+        self._poll_interval = poll_interval
+        self._retention = timedelta(seconds=retention)
+        self._batch_size = batch_size
+        self._notify = engine.dialect.name == "postgresql"
+        self._wakeup = asyncio.Event()
+        self._subscribers: Set[Subscription] = set()
+        self._commit_callbacks: List[Callable[[List[str]], None]] = []
+        self._last_seq: Optional[int] = None
+        self._gap_timeout = gap_timeout
+        self._max_gaps = max_gaps
+        # the deadline of every sequence number that was skipped so far:
+        self._gaps: Dict[int, float] = {}
+        self.skipped = 0
+
+    async def record(
+        self, session: AsyncSession, changes: Iterable[Tuple[str, str]]
+    ) -> None:
+        """Add the given pairs of execution id and status to the outbox as part
+        of the transaction of the session."""
+        rows = [
+            {"execution_id": execution_id, "status": status}
+            for execution_id, status in changes
+        ]
+        if not rows:
+            return
+        await session.execute(insert(OutboxEvent), rows)
+        if self._notify:
+            await session.execute(select(func.pg_notify(CHANNEL, "")))
+
+    def on_commit(self, callback: Callable[[List[str]], None]) -> None:
+        """Call the callback with the ids of the executions whose status changed
+        right after each commit of this process, before any event is relayed."""
+        self._commit_callbacks.append(callback)
+
+    def committed(self, execution_ids: Iterable[str]) -> None:
+        """Notify about the executions whose status changes have just been
+        committed and wake up the relay."""
+        execution_ids = list(execution_ids)
+        for callback in self._commit_callbacks:
+            callback(execution_ids)
+        self._wakeup.set()
+
+    def subscribe(self, max_queue: int = 1000) -> Subscription:
+        """Start receiving the events relayed after this call."""
+        return Subscription(self._subscribers, max_queue)
+
+    async def run(self) -> None:
+        """Relay events to the subscribers until cancelled."""
+        if self._last_seq is None:
+            self._last_seq = await self._max_seq()
+        if not self._notify:
+            await self._relay()
+            return
+        async with self._engine.connect() as connection:
+            raw_connection = await connection.get_raw_connection()
+            driver_connection = raw_connection.driver_connection
+            await driver_connection.add_listener(CHANNEL, self._on_notification)
+            try:
+                await self._relay()
+            finally:
+                await driver_connection.remove_listener(CHANNEL, self._on_notification)
+
+    def _on_notification(self, *_args) -> None:
+        """Handle a notification sent by PostgreSQL."""
+        self._wakeup.set()
+
+    async def _relay(self) -> None:
+        """Deliver new events whenever woken up or the poll interval elapsed.
+        The outbox is pruned once per poll interval, also while it is busy."""
+        loop = asyncio.get_running_loop()
+        pruned_at = loop.time()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            if loop.time() - pruned_at >= self._poll_interval:
+                await self._prune()
+                pruned_at = loop.time()
+            self._wakeup.clear()
+            try:
+                await self.deliver()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Relaying execution events failed.")
+
+    async def deliver(self) -> int:
+        """Deliver all events added to the outbox since the last delivery,
+        including those filling gaps left by earlier deliveries, and return
+        their number."""
+        if self._last_seq is None:
+            self._last_seq = await self._max_seq()
+        delivered = await self._deliver_gaps()
+        while True:
+            events = await self._read(OutboxEvent.seq > self._last_seq)
+            for event in events:
+                self._open_gaps(self._last_seq, event.seq)
+                self._push(event)
+                self._last_seq = event.seq
+            delivered += len(events)
+            if len(events) < self._batch_size:
+                return delivered
+
+    async def _deliver_gaps(self) -> int:
+        """Deliver the events of skipped sequence numbers that were committed in
+        the meantime and give up on the gaps that are past their deadline."""
+        delivered = 0
+        gaps = sorted(self._gaps)
+        for start in range(0, len(gaps), self._batch_size):
+            chunk = gaps[start : start + self._batch_size]
+            for event in await self._read(OutboxEvent.seq.in_(chunk)):
+                del self._gaps[event.seq]
+                self._push(event)
+                delivered += 1
+        now = time.monotonic()
+        for seq, deadline in list(self._gaps.items()):
+            if deadline <= now:
+                del self._gaps[seq]
+                self.skipped += 1
+        return delivered
+
+    def _open_gaps(self, last_seq: int, seq: int) -> None:
+        """Remember the sequence numbers between the last delivered and the given
+        one, at most the `max_gaps` highest of them."""
+        deadline = time.monotonic() + self._gap_timeout
+        first = max(last_seq + 1, seq - self._max_gaps)
+        self.skipped += first - (last_seq + 1)
+        for missing in range(first, seq):
+            self._gaps[missing] = deadline
+
+    def _push(self, event: ExecutionEvent) -> None:
+        """Hand an event to all subscribers."""
+        for subscriber in list(self._subscribers):
+            subscriber.push(event)
+
+    @timed(DB_QUERY_SECONDS)
+    async def _read(self, condition: Any) -> List[ExecutionEvent]:
+        """Read a batch of the events matching the condition in sequence
+        order."""
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(OutboxEvent.seq, OutboxEvent.execution_id, OutboxEvent.status)
+                .where(condition)
+                .order_by(OutboxEvent.seq)
+                .limit(self._batch_size)
+            )
+            return [
+                ExecutionEvent(
+                    seq=row.seq,
+                    execution_id=row.execution_id,
+                    status=ExecutionStatus(row.status),
+                )
+                for row in result
+            ]
+
+    @timed(DB_QUERY_SECONDS)
+    async def _max_seq(self) -> int:
+        """Get the sequence number of the newest event in the outbox."""
+        async with self._session_factory() as session:
+            result = await session.execute(select(func.max(OutboxEvent.seq)))
+            return result.scalar_one() or 0
+
+    async def _prune(self) -> None:
+        """Remove events older than the retention period from the outbox."""
+        cutoff = datetime.utcnow() - self._retention
+        try:
+            async with self._session_factory() as session:
+                async with session.begin():
+                    await session.execute(
+                        delete(OutboxEvent).where(OutboxEvent.created_at < cutoff)
+                    )
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Pruning the execution outbox failed.")
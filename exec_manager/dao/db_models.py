@@ -15,10 +15,28 @@
 
 """Defines all database specific ORM models"""
 
-from sqlalchemy import JSON, Boolean, Column, Integer, String
+from datetime import datetime
+
+from sqlalchemy import (
+    DDL,
+    JSON,
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    event,
+    text,
+)
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
 from sqlalchemy.orm.decl_api import DeclarativeMeta
 
+from exec_manager.dao.types import Payload
+
 Base: DeclarativeMeta = declarative_base()
 
 
@@ -38,3 +56,122 @@ class ExampleObjectB(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     active = Column(Boolean, nullable=False)
+
+
+class Execution(Base):
+    """A workflow execution that is run as a child process. The potentially
+    large command and workflow are only loaded when accessed or when the
+    "payload" group is undeferred."""
+
+    __tablename__ = "executions"
+    __table_args__ = (
+        Index("ix_executions_created_at", "created_at", "id"),
+        Index("ix_executions_status_created_at", "status", "created_at", "id"),
+        Index("ix_executions_owner_created_at", "owner", "created_at", "id"),
+        Index(
+            "ix_executions_active_lease_owner",
+            "lease_owner",
+            postgresql_where=text("status IN ('queued', 'running')"),
+            sqlite_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+    id = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    priority = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    command = deferred(Column(Payload, nullable=False), group="payload")
+    workflow = deferred(Column(Payload, nullable=True), group="payload")
+    pid = Column(Integer, nullable=True)
+    exit_code = Column(Integer, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(
+        DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+
+# claimable executions are read by priority and age, see JobClaimer:
+Index(
+    "ix_executions_claimable",
+    Execution.priority.desc(),
+    Execution.created_at,
+    postgresql_where=text("status IN ('queued', 'running')"),
+    sqlite_where=text("status IN ('queued', 'running')"),
+)
+
+# finished executions are archived oldest first, see Archiver:
+Index(
+    "ix_executions_archivable",
+    Execution.updated_at,
+    postgresql_where=text("status IN ('succeeded', 'failed', 'cancelled')"),
+    sqlite_where=text("status IN ('succeeded', 'failed', 'cancelled')"),
+)
+
+# GIN indexes only exist on PostgreSQL, so they are not part of the table args:
+event.listen(
+    Execution.__table__,
+    "after_create",
+    DDL(
+        "CREATE INDEX ix_executions_workflow ON executions"
+        + " USING gin (workflow jsonb_path_ops)"
+    ).execute_if(dialect="postgresql"),
+)
+
+
+class ArchivedExecution(Base):
+    """A finished execution moved out of the executions table by the archiver,
+    which keeps that table and its indexes small"""
+
+    __tablename__ = "executions_archive"
+    __table_args__ = (
+        Index("ix_executions_archive_owner_created_at", "owner", "created_at"),
+    )
+    id = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    command = deferred(Column(Payload, nullable=False), group="payload")
+    workflow = deferred(Column(Payload, nullable=True), group="payload")
+    pid = Column(Integer, nullable=True)
+    exit_code = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class CallCacheEntry(Base):
+    """Index entry of the outputs of a step stored in the call cache"""
+
+    __tablename__ = "call_cache_entries"
+    key = Column(String, primary_key=True)
+    outputs = Column(Payload, nullable=False)
+    files = Column(Payload, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class StepCompletion(Base):
+    """Record of a successfully completed step of a workflow execution"""
+
+    __tablename__ = "step_completions"
+    execution_id = Column(String, ForeignKey("executions.id"), primary_key=True)
+    node_id = Column(String, primary_key=True)
+    outputs = Column(Payload, nullable=False)
+    completed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class OutboxEvent(Base):
+    """A status change of an execution, written in the same transaction as the
+    change itself and relayed to subscribers by the change feed"""
+
+    __tablename__ = "execution_outbox"
+    seq = Column(
+        BigInteger().with_variant(Integer, "sqlite"),
+        primary_key=True,
+        autoincrement=True,
+    )
+    execution_id = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
@@ -0,0 +1,101 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Construction of the async engine and session factory shared by the service"""
+
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Type
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from exec_manager.config import Config
+from exec_manager.metrics import REGISTRY
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "exec_manager_db_query_seconds",
+    "Duration of DAO methods including waiting for a connection",
+    ("method",),
+)
+
+
+@dataclass
+class PoolMetrics:
+    """Statistics on checking out connections from the pool"""
+
+    checkouts: int = 0
+    timeouts: int = 0
+    checkout_seconds_total: float = 0.0
+    checkout_seconds_max: float = 0.0
+
+    def record_checkout(self, seconds: float) -> None:
+        """Record a successful checkout that took the given time."""
+        self.checkouts += 1
+        self.checkout_seconds_total += seconds
+        self.checkout_seconds_max = max(self.checkout_seconds_max, seconds)
+
+    def record_timeout(self) -> None:
+        """Record a checkout that gave up waiting for a free connection."""
+        self.timeouts += 1
+
+
+def instrumented_pool_class(metrics: PoolMetrics) -> Type[AsyncAdaptedQueuePool]:
+    """Create a queue pool class that reports the latency of every checkout,
+    including the time spent waiting for a free connection and the pre-ping, to
+    the given metrics."""
+
+    class InstrumentedPool(AsyncAdaptedQueuePool):
+        """Queue pool measuring checkout latency"""
+
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                connection = super().connect()
+            except exc.TimeoutError:
+                metrics.record_timeout()
+                raise
+            metrics.record_checkout(time.perf_counter() - start)
+            return connection
+
+    return InstrumentedPool
+
+
+def create_engine(config: Config, metrics: Optional[PoolMetrics] = None) -> AsyncEngine:
+    """Create the async engine used by the whole service.
+
+    Connections are kept in a pool sized according to the config. In-memory SQLite
+    databases only exist on a single connection, so they keep the default pool
+    of the dialect.
+    """
+    url = make_url(config.db_url)
+    options: Dict[str, Any] = {"pool_pre_ping": config.db_pool_pre_ping}
+    if url.database not in (None, "", ":memory:"):
+        options.update(
+            poolclass=instrumented_pool_class(metrics or PoolMetrics()),
+            pool_size=config.db_pool_size,
+            max_overflow=config.db_max_overflow,
+            pool_timeout=config.db_pool_timeout,
+            pool_recycle=config.db_pool_recycle,
+        )
+    return create_async_engine(url, **options)
+
+
+def create_session_factory(engine: AsyncEngine) -> sessionmaker:
+    """Create a factory for async sessions bound to the given engine."""
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -0,0 +1,456 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Data access for workflow executions"""
+
+import base64
+import binascii
+from dataclasses import dataclass
+from datetime import datetime
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from uuid import uuid4
+
+from sqlalchemy import bindparam, func, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer_group
+from sqlalchemy.sql import Select
+
+from exec_manager.dao.change_feed import ChangeFeed
+from exec_manager.dao.db_models import ArchivedExecution, Execution
+from exec_manager.dao.engine import DB_QUERY_SECONDS
+from exec_manager.metrics import REGISTRY, timed
+from exec_manager.models import ExecutionStatus
+
+STATUS_CHANGES = REGISTRY.counter(
+    "exec_manager_status_changes",
+    "Status changes of executions written to the database",
+    ("status",),
+)
+
+
+class ExecutionNotFoundError(RuntimeError):
+    """Thrown when an execution with the given id does not exist in the DB."""
+
+    def __init__(self, execution_id: str):
+        message = f"The execution with id '{execution_id}' does not exist."
+        super().__init__(message)
+
+
+class ExecutionNotResumableError(RuntimeError):
+    """Thrown when resuming an execution that has not failed or been
+    cancelled."""
+
+    def __init__(self, execution_id: str):
+        message = (
+            f"The execution with id '{execution_id}' cannot be resumed as it has"
+            + " neither failed nor been cancelled."
+        )
+        super().__init__(message)
+
+
+class InvalidCursorError(ValueError):
+    """Thrown when a pagination cursor cannot be decoded."""
+
+    def __init__(self, cursor: str):
+        message = f"The pagination cursor '{cursor}' is invalid."
+        super().__init__(message)
+
+
+@dataclass(frozen=True)
+class ActiveExecution:
+    """The state of a queued or running execution needed to recover it"""
+
+    execution_id: str
+    owner: str
+    priority: int
+    status: ExecutionStatus
+    command: List[str]
+    workflow: Optional[Dict[str, Any]]
+    pid: Optional[int]
+
+
+class ExecutionSummary:
+    """A lightweight, read-only view of an execution row without its payload,
+    as returned by listings and exports"""
+
+    __slots__ = (
+        "id",
+        "owner",
+        "status",
+        "pid",
+        "exit_code",
+        "created_at",
+        "updated_at",
+    )
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        id: str,  # pylint: disable=redefined-builtin
+        owner: str,
+        status: str,
+        pid: Optional[int],
+        exit_code: Optional[int],
+        created_at: datetime,
+        updated_at: datetime,
+    ):
+        self.id = id  # pylint: disable=invalid-name
+        self.owner = owner
+        self.status = ExecutionStatus(status)
+        self.pid = pid
+        self.exit_code = exit_code
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to a dict suitable for JSON encoding without validation."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# The columns selected for an ExecutionSummary, in the order of its arguments:
+SUMMARY_COLUMNS = (
+    Execution.id,
+    Execution.owner,
+    Execution.status,
+    Execution.pid,
+    Execution.exit_code,
+    Execution.created_at,
+    Execution.updated_at,
+)
+
+
+@dataclass
+class ExecutionPage:
+    """A page of executions together with the cursor pointing to the next page.
+    `next_cursor` is None if this is the last page."""
+
+    items: List[ExecutionSummary]
+    next_cursor: Optional[str]
+
+
+def encode_cursor(created_at: datetime, execution_id: str) -> str:
+    """Encode the sort key of the last item of a page into an opaque cursor."""
+    raw = f"{created_at.isoformat()}|{execution_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode a cursor created by `encode_cursor` back into its sort key."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, execution_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), execution_id
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise InvalidCursorError(cursor) from error
+
+
+def _summary_query(
+    *, status: Optional[ExecutionStatus], owner: Optional[str]
+) -> Select:
+    """Build the query selecting summaries ordered newest first."""
+    query = select(*SUMMARY_COLUMNS)
+    if status is not None:
+        query = query.where(Execution.status == status.value)
+    if owner is not None:
+        query = query.where(Execution.owner == owner)
+    return query.order_by(Execution.created_at.desc(), Execution.id.desc())
+
+
+class ExecutionDao:
+    """Reads and writes executions using sessions from the given factory."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        feed: Optional[ChangeFeed] = None,
+    ):
+        """Initialize with a factory returning new async sessions and optionally
+        the change feed on which status changes are published."""
+        self._session_factory = session_factory
+        self._feed = feed
+
+    @timed(DB_QUERY_SECONDS)
+    async def create(  # pylint: disable=too-many-arguments
+        self,
+        command: Sequence[str],
+        owner: str,
+        *,
+        workflow: Optional[Dict[str, Any]] = None,
+        priority: int = 0,
+        lease_owner: Optional[str] = None,
+        lease_expires_at: Optional[datetime] = None,
+    ) -> str:
+        """Store a new queued execution and return its id. Executions running a
+        workflow instead of a single command pass the parsed workflow. Higher
+        priorities are run first. If a lease is given, the execution is claimed by
+        that replica right away."""
+        execution_id = uuid4().hex
+        async with self._session_factory() as session:
+            async with session.begin():
+                session.add(
+                    Execution(
+                        id=execution_id,
+                        owner=owner,
+                        status=ExecutionStatus.QUEUED.value,
+                        priority=priority,
+                        command=list(command),
+                        workflow=workflow,
+                        lease_owner=lease_owner,
+                        lease_expires_at=lease_expires_at,
+                    )
+                )
+                await self._record(session, execution_id, ExecutionStatus.QUEUED)
+        self._committed(execution_id, ExecutionStatus.QUEUED)
+        return execution_id
+
+    @timed(DB_QUERY_SECONDS)
+    async def get(self, execution_id: str) -> Union[Execution, ArchivedExecution]:
+        """Get the execution with the given id, including its payload. Falls back
+        to the archive for executions that are no longer in the hot table."""
+        options = [undefer_group("payload")]
+        async with self._session_factory() as session:
+            execution = await session.get(Execution, execution_id, options=options)
+            if execution is None:
+                execution = await session.get(
+                    ArchivedExecution, execution_id, options=options
+                )
+        if execution is None:
+            raise ExecutionNotFoundError(execution_id)
+        return execution
+
+    @timed(DB_QUERY_SECONDS)
+    async def get_status(self, execution_id: str) -> ExecutionStatus:
+        """Get only the status of the execution with the given id."""
+        async with self._session_factory() as session:
+            for model in (Execution, ArchivedExecution):
+                result = await session.execute(
+                    select(model.status).where(model.id == execution_id)
+                )
+                status = result.scalar_one_or_none()
+                if status is not None:
+                    return ExecutionStatus(status)
+        raise ExecutionNotFoundError(execution_id)
+
+    @timed(DB_QUERY_SECONDS)
+    async def queued_counts(self) -> Dict[str, int]:
+        """Count the queued executions of every owner that has any."""
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(Execution.owner, func.count())
+                .where(Execution.status == ExecutionStatus.QUEUED.value)
+                .group_by(Execution.owner)
+            )
+            return dict(result.all())
+
+    @timed(DB_QUERY_SECONDS)
+    async def active_counts(self) -> Dict[str, int]:
+        """Count the queued and running executions by status.
+
+        Only the active executions are read, from the index on their status, so
+        the cost does not grow with the number of finished executions.
+        """
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(Execution.status, func.count())
+                .where(
+                    Execution.status.in_(
+                        bindparam(
+                            "active_statuses",
+                            [
+                                ExecutionStatus.QUEUED.value,
+                                ExecutionStatus.RUNNING.value,
+                            ],
+                            expanding=True,
+                            literal_execute=True,
+                        )
+                    )
+                )
+                .group_by(Execution.status)
+            )
+            return dict(result.all())
+
+    @timed(DB_QUERY_SECONDS)
+    async def list(
+        self,
+        *,
+        status: Optional[ExecutionStatus] = None,
+        owner: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> ExecutionPage:
+        """List executions, newest first, optionally filtered by status and owner.
+
+        Pages are addressed by a cursor encoding the sort key of the last item of
+        the previous page instead of an offset, so fetching a page costs the same
+        no matter how deep into the history it is. Only the summary columns are
+        selected, so neither ORM objects nor payloads are loaded.
+        """
+        query = _summary_query(status=status, owner=owner)
+        if cursor is not None:
+            query = query.where(
+                tuple_(Execution.created_at, Execution.id) < decode_cursor(cursor)
+            )
+
+        async with self._session_factory() as session:
+            result = await session.execute(query.limit(limit + 1))
+            items = [ExecutionSummary(*row) for row in result]
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+        return ExecutionPage(items=items, next_cursor=next_cursor)
+
+    async def export(
+        self,
+        *,
+        status: Optional[ExecutionStatus] = None,
+        owner: Optional[str] = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[List[ExecutionSummary]]:
+        """Stream all executions, newest first, in batches of summaries.
+
+        Rows are fetched with a server side cursor, so only one batch is held in
+        memory at a time regardless of the number of executions exported.
+        """
+        query = _summary_query(status=status, owner=owner).execution_options(
+            yield_per=batch_size
+        )
+        async with self._session_factory() as session:
+            result = await session.stream(query)
+            async for rows in result.partitions(batch_size):
+                yield [ExecutionSummary(*row) for row in rows]
+
+    @timed(DB_QUERY_SECONDS)
+    async def list_active(self, lease_owner: str) -> List[ActiveExecution]:
+        """List the queued and running executions leased to the given replica.
+
+        The filter matches the partial index on the lease owner of active
+        executions, so the cost depends on the number of active executions only,
+        not on the size of the history. The statuses are rendered as literals,
+        as the database can only prove the index predicate for those.
+        """
+        query = select(
+            Execution.id,
+            Execution.owner,
+            Execution.priority,
+            Execution.status,
+            Execution.command,
+            Execution.workflow,
+            Execution.pid,
+        ).where(
+            Execution.status.in_(
+                bindparam(
+                    "active_statuses",
+                    [ExecutionStatus.QUEUED.value, ExecutionStatus.RUNNING.value],
+                    expanding=True,
+                    literal_execute=True,
+                )
+            ),
+            Execution.lease_owner == lease_owner,
+        )
+        async with self._session_factory() as session:
+            result = await session.execute(query)
+            return [
+                ActiveExecution(
+                    execution_id=row.id,
+                    owner=row.owner,
+                    priority=row.priority,
+                    status=ExecutionStatus(row.status),
+                    command=row.command,
+                    workflow=row.workflow,
+                    pid=row.pid,
+                )
+                for row in result
+            ]
+
+    @timed(DB_QUERY_SECONDS)
+    async def resume(self, execution_id: str) -> None:
+        """Put a failed or cancelled execution back into the queue. Steps of a
+        workflow that completed in the previous run are not run again."""
+        resumable = (ExecutionStatus.FAILED.value, ExecutionStatus.CANCELLED.value)
+        async with self._session_factory() as session:
+            async with session.begin():
+                result = await session.execute(
+                    update(Execution)
+                    .where(
+                        Execution.id == execution_id,
+                        Execution.status.in_(resumable),
+                    )
+                    .values(
+                        status=ExecutionStatus.QUEUED.value,
+                        pid=None,
+                        exit_code=None,
+                        lease_owner=None,
+                        lease_expires_at=None,
+                    )
+                )
+                if result.rowcount:
+                    await self._record(session, execution_id, ExecutionStatus.QUEUED)
+        if result.rowcount == 0:
+            await self.get(execution_id)
+            raise ExecutionNotResumableError(execution_id)
+        self._committed(execution_id, ExecutionStatus.QUEUED)
+
+    @timed(DB_QUERY_SECONDS)
+    async def set_status(
+        self,
+        execution_id: str,
+        status: ExecutionStatus,
+        *,
+        pid: Optional[int] = None,
+        exit_code: Optional[int] = None,
+    ) -> None:
+        """Update the status of an execution together with the process details
+        that are known at that point."""
+        values: Dict[str, Any] = {"status": status.value}
+        if pid is not None:
+            values["pid"] = pid
+        if exit_code is not None:
+            values["exit_code"] = exit_code
+        async with self._session_factory() as session:
+            async with session.begin():
+                result = await session.execute(
+                    update(Execution)
+                    .where(Execution.id == execution_id)
+                    .values(**values)
+                )
+                if result.rowcount:
+                    await self._record(session, execution_id, status)
+        if result.rowcount == 0:
+            raise ExecutionNotFoundError(execution_id)
+        self._committed(execution_id, status)
+
+    async def _record(
+        self, session: AsyncSession, execution_id: str, status: ExecutionStatus
+    ) -> None:
+        """Publish a status change as part of the transaction of the session."""
+        if self._feed is not None:
+            await self._feed.record(session, [(execution_id, status.value)])
+
+    def _committed(self, execution_id: str, status: ExecutionStatus) -> None:
+        """Count a committed status change and let the change feed know."""
+        STATUS_CHANGES.labels(status.value).inc()
+        if self._feed is not None:
+            self._feed.committed([execution_id])
@@ -0,0 +1,248 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Lease-based claiming of executions shared by several replicas"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+from sqlalchemy import (
+    Float,
+    and_,
+    bindparam,
+    case,
+    cast,
+    func,
+    literal,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from exec_manager.dao.db_models import Execution
+from exec_manager.dao.engine import DB_QUERY_SECONDS
+from exec_manager.fair_share import DEFAULT_WEIGHT
+from exec_manager.metrics import timed
+from exec_manager.models import ExecutionStatus
+
+# statuses of executions that still need a replica to drive them:
+ACTIVE_STATUSES = (ExecutionStatus.QUEUED.value, ExecutionStatus.RUNNING.value)
+
+# the columns read for claimed executions:
+CLAIMED_COLUMNS = (
+    Execution.id,
+    Execution.owner,
+    Execution.priority,
+    Execution.command,
+    Execution.workflow,
+)
+
+# maximum number of ids bound into a single statement:
+MAX_IDS_PER_STATEMENT = 500
+
+# claimable executions locked per execution to claim, among which the owners
+# get their fair shares:
+CANDIDATES_PER_CLAIM = 4
+
+
+@dataclass(frozen=True)
+class ClaimedExecution:
+    """An execution leased to this replica"""
+
+    execution_id: str
+    owner: str
+    priority: int
+    command: List[str]
+    workflow: Optional[Dict[str, Any]]
+
+
+class JobClaimer:
+    """Claims executions for one replica by giving it a lease on them.
+
+    An execution can be claimed if it is queued or running and nobody holds an
+    unexpired lease on it. So executions whose replica crashed are reclaimed once
+    their lease runs out. Leases are kept alive by renewing them periodically.
+
+    Claiming is a single `UPDATE ... WHERE id IN (SELECT ...)`. Its innermost
+    query reads a window of `CANDIDATES_PER_CLAIM` times as many claimable
+    executions as are to be claimed, by priority and then oldest first, from the
+    partial index of active executions. On PostgreSQL it takes them with
+    `FOR UPDATE SKIP LOCKED`, so concurrent replicas lock disjoint windows
+    instead of waiting for or skipping each other's, and the claimed rows are
+    returned directly. SQLite has no row locks but serializes all writers, which
+    makes the same statement safe there; the claimed rows are read back by their
+    lease afterwards.
+
+    Only the window is ranked for fair share: within a priority, the candidates
+    of every owner are numbered from the oldest on, and they are claimed in the
+    order of their number divided by the weight of their owner. The cost of a
+    claim thus depends on the number of executions claimed, not on the size of
+    the backlog. Over the whole backlog, the shares of the owners are enforced
+    by the fair share queue of every replica.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        *,
+        replica_id: str,
+        lease_duration: float,
+        weights: Optional[Mapping[str, float]] = None,
+    ):
+        """Initialize the claimer of the given replica with the weights of the
+        owners that have a share other than the default."""
+        self._session_factory = session_factory
+        self._weights = dict(weights or {})
+        self.replica_id = replica_id
+        self.lease_duration = timedelta(seconds=lease_duration)
+
+    def lease_deadline(self) -> datetime:
+        """Expiry time of a lease taken or renewed now."""
+        return datetime.utcnow() + self.lease_duration
+
+    @timed(DB_QUERY_SECONDS)
+    async def claim(self, limit: int) -> List[ClaimedExecution]:
+        """Claim up to `limit` executions by priority and fair share."""
+        if limit <= 0:
+            return []
+        now = datetime.utcnow()
+        deadline = now + self.lease_duration
+        candidates = (
+            select(
+                Execution.id, Execution.owner, Execution.priority, Execution.created_at
+            )
+            .where(
+                # rendered as literals to match the predicate of the index:
+                Execution.status.in_(
+                    bindparam(
+                        "active_statuses",
+                        list(ACTIVE_STATUSES),
+                        expanding=True,
+                        literal_execute=True,
+                    )
+                ),
+                or_(
+                    Execution.lease_expires_at.is_(None),
+                    Execution.lease_expires_at < now,
+                ),
+            )
+            .order_by(Execution.priority.desc(), Execution.created_at)
+            .limit(limit * CANDIDATES_PER_CLAIM)
+            .with_for_update(skip_locked=True)
+            .subquery()
+        )
+        ranked = select(
+            candidates.c.id,
+            candidates.c.priority,
+            candidates.c.created_at,
+            func.row_number()
+            .over(
+                partition_by=(candidates.c.owner, candidates.c.priority),
+                order_by=candidates.c.created_at,
+            )
+            .label("rank"),
+            self._weight_of(candidates.c.owner).label("weight"),
+        ).subquery()
+        fair = (
+            select(ranked.c.id)
+            .order_by(
+                ranked.c.priority.desc(),
+                cast(ranked.c.rank, Float) / ranked.c.weight,
+                ranked.c.created_at,
+            )
+            .limit(limit)
+        )
+        statement = (
+            update(Execution.__table__)
+            .where(Execution.id.in_(fair.scalar_subquery()))
+            .values(lease_owner=self.replica_id, lease_expires_at=deadline)
+        )
+
+        async with self._session_factory() as session:
+            async with session.begin():
+                if session.bind.dialect.full_returning:
+                    result = await session.execute(
+                        statement.returning(*CLAIMED_COLUMNS)
+                    )
+                else:
+                    await session.execute(statement)
+                    result = await session.execute(
+                        select(*CLAIMED_COLUMNS).where(
+                            Execution.lease_owner == self.replica_id,
+                            Execution.lease_expires_at == deadline,
+                        )
+                    )
+                rows = result.all()
+        return [
+            ClaimedExecution(
+                execution_id=row.id,
+                owner=row.owner,
+                priority=row.priority,
+                command=row.command,
+                workflow=row.workflow,
+            )
+            for row in rows
+        ]
+
+    def _weight_of(self, owner: Any) -> Any:
+        """Build an expression for the weight of the given owner."""
+        if not self._weights:
+            return literal(DEFAULT_WEIGHT, Float)
+        return case(self._weights, value=owner, else_=DEFAULT_WEIGHT)
+
+    @timed(DB_QUERY_SECONDS)
+    async def renew(self, execution_ids: Sequence[str]) -> int:
+        """Extend the leases this replica holds on the given executions. Returns
+        the number of leases renewed, which is lower than the number of ids if
+        some leases were lost to other replicas."""
+        deadline = self.lease_deadline()
+        renewed = 0
+        async with self._session_factory() as session:
+            async with session.begin():
+                for start in range(0, len(execution_ids), MAX_IDS_PER_STATEMENT):
+                    chunk = execution_ids[start : start + MAX_IDS_PER_STATEMENT]
+                    result = await session.execute(
+                        update(Execution.__table__)
+                        .where(
+                            and_(
+                                Execution.id.in_(chunk),
+                                Execution.lease_owner == self.replica_id,
+                            )
+                        )
+                        .values(lease_expires_at=deadline)
+                    )
+                    renewed += result.rowcount
+        return renewed
+
+    @timed(DB_QUERY_SECONDS)
+    async def release(self, execution_ids: Sequence[str]) -> None:
+        """Give up the leases this replica holds on the given executions, so that
+        other replicas can claim them right away."""
+        async with self._session_factory() as session:
+            async with session.begin():
+                for start in range(0, len(execution_ids), MAX_IDS_PER_STATEMENT):
+                    chunk = execution_ids[start : start + MAX_IDS_PER_STATEMENT]
+                    await session.execute(
+                        update(Execution.__table__)
+                        .where(
+                            and_(
+                                Execution.id.in_(chunk),
+                                Execution.lease_owner == self.replica_id,
+                            )
+                        )
+                        .values(lease_owner=None, lease_expires_at=None)
+                    )
@@ -0,0 +1,126 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers for migrations that must not lock large tables for long
+
+They are meant to be called from the upgrade and downgrade functions of the
+Alembic revisions in db_migration. Migrations using them commit part of their
+work early, so the environment runs every revision in its own transaction.
+"""
+
+# The operations of alembic.op are only defined while a migration runs:
+# pylint: disable=no-member
+
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import sqlalchemy as sa
+from alembic import op
+
+logger = logging.getLogger(__name__)
+
+
+def _is_postgresql() -> bool:
+    """Check whether the migration runs against PostgreSQL."""
+    return op.get_bind().dialect.name == "postgresql"
+
+
+@contextmanager
+def lock_timeout(seconds: float) -> Iterator[None]:
+    """Make statements fail instead of queueing behind other transactions when
+    they have to wait longer than the given seconds for a lock.
+
+    Waiting DDL blocks every later query on the same table, so failing fast and
+    retrying the migration is preferable to stalling the service. This is a
+    no-op on databases other than PostgreSQL.
+    """
+    if not _is_postgresql():
+        yield
+        return
+    op.execute(f"SET lock_timeout = '{int(seconds * 1000)}ms'")
+    try:
+        yield
+    finally:
+        op.execute("RESET lock_timeout")
+
+
+def create_index_concurrently(
+    index_name: str, table_name: str, columns: List[str], **kwargs: Any
+) -> None:
+    """Create an index without blocking writes to the table.
+
+    On PostgreSQL the index is built concurrently, which is only possible
+    outside of a transaction, so the current transaction is committed first. An
+    invalid index left behind by a failed earlier attempt is dropped. Other
+    databases build the index as usual.
+    """
+    if not _is_postgresql():
+        op.create_index(index_name, table_name, columns, **kwargs)
+        return
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+        op.create_index(
+            index_name, table_name, columns, postgresql_concurrently=True, **kwargs
+        )
+
+
+def drop_index_concurrently(index_name: str, table_name: str) -> None:
+    """Drop an index without blocking access to the table, see
+    create_index_concurrently."""
+    if not _is_postgresql():
+        op.drop_index(index_name, table_name=table_name)
+        return
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+
+
+def backfill(  # pylint: disable=too-many-arguments
+    table: sa.Table,
+    values: Dict[str, Any],
+    *,
+    where: Optional[Any] = None,
+    chunk_size: int = 1000,
+    pause: float = 0.0,
+) -> int:
+    """Update the rows of a table matching the where clause in chunks and return
+    the number of updated rows.
+
+    Rows are visited in primary key order and every chunk is committed on its
+    own, so each one only locks chunk_size rows for a short time. Sleeping for
+    pause seconds between chunks leaves room for the regular load. The table
+    must have a single column primary key.
+    """
+    (key,) = table.primary_key.columns
+    updated = 0
+    last_key = None
+    with op.get_context().autocommit_block():
+        while True:
+            query = sa.select(key).order_by(key).limit(chunk_size)
+            if where is not None:
+                query = query.where(where)
+            if last_key is not None:
+                query = query.where(key > last_key)
+            keys = [row[0] for row in op.get_bind().execute(query)]
+            if not keys:
+                break
+            op.get_bind().execute(table.update().where(key.in_(keys)).values(**values))
+            updated += len(keys)
+            last_key = keys[-1]
+            logger.info("Backfilled %d rows of %s", updated, table.name)
+            if pause:
+                time.sleep(pause)
+    return updated
@@ -0,0 +1,206 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Write-behind batching of execution state updates"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+
+from sqlalchemy import bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from exec_manager.dao.change_feed import ChangeFeed
+from exec_manager.dao.db_models import Execution
+from exec_manager.dao.engine import DB_QUERY_SECONDS
+from exec_manager.dao.executions import STATUS_CHANGES
+from exec_manager.metrics import timed
+from exec_manager.models import ExecutionStatus
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WriterMetrics:
+    """Statistics on the batches flushed by the state writer"""
+
+    flushes: int = 0
+    failed_flushes: int = 0
+    updates_written: int = 0
+    batch_size_max: int = 0
+    flush_seconds_total: float = 0.0
+    flush_seconds_max: float = 0.0
+
+    def record_flush(self, batch_size: int, seconds: float) -> None:
+        """Record a successful flush of the given number of executions."""
+        self.flushes += 1
+        self.updates_written += batch_size
+        self.batch_size_max = max(self.batch_size_max, batch_size)
+        self.flush_seconds_total += seconds
+        self.flush_seconds_max = max(self.flush_seconds_max, seconds)
+
+
+class StateWriter:  # pylint: disable=too-many-instance-attributes
+    """Coalesces state updates of executions and writes them in batches.
+
+    Updates are collected per execution id, where a later value of a column
+    replaces an earlier one. Every `flush_interval` seconds, or as soon as
+    `max_batch` executions have pending updates, all of them are written in a
+    single transaction using one executemany UPDATE per set of changed columns.
+    Flushes never overlap, so the last value written for an execution is always
+    the last one submitted for it. As statuses are coalesced too, only the last
+    status change per execution and batch is published on the change feed.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        *,
+        flush_interval: float,
+        max_batch: int,
+        metrics: Optional[WriterMetrics] = None,
+        feed: Optional[ChangeFeed] = None,
+    ):
+        """Initialize the writer. Call `start` to begin flushing periodically.
+        Status changes are published on the change feed if one is given."""
+        self._session_factory = session_factory
+        self._feed = feed
+        self._flush_interval = flush_interval
+        self._max_batch = max_batch
+        self.metrics = metrics or WriterMetrics()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._batch_full = asyncio.Event()
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def pending(self) -> int:
+        """Number of executions with updates that are not written yet."""
+        return len(self._pending)
+
+    def update(
+        self,
+        execution_id: str,
+        *,
+        status: Optional[ExecutionStatus] = None,
+        pid: Optional[int] = None,
+        exit_code: Optional[int] = None,
+    ) -> None:
+        """Schedule an update of the given fields of an execution."""
+        values: Dict[str, Any] = {}
+        if status is not None:
+            values["status"] = status.value
+        if pid is not None:
+            values["pid"] = pid
+        if exit_code is not None:
+            values["exit_code"] = exit_code
+        self._submit(execution_id, values)
+
+    def heartbeat(self, execution_id: str) -> None:
+        """Schedule a heartbeat of a running execution."""
+        self._submit(execution_id, {"heartbeat_at": datetime.utcnow()})
+
+    def _submit(self, execution_id: str, values: Dict[str, Any]) -> None:
+        """Merge the values into the pending updates of the execution."""
+        self._pending.setdefault(execution_id, {}).update(values)
+        if len(self._pending) >= self._max_batch:
+            self._batch_full.set()
+
+    def start(self) -> None:
+        """Start flushing in the background."""
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop flushing in the background and write all pending updates."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        """Flush whenever the interval elapses or a batch is full."""
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._batch_full.wait(), timeout=self._flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Flushing execution state updates failed.")
+
+    async def flush(self) -> None:
+        """Write all pending updates. Failed updates are kept for the next flush
+        unless they have been superseded in the meantime."""
+        async with self._flush_lock:
+            self._batch_full.clear()
+            batch, self._pending = self._pending, {}
+            if not batch:
+                return
+
+            start = time.perf_counter()
+            try:
+                await self._write(batch)
+            except Exception:
+                self.metrics.failed_flushes += 1
+                for execution_id, values in batch.items():
+                    newer = self._pending.get(execution_id, {})
+                    self._pending[execution_id] = {**values, **newer}
+                raise
+            self.metrics.record_flush(len(batch), time.perf_counter() - start)
+
+    @timed(DB_QUERY_SECONDS)
+    async def _write(self, batch: Dict[str, Dict[str, Any]]) -> None:
+        """Write a batch in one transaction, issuing one executemany statement
+        per set of updated columns."""
+        groups: Dict[FrozenSet[str], List[Dict[str, Any]]] = defaultdict(list)
+        for execution_id, values in batch.items():
+            params = {f"b_{column}": value for column, value in values.items()}
+            params["b_id"] = execution_id
+            groups[frozenset(values)].append(params)
+
+        changes = [
+            (execution_id, values["status"])
+            for execution_id, values in batch.items()
+            if "status" in values
+        ]
+        table = Execution.__table__
+        async with self._session_factory() as session:
+            async with session.begin():
+                for columns, params_list in groups.items():
+                    statement = (
+                        table.update()
+                        .where(table.c.id == bindparam("b_id"))
+                        .values(
+                            {column: bindparam(f"b_{column}") for column in columns}
+                        )
+                    )
+                    await session.execute(statement, params_list)
+                if self._feed is not None:
+                    await self._feed.record(session, changes)
+        for _, status in changes:
+            STATUS_CHANGES.labels(status).inc()
+        if self._feed is not None:
+            self._feed.committed(execution_id for execution_id, _ in changes)
@@ -0,0 +1,178 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read-through caching of execution statuses"""
+
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+
+from exec_manager.dao.change_feed import ChangeFeed
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.models import ExecutionStatus
+
+
+@dataclass
+class StatusCacheMetrics:
+    """Statistics on the use of the status cache"""
+
+    hits: int = 0
+    misses: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    evictions: int = 0
+    staleness_seconds_total: float = 0.0
+    staleness_seconds_max: float = 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        """Share of reads that were answered from the cache."""
+        reads = self.hits + self.misses
+        return self.hits / reads if reads else 0.0
+
+    @property
+    def staleness_seconds_mean(self) -> float:
+        """Mean age of the statuses answered from the cache."""
+        return self.staleness_seconds_total / self.hits if self.hits else 0.0
+
+    def record_hit(self, age: float) -> None:
+        """Record a read answered with a status cached the given seconds ago."""
+        self.hits += 1
+        self.staleness_seconds_total += age
+        self.staleness_seconds_max = max(self.staleness_seconds_max, age)
+
+
+class StatusCacheBackend(ABC):
+    """Storage of cached statuses together with the time they were cached at.
+
+    Implementations bound their own size. A backend shared by several replicas
+    must use wall clock time, which is why the cache passes `time.time()`.
+    """
+
+    @abstractmethod
+    def get(self, execution_id: str) -> Optional[Tuple[ExecutionStatus, float]]:
+        """Get the status and caching time of an execution, if cached."""
+
+    @abstractmethod
+    def set(self, execution_id: str, status: ExecutionStatus, cached_at: float) -> int:
+        """Cache a status and return the number of entries evicted for it."""
+
+    @abstractmethod
+    def delete(self, execution_id: str) -> None:
+        """Remove the status of an execution, if cached."""
+
+
+class LruBackend(StatusCacheBackend):
+    """An in-process backend evicting the least recently used entries"""
+
+    def __init__(self, max_entries: int):
+        """Initialize with the maximum number of cached statuses."""
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[ExecutionStatus, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, execution_id: str) -> Optional[Tuple[ExecutionStatus, float]]:
+        """Get the status and caching time of an execution, if cached."""
+        entry = self._entries.get(execution_id)
+        if entry is not None:
+            self._entries.move_to_end(execution_id)
+        return entry
+
+    def set(self, execution_id: str, status: ExecutionStatus, cached_at: float) -> int:
+        """Cache a status and return the number of entries evicted for it."""
+        self._entries[execution_id] = (status, cached_at)
+        self._entries.move_to_end(execution_id)
+        evicted = 0
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def delete(self, execution_id: str) -> None:
+        """Remove the status of an execution, if cached."""
+        self._entries.pop(execution_id, None)
+
+
+class StatusCache:
+    """Answers status reads from a cache, falling back to the DAO.
+
+    Entries expire after `ttl` seconds. Within that time, they are kept
+    consistent by invalidating them whenever a status change is committed:
+    immediately for changes made by this process (see `attach`) and as soon as
+    they are relayed for changes made by other replicas (see `watch`). Should
+    an invalidation get lost, the stale status is still bounded by the TTL.
+    """
+
+    def __init__(
+        self,
+        dao: ExecutionDao,
+        *,
+        ttl: float,
+        backend: Optional[StatusCacheBackend] = None,
+        max_entries: int = 10000,
+        metrics: Optional[StatusCacheMetrics] = None,
+    ):
+        """Initialize the cache. Without a backend, the statuses are cached
+        in-process using at most `max_entries` entries."""
+        self._dao = dao
+        self._ttl = ttl
+        self._backend = backend or LruBackend(max_entries)
+        self.metrics = metrics or StatusCacheMetrics()
+        self._generation = 0
+
+    async def get_status(self, execution_id: str) -> ExecutionStatus:
+        """Get the status of an execution, from the cache if possible."""
+        now = time.time()
+        entry = self._backend.get(execution_id)
+        if entry is not None:
+            status, cached_at = entry
+            if now - cached_at < self._ttl:
+                self.metrics.record_hit(now - cached_at)
+                return status
+            self.metrics.expirations += 1
+            self._backend.delete(execution_id)
+
+        self.metrics.misses += 1
+        generation = self._generation
+        status = await self._dao.get_status(execution_id)
+        # An invalidation during the read may have been for this execution:
+        if generation == self._generation:
+            self.metrics.evictions += self._backend.set(execution_id, status, now)
+        return status
+
+    def invalidate(self, execution_ids: Iterable[str]) -> None:
+        """Drop the cached statuses of the given executions."""
+        for execution_id in execution_ids:
+            self._backend.delete(execution_id)
+            self.metrics.invalidations += 1
+        self._generation += 1
+
+    def attach(self, feed: ChangeFeed) -> None:
+        """Invalidate the statuses changed by this process right after their
+        changes are committed."""
+        feed.on_commit(self.invalidate)
+
+    async def watch(self, feed: ChangeFeed) -> None:
+        """Invalidate the statuses changed by any replica until cancelled."""
+        subscription = feed.subscribe()
+        try:
+            async for event in subscription:
+                self.invalidate([event.execution_id])
+        finally:
+            subscription.close()
@@ -0,0 +1,56 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Data access for the completion records of workflow steps"""
+
+from typing import Callable, Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from exec_manager.dao.db_models import StepCompletion
+from exec_manager.dao.engine import DB_QUERY_SECONDS
+from exec_manager.metrics import timed
+
+
+class StepRecordDao:
+    """Reads and writes the records of completed steps, which allow resuming a
+    workflow execution without rerunning what already succeeded."""
+
+    def __init__(self, session_factory: Callable[[], AsyncSession]):
+        """Initialize with a factory returning new async sessions."""
+        self._session_factory = session_factory
+
+    @timed(DB_QUERY_SECONDS)
+    async def record(self, execution_id: str, node_id: str, outputs: List[str]) -> None:
+        """Record that a step completed and produced the given output files."""
+        async with self._session_factory() as session:
+            async with session.begin():
+                await session.merge(
+                    StepCompletion(
+                        execution_id=execution_id, node_id=node_id, outputs=outputs
+                    )
+                )
+
+    @timed(DB_QUERY_SECONDS)
+    async def completed(self, execution_id: str) -> Dict[str, List[str]]:
+        """Get the outputs of all completed steps of an execution by node id."""
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(StepCompletion.node_id, StepCompletion.outputs).where(
+                    StepCompletion.execution_id == execution_id
+                )
+            )
+            return {row.node_id: row.outputs for row in result}
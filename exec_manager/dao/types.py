@@ -0,0 +1,46 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Custom column types"""
+
+import json
+import zlib
+from typing import Any, Optional
+
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+
+class Payload(TypeDecorator):  # pylint: disable=abstract-method
+    """A JSON document stored as JSONB on PostgreSQL, where it can be indexed and
+    queried, and as zlib-compressed compact JSON on all other databases."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(LargeBinary())
+
+    def process_bind_param(self, value: Any, dialect) -> Any:
+        if value is None or dialect.name == "postgresql":
+            return value
+        return zlib.compress(json.dumps(value, separators=(",", ":")).encode())
+
+    def process_result_value(self, value: Optional[Any], dialect) -> Any:
+        if value is None or dialect.name == "postgresql":
+            return value
+        return json.loads(zlib.decompress(value))
@@ -0,0 +1,164 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Priority classes and weighted fair sharing of the queue between tenants"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from exec_manager.metrics import REGISTRY
+
+# Weight of tenants that have no weight configured:
+DEFAULT_WEIGHT = 1.0
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "exec_manager_queue_wait_seconds",
+    "Time executions spent in the queue of a replica before being dispatched",
+)
+
+
+@dataclass
+class TenantMetrics:
+    """Statistics on the queued items of one tenant"""
+
+    depth: int = 0
+    dequeued: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+
+    @property
+    def wait_seconds_mean(self) -> float:
+        """Mean time the dequeued items spent in the queue."""
+        return self.wait_seconds_total / self.dequeued if self.dequeued else 0.0
+
+    def record_dequeue(self, wait_seconds: float) -> None:
+        """Record an item leaving the queue after the given time."""
+        self.depth -= 1
+        self.dequeued += 1
+        self.wait_seconds_total += wait_seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+
+@dataclass
+class _Tenant:
+    """The queued items of one tenant, ordered by priority and arrival"""
+
+    weight: float
+    virtual_time: float
+    items: List[Tuple[int, int, float, Any]] = field(default_factory=list)
+    version: int = 0
+
+
+class FairShareHeap:
+    """Orders items by priority class first and shares each class between
+    tenants in proportion to their weights.
+
+    Every tenant has a heap of its own items and a virtual time, which advances
+    by the inverse of its weight whenever one of its items is taken. A global
+    heap orders the tenants by the priority of their next item and by their
+    virtual time, so both putting and getting an item cost O(log n). A tenant
+    that becomes active again starts at the current virtual time, so it can
+    neither claim a share for the time it was idle nor be punished for it.
+
+    Items must have an `owner` naming the tenant and an integer `priority`,
+    higher values of which are taken first.
+    """
+
+    def __init__(self, weights: Optional[Mapping[str, float]] = None):
+        """Initialize with the weights of tenants that differ from the default."""
+        self._weights = dict(weights or {})
+        self._tenants: Dict[str, _Tenant] = {}
+        self._order: List[Tuple[int, float, int, str, int]] = []
+        self._counter = itertools.count()
+        self._virtual_time = 0.0
+        self._size = 0
+        self.metrics: Dict[str, TenantMetrics] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def put(self, item: Any) -> None:
+        """Add an item to the queue of its tenant."""
+        tenant = self._tenants.get(item.owner)
+        if tenant is None:
+            tenant = _Tenant(
+                weight=self._weights.get(item.owner, DEFAULT_WEIGHT),
+                virtual_time=self._virtual_time,
+            )
+            self._tenants[item.owner] = tenant
+        top = tenant.items[0] if tenant.items else None
+        entry = (-item.priority, next(self._counter), time.monotonic(), item)
+        heapq.heappush(tenant.items, entry)
+        if top is None or entry < top:
+            self._schedule(item.owner, tenant)
+        self._size += 1
+        self.metrics.setdefault(item.owner, TenantMetrics()).depth += 1
+
+    def get(self) -> Any:
+        """Remove and return the next item. The queue must not be empty."""
+        while True:
+            _, _, _, owner, version = heapq.heappop(self._order)
+            tenant = self._tenants[owner]
+            if version == tenant.version:
+                break
+        _, _, enqueued_at, item = heapq.heappop(tenant.items)
+        self._virtual_time = tenant.virtual_time
+        tenant.virtual_time += 1 / tenant.weight
+        if tenant.items:
+            self._schedule(owner, tenant)
+        else:
+            del self._tenants[owner]
+        self._size -= 1
+        wait_seconds = time.monotonic() - enqueued_at
+        self.metrics[owner].record_dequeue(wait_seconds)
+        QUEUE_WAIT_SECONDS.observe(wait_seconds)
+        return item
+
+    def _schedule(self, owner: str, tenant: _Tenant) -> None:
+        """(Re)insert a tenant into the global order by its next item,
+        invalidating any earlier entry of it."""
+        tenant.version += 1
+        priority = tenant.items[0][0]
+        heapq.heappush(
+            self._order,
+            (priority, tenant.virtual_time, next(self._counter), owner, tenant.version),
+        )
+
+
+class FairShareQueue(asyncio.Queue):
+    """An asyncio queue that hands out items in the order of a FairShareHeap"""
+
+    def __init__(self, maxsize: int = 0, weights: Optional[Mapping[str, float]] = None):
+        """Initialize with the maximum size and the weights of tenants."""
+        self._weights = weights
+        super().__init__(maxsize)
+
+    def _init(self, maxsize: int) -> None:
+        self._queue = FairShareHeap(self._weights)
+
+    def _put(self, item: Any) -> None:
+        self._queue.put(item)
+
+    def _get(self) -> Any:
+        return self._queue.get()
+
+    @property
+    def metrics(self) -> Dict[str, TenantMetrics]:
+        """Queue depth and wait times by tenant."""
+        return self._queue.metrics
@@ -0,0 +1,395 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Synthetic workload generator for capacity planning
+
+Submits synthetic workflows to the database shared by running exec_manager
+replicas at a fixed rate and follows their progress via the change feed. The
+report gives the throughput, the queue depth over time and the latency
+percentiles from submission to completion.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from exec_manager.admission import AdmissionController, AdmissionRejectedError
+from exec_manager.config import Config
+from exec_manager.models import ExecutionStatus
+from exec_manager.workflow import Step, Workflow
+
+if TYPE_CHECKING:
+    from exec_manager.dao.change_feed import ChangeFeed, Subscription
+    from exec_manager.dao.executions import ExecutionDao
+
+logger = logging.getLogger(__name__)
+
+DURATION_DISTRIBUTIONS = ("fixed", "uniform", "exponential")
+TERMINAL_STATUSES = {
+    ExecutionStatus.SUCCEEDED,
+    ExecutionStatus.FAILED,
+    ExecutionStatus.CANCELLED,
+}
+
+
+@dataclass
+class LoadProfile:  # pylint: disable=too-many-instance-attributes
+    """Shape of the synthetic load. Every workflow has a prepare step, a number
+    of parallel steps between `min_fan_out` and `max_fan_out` and a gather step.
+    Step durations follow the given distribution with a mean of `step_seconds`
+    and every parallel step fails with the probability `failure_rate`."""
+
+    rate: float = 1.0
+    duration: float = 60.0
+    min_fan_out: int = 1
+    max_fan_out: int = 8
+    step_seconds: float = 1.0
+    distribution: str = "exponential"
+    failure_rate: float = 0.0
+    owner: str = "loadgen"
+    sample_interval: float = 1.0
+    drain_timeout: float = 300.0
+
+
+@dataclass
+class LoadReport:  # pylint: disable=too-many-instance-attributes
+    """Outcome of a load test. Latencies are in seconds from submission to the
+    final status, queue depth samples are pairs of seconds since the start and
+    executions queued over all replicas."""
+
+    submitted: int = 0
+    rejected: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    unfinished: int = 0
+    seconds: float = 0.0
+    workflows_per_second: float = 0.0
+    latency_seconds: Dict[str, float] = field(default_factory=dict)
+    queue_depth: List[Tuple[float, int]] = field(default_factory=list)
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summarize latencies by their median, tail and maximum."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def at(quantile: float) -> float:
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    return {"p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": ordered[-1]}
+
+
+def step_duration(rng: random.Random, profile: LoadProfile) -> float:
+    """Draw the duration of a step."""
+    if profile.distribution == "fixed":
+        return profile.step_seconds
+    if profile.distribution == "uniform":
+        return rng.uniform(0, 2 * profile.step_seconds)
+    return rng.expovariate(1 / profile.step_seconds)
+
+
+def _sleep_step(
+    step_id: str, seconds: float, fail: bool, depends_on: List[str]
+) -> Step:
+    """Create a step sleeping for the given time and then exiting."""
+    script = f"sleep {seconds:.3f}; exit {1 if fail else 0}"
+    return Step(id=step_id, command=["sh", "-c", script], depends_on=depends_on)
+
+
+def synthetic_workflow(rng: random.Random, profile: LoadProfile) -> Workflow:
+    """Create a random fan-out/fan-in workflow following the profile."""
+    fan_out = rng.randint(profile.min_fan_out, profile.max_fan_out)
+    work = [
+        _sleep_step(
+            f"work-{index}",
+            step_duration(rng, profile),
+            rng.random() < profile.failure_rate,
+            ["prepare"],
+        )
+        for index in range(fan_out)
+    ]
+    return Workflow(
+        steps=[
+            _sleep_step("prepare", step_duration(rng, profile), False, []),
+            *work,
+            _sleep_step(
+                "gather",
+                step_duration(rng, profile),
+                False,
+                [step.id for step in work],
+            ),
+        ]
+    )
+
+
+class LoadGenerator:  # pylint: disable=too-many-instance-attributes
+    """Submits synthetic workflows and tracks them until they finish."""
+
+    def __init__(
+        self,
+        dao: "ExecutionDao",
+        feed: "ChangeFeed",
+        profile: LoadProfile,
+        *,
+        admission: Optional[AdmissionController] = None,
+        seed: Optional[int] = None,
+    ):
+        """Initialize the generator. The feed is run by `run` itself."""
+        self._dao = dao
+        self._feed = feed
+        self._profile = profile
+        self._admission = admission
+        self._rng = random.Random(seed)
+        self._report = LoadReport()
+        self._submitted_at: Dict[str, float] = {}
+        self._latencies: List[float] = []
+        self._all_finished = asyncio.Event()
+        self._submitting = True
+        self._start = 0.0
+
+    async def run(self) -> LoadReport:
+        """Submit the load, wait for it to finish and report on it."""
+        self._start = time.perf_counter()
+        subscription = self._feed.subscribe(max_queue=100000)
+        background = [
+            asyncio.create_task(self._feed.run()),
+            asyncio.create_task(self._collect(subscription)),
+            asyncio.create_task(self._sample()),
+        ]
+        try:
+            await self._submit_all()
+            self._submitting = False
+            self._check_finished()
+            try:
+                await asyncio.wait_for(
+                    self._all_finished.wait(), self._profile.drain_timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Not all workflows finished within the drain timeout.")
+        finally:
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            subscription.close()
+        await self._sweep()
+        return self._finish_report()
+
+    async def _submit_all(self) -> None:
+        """Submit workflows at the configured rate for the configured time."""
+        total = int(self._profile.rate * self._profile.duration)
+        for index in range(total):
+            delay = self._start + index / self._profile.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._submit()
+
+    async def _submit(self) -> None:
+        """Submit a single workflow unless admission control sheds it."""
+        owner = self._profile.owner
+        try:
+            if self._admission is not None:
+                await self._admission.admit(owner)
+        except AdmissionRejectedError:
+            self._report.rejected += 1
+            return
+        workflow = synthetic_workflow(self._rng, self._profile)
+        execution_id = await self._dao.create([], owner, workflow=workflow.dict())
+        self._submitted_at[execution_id] = time.perf_counter()
+        self._report.submitted += 1
+
+    async def _collect(self, subscription: "Subscription") -> None:
+        """Record the workflows reaching a final status."""
+        async for event in subscription:
+            if event.status in TERMINAL_STATUSES:
+                self._finished(event.execution_id, event.status)
+
+    def _finished(self, execution_id: str, status: ExecutionStatus) -> None:
+        """Account for a workflow of this generator having finished."""
+        submitted_at = self._submitted_at.pop(execution_id, None)
+        if submitted_at is None:
+            return
+        self._latencies.append(time.perf_counter() - submitted_at)
+        if status == ExecutionStatus.SUCCEEDED:
+            self._report.succeeded += 1
+        else:
+            self._report.failed += 1
+        self._check_finished()
+
+    def _check_finished(self) -> None:
+        """Signal when everything submitted has finished."""
+        if not self._submitting and not self._submitted_at:
+            self._all_finished.set()
+
+    async def _sample(self) -> None:
+        """Record the number of queued executions periodically."""
+        while True:
+            try:
+                depth = sum((await self._dao.queued_counts()).values())
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Sampling the queue depth failed.")
+            else:
+                self._report.queue_depth.append(
+                    (round(time.perf_counter() - self._start, 3), depth)
+                )
+            await asyncio.sleep(self._profile.sample_interval)
+
+    async def _sweep(self) -> None:
+        """Look up the status of workflows whose final event was missed. Their
+        latency is unknown, so they only count towards the outcomes."""
+        for execution_id in list(self._submitted_at):
+            status = await self._dao.get_status(execution_id)
+            if status in TERMINAL_STATUSES:
+                del self._submitted_at[execution_id]
+                if status == ExecutionStatus.SUCCEEDED:
+                    self._report.succeeded += 1
+                else:
+                    self._report.failed += 1
+        self._report.unfinished = len(self._submitted_at)
+
+    def _finish_report(self) -> LoadReport:
+        """Fill in the summary statistics of the report."""
+        report = self._report
+        report.seconds = time.perf_counter() - self._start
+        finished = report.succeeded + report.failed
+        report.workflows_per_second = finished / report.seconds
+        report.latency_seconds = _percentiles(self._latencies)
+        return report
+
+
+async def generate_load(
+    config: Config, profile: LoadProfile, seed: Optional[int] = None
+) -> LoadReport:
+    """Run a load test against the database of the given config."""
+    # pylint: disable=import-outside-toplevel
+    from exec_manager.dao.change_feed import ChangeFeed
+    from exec_manager.dao.engine import create_engine, create_session_factory
+    from exec_manager.dao.executions import ExecutionDao
+
+    engine = create_engine(config)
+    session_factory = create_session_factory(engine)
+    feed = ChangeFeed(
+        engine,
+        session_factory,
+        poll_interval=min(config.change_feed_poll_interval, profile.sample_interval),
+        retention=config.change_feed_retention,
+    )
+    dao = ExecutionDao(session_factory, feed)
+    admission = AdmissionController(
+        dao,
+        max_queued_per_owner=config.max_queued_per_owner,
+        max_queued_total=config.max_queued_total,
+        retry_after=config.admission_retry_after,
+    )
+    try:
+        return await LoadGenerator(
+            dao, feed, profile, admission=admission, seed=seed
+        ).run()
+    finally:
+        await engine.dispose()
+
+
+def parse_args(
+    argv: Optional[List[str]] = None,
+) -> Tuple[LoadProfile, argparse.Namespace]:
+    """Parse the load profile from the command line."""
+    defaults = LoadProfile()
+    parser = argparse.ArgumentParser(
+        description="Submit synthetic workflows to the exec_manager replicas"
+        + " sharing the configured database and report on their processing."
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=defaults.rate,
+        help="workflows submitted per second",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=defaults.duration,
+        help="seconds to keep submitting",
+    )
+    parser.add_argument("--min-fan-out", type=int, default=defaults.min_fan_out)
+    parser.add_argument("--max-fan-out", type=int, default=defaults.max_fan_out)
+    parser.add_argument(
+        "--step-seconds",
+        type=float,
+        default=defaults.step_seconds,
+        help="mean duration of a step",
+    )
+    parser.add_argument(
+        "--distribution",
+        choices=DURATION_DISTRIBUTIONS,
+        default=defaults.distribution,
+        help="distribution of the step durations",
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=defaults.failure_rate,
+        help="probability of a parallel step to fail",
+    )
+    parser.add_argument("--owner", default=defaults.owner)
+    parser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=defaults.sample_interval,
+        help="seconds between samples of the queue depth",
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=defaults.drain_timeout,
+        help="seconds to wait for submitted workflows to finish",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="file to write the JSON report to instead of stdout",
+    )
+    args = parser.parse_args(argv)
+    if args.min_fan_out < 0 or args.max_fan_out < args.min_fan_out:
+        parser.error("The fan-out range is invalid.")
+    if args.rate <= 0 or args.step_seconds <= 0:
+        parser.error("The rate and step duration must be positive.")
+    if not 0 <= args.failure_rate <= 1:
+        parser.error("The failure rate must be between 0 and 1.")
+    profile = LoadProfile(**{name: getattr(args, name) for name in asdict(defaults)})
+    return profile, args
+
+
+def run(argv: Optional[List[str]] = None):
+    """Run the load generator"""
+    profile, args = parse_args(argv)
+    config = Config()
+    logging.basicConfig(level=config.log_level)
+    report = asyncio.run(generate_load(config, profile, args.seed))
+    output = json.dumps(asdict(report), indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,344 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Capture and random access of the output of child processes
+
+The output of a stream is stored as a sequence of independently compressed zstd
+frames in a data file, accompanied by an index file with one fixed-size record
+per frame. A record holds the offset of the frame in the uncompressed output and
+in the data file and the sizes of the frame, so any byte range or the end of the
+output can be served by decompressing only the frames that cover it. Frames and
+records are only ever appended, so readers can follow a log while it is being
+written. A marker file is created once the stream has ended.
+
+Child processes do not write into a pipe read by the service but into a spool
+file next to the log, from which the service compresses their output. So a
+process keeps running when the service is restarted, and a restarted service
+continues compressing the output where the previous one stopped. The spool
+starts with a header holding the size of the log when it was created, which
+maps the size of the log to the position in the spool to continue from. It is
+removed once the stream has ended.
+"""
+
+import asyncio
+import struct
+from bisect import bisect_right
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, BinaryIO, Iterator, List, Tuple, TypeVar
+
+import zstandard
+
+_RECORD = struct.Struct("<QQII")
+_SPOOL_HEADER = struct.Struct("<Q")
+_DATA_SUFFIX = ".zst"
+_INDEX_SUFFIX = ".idx"
+_CLOSED_SUFFIX = ".closed"
+_SPOOL_SUFFIX = ".spool"
+_STREAMS = ("stdout", "stderr")
+
+DEFAULT_CHUNK_SIZE = 1024**2
+
+T = TypeVar("T")
+
+
+def log_prefix(logs_dir: Path, execution_id: str, stream: str) -> Path:
+    """The path, without suffix, of the files of a stream of an execution."""
+    return logs_dir / execution_id / stream
+
+
+def _path(prefix: Path, suffix: str) -> Path:
+    """The path of one of the files of a log."""
+    return prefix.parent / (prefix.name + suffix)
+
+
+@dataclass(frozen=True)
+class _Frame:
+    """Index record of a compressed frame"""
+
+    offset: int
+    data_offset: int
+    data_size: int
+    size: int
+
+
+class LogWriter:
+    """Appends compressed chunks of output to a log."""
+
+    def __init__(self, prefix: Path, level: int = 3):
+        """Open the log at the given prefix, continuing it if it exists."""
+        prefix.parent.mkdir(parents=True, exist_ok=True)
+        self._prefix = prefix
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._data = open(  # pylint: disable=consider-using-with
+            _path(prefix, _DATA_SUFFIX), "ab"
+        )
+        self._index = open(  # pylint: disable=consider-using-with
+            _path(prefix, _INDEX_SUFFIX), "ab"
+        )
+        # drop anything beyond the last complete frame left by a crash:
+        frames = _read_frames(prefix, 0)
+        last = frames[-1] if frames else _Frame(0, 0, 0, 0)
+        self.size = last.offset + last.size
+        self._data_size = last.data_offset + last.data_size
+        self._data.truncate(self._data_size)
+        self._index.truncate(len(frames) * _RECORD.size)
+
+    def append(self, chunk: bytes) -> None:
+        """Compress a chunk into a frame of its own and append it. The data is
+        written before the index record, so readers never see a record of an
+        incomplete frame."""
+        if not chunk:
+            return
+        frame = self._compressor.compress(chunk)
+        self._data.write(frame)
+        self._data.flush()
+        self._index.write(
+            _RECORD.pack(self.size, self._data_size, len(frame), len(chunk))
+        )
+        self._index.flush()
+        self.size += len(chunk)
+        self._data_size += len(frame)
+
+    def close(self, ended: bool = True) -> None:
+        """Close the files and mark the stream as ended, unless `ended` is unset
+        because more output is going to be appended later."""
+        self._data.close()
+        self._index.close()
+        if ended:
+            _path(self._prefix, _CLOSED_SUFFIX).touch()
+
+
+def _read_frames(prefix: Path, start: int) -> List[_Frame]:
+    """Read the complete index records from the given record number on."""
+    try:
+        with open(_path(prefix, _INDEX_SUFFIX), "rb") as index:
+            index.seek(start * _RECORD.size)
+            raw = index.read()
+    except FileNotFoundError:
+        return []
+    complete = len(raw) - len(raw) % _RECORD.size
+    return [_Frame(*record) for record in _RECORD.iter_unpack(raw[:complete])]
+
+
+class LogReader:
+    """Serves byte ranges and the last lines of a log."""
+
+    def __init__(self, prefix: Path):
+        """Open the log at the given prefix."""
+        self._prefix = prefix
+        self._frames: List[_Frame] = []
+        self._starts: List[int] = []
+        self._decompressor = zstandard.ZstdDecompressor()
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Pick up frames appended since the log was opened."""
+        for frame in _read_frames(self._prefix, len(self._frames)):
+            self._frames.append(frame)
+            self._starts.append(frame.offset)
+
+    @property
+    def size(self) -> int:
+        """Size of the uncompressed output known to the reader."""
+        if not self._frames:
+            return 0
+        return self._frames[-1].offset + self._frames[-1].size
+
+    @property
+    def closed(self) -> bool:
+        """Whether the stream has ended."""
+        return _path(self._prefix, _CLOSED_SUFFIX).exists()
+
+    def _decompress(self, frames: List[_Frame]) -> bytes:
+        """Decompress consecutive frames."""
+        if not frames:
+            return b""
+        with open(_path(self._prefix, _DATA_SUFFIX), "rb") as data:
+            data.seek(frames[0].data_offset)
+            return b"".join(
+                self._decompressor.decompress(
+                    data.read(frame.data_size), max_output_size=frame.size
+                )
+                for frame in frames
+            )
+
+    def read(self, offset: int, length: int) -> bytes:
+        """Read up to `length` bytes of the output starting at `offset`."""
+        end = min(offset + length, self.size)
+        if offset >= end:
+            return b""
+        first = bisect_right(self._starts, offset) - 1
+        last = bisect_right(self._starts, end - 1)
+        data = self._decompress(self._frames[first:last])
+        skip = offset - self._frames[first].offset
+        return data[skip : skip + end - offset]
+
+    def tail(self, lines: int) -> bytes:
+        """Read the last lines of the output, decompressing frames from the end
+        until enough lines are found."""
+        if lines <= 0:
+            return b""
+        first = len(self._frames)
+        data = b""
+        while first > 0 and data.count(b"\n") <= lines:
+            first -= 1
+            data = self._decompress(self._frames[first : first + 1]) + data
+        return b"".join(data.splitlines(keepends=True)[-lines:])
+
+
+async def follow(
+    prefix: Path, offset: int = 0, poll_interval: float = 0.5
+) -> AsyncIterator[bytes]:
+    """Yield the output of a log from the given offset on as it is written,
+    until the stream has ended."""
+    reader = LogReader(prefix)
+    while True:
+        closed = reader.closed
+        reader.refresh()
+        while offset < reader.size:
+            chunk = reader.read(offset, DEFAULT_CHUNK_SIZE)
+            offset += len(chunk)
+            yield chunk
+        if closed:
+            return
+        await asyncio.sleep(poll_interval)
+
+
+@contextmanager
+def spool_output(
+    logs_dir: Path, execution_id: str, stream_prefix: str = ""
+) -> Iterator[Tuple[BinaryIO, BinaryIO]]:
+    """Open the spool files for the stdout and stderr of a process of an
+    execution, to be passed to the process when starting it. A spool that is
+    created anew starts a new run of the stream, whose log is no longer marked
+    as ended."""
+    spools = []
+    try:
+        for stream in _STREAMS:
+            prefix = log_prefix(logs_dir, execution_id, stream_prefix + stream)
+            prefix.parent.mkdir(parents=True, exist_ok=True)
+            spool = open(  # pylint: disable=consider-using-with
+                _path(prefix, _SPOOL_SUFFIX), "ab"
+            )
+            spools.append(spool)
+            if spool.tell() == 0:
+                frames = _read_frames(prefix, 0)
+                size = frames[-1].offset + frames[-1].size if frames else 0
+                spool.write(_SPOOL_HEADER.pack(size))
+                spool.flush()
+                try:
+                    _path(prefix, _CLOSED_SUFFIX).unlink()
+                except FileNotFoundError:
+                    pass
+        yield spools[0], spools[1]
+    finally:
+        for spool in spools:
+            spool.close()
+
+
+def _append_new(spool: BinaryIO, writer: LogWriter, chunk_size: int) -> None:
+    """Append everything written to the spool since it was last read."""
+    while True:
+        chunk = spool.read(chunk_size)
+        if not chunk:
+            return
+        writer.append(chunk)
+
+
+async def capture(
+    prefix: Path,
+    finished: asyncio.Event,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    flush_interval: float = 1.0,
+) -> None:
+    """Compress the output written to the spool of the log at the given prefix
+    into the log until `finished` is set, then the rest of it, and end the
+    stream.
+
+    New output is picked up every `flush_interval` seconds, so followers see
+    slow output in time, and written in chunks of at most `chunk_size` bytes.
+    Reading and compression run on a worker thread, so they do not block the
+    event loop. If cancelled, the stream is not ended and a later capture
+    continues where this one stopped. Without a spool, there is nothing to
+    capture.
+    """
+    loop = asyncio.get_running_loop()
+    spool_path = _path(prefix, _SPOOL_SUFFIX)
+    if not spool_path.exists():
+        return
+    writer = LogWriter(prefix)
+    ended = False
+    try:
+        with open(spool_path, "rb") as spool:
+            (start,) = _SPOOL_HEADER.unpack(spool.read(_SPOOL_HEADER.size))
+            spool.seek(_SPOOL_HEADER.size + writer.size - start)
+            while not ended:
+                ended = finished.is_set()
+                await loop.run_in_executor(None, _append_new, spool, writer, chunk_size)
+                if not ended:
+                    try:
+                        await asyncio.wait_for(finished.wait(), flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        spool_path.unlink()
+    finally:
+        writer.close(ended)
+
+
+async def capture_while(
+    work: Awaitable[T], logs_dir: Path, execution_id: str, stream_prefix: str = ""
+) -> T:
+    """Capture the stdout and stderr of a process of an execution, started with
+    the files of `spool_output`, while awaiting the work that waits for it to
+    exit. Returns the result of the work."""
+    finished = asyncio.Event()
+    captures = [
+        asyncio.ensure_future(
+            capture(
+                log_prefix(logs_dir, execution_id, stream_prefix + stream), finished
+            )
+        )
+        for stream in _STREAMS
+    ]
+    try:
+        result = await work
+    except BaseException:
+        for task in captures:
+            task.cancel()
+        await asyncio.gather(*captures, return_exceptions=True)
+        raise
+    finished.set()
+    await asyncio.gather(*captures)
+    return result
+
+
+async def capture_rest(
+    logs_dir: Path, execution_id: str, stream_prefix: str = ""
+) -> None:
+    """Capture the output left in the spool files of a process of an execution
+    that has already exited, e.g. while the service was down."""
+    finished = asyncio.Event()
+    finished.set()
+    await asyncio.gather(
+        *(
+            capture(
+                log_prefix(logs_dir, execution_id, stream_prefix + stream), finished
+            )
+            for stream in _STREAMS
+        )
+    )
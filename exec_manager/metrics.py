@@ -0,0 +1,371 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Low-overhead counters and histograms with Prometheus text exposition
+
+Metrics are recorded into per-thread shards, so recording never takes a lock:
+the scheduler loop and the threads of executors each write to their own shard,
+and the shards are only summed up when the metrics are collected.
+"""
+
+import asyncio
+import time
+from bisect import bisect_left
+from dataclasses import fields
+from functools import wraps
+from threading import get_ident
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+# Bucket bounds in seconds suitable for anything from DB queries to processes:
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+    1800.0,
+    3600.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the text format."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Format label pairs as used in the text format."""
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value as used in the text format."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """Base of metrics with label values mapping to recorders"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, Any] = {}
+
+    def labels(self, *values: str) -> Any:
+        """Get the recorder for the given label values. Callers on a hot path
+        should keep the returned recorder instead of looking it up each time."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}.")
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """Yield the name suffix, formatted labels and value of all samples."""
+        raise NotImplementedError
+
+    def expose(self) -> List[str]:
+        """Render the metric in the text format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class CounterChild:
+    """A counter for one combination of label values"""
+
+    def __init__(self):
+        self._shards: Dict[int, List[float]] = {}
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increase the counter by the given non-negative amount."""
+        shard = self._shards.get(get_ident())
+        if shard is None:
+            shard = self._shards.setdefault(get_ident(), [0.0])
+        shard[0] += amount
+
+    @property
+    def value(self) -> float:
+        """The current value summed over all shards."""
+        return sum(shard[0] for shard in list(self._shards.values()))
+
+
+class Counter(_Metric):
+    """A monotonically increasing count"""
+
+    kind = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increase the counter of a metric without labels."""
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        for values, child in list(self._children.items()):
+            yield "_total", _format_labels(self.labelnames, values), child.value
+
+
+class HistogramChild:
+    """A histogram for one combination of label values"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._buckets = buckets
+        # Every shard holds the count per bucket, the overflow count and the sum:
+        self._shards: Dict[int, List[float]] = {}
+
+    def observe(self, value: float) -> None:
+        """Record an observed value."""
+        shard = self._shards.get(get_ident())
+        if shard is None:
+            shard = self._shards.setdefault(
+                get_ident(), [0.0] * (len(self._buckets) + 2)
+            )
+        shard[bisect_left(self._buckets, value)] += 1
+        shard[-1] += value
+
+    def totals(self) -> List[float]:
+        """The counts per bucket, the overflow count and the sum over all
+        shards."""
+        totals = [0.0] * (len(self._buckets) + 2)
+        for shard in list(self._shards.values()):
+            for index, value in enumerate(shard):
+                totals[index] += value
+        return totals
+
+    @property
+    def count(self) -> int:
+        """Number of observed values."""
+        return int(sum(self.totals()[:-1]))
+
+
+class Histogram(_Metric):
+    """Counts of observed values by bucket, e.g. latencies"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """Record a value of a metric without labels."""
+        self.labels().observe(value)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        labelnames = self.labelnames + ("le",)
+        for values, child in list(self._children.items()):
+            totals = child.totals()
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), totals):
+                cumulative += count
+                bucket_values = values + (_format_value(bound),)
+                yield "_bucket", _format_labels(labelnames, bucket_values), cumulative
+            labels = _format_labels(self.labelnames, values)
+            yield "_count", labels, cumulative
+            yield "_sum", labels, totals[-1]
+
+
+class Gauge(_Metric):
+    """A value read from a callback whenever the metrics are collected"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Union[float, Dict[LabelValues, float]]],
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._callback = callback
+
+    def _new_child(self) -> Any:
+        raise TypeError(f"{self.name} is read from its callback.")
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        values = self._callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            yield "", _format_labels(self.labelnames, label_values), value
+
+
+def _field_reader(stats: Any, name: str) -> Callable[[], float]:
+    """Create a callback reading a field of a statistics object."""
+    return lambda: getattr(stats, name)
+
+
+class Registry:
+    """A collection of metrics exposed together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: Any) -> Any:
+        """Add a metric, replacing an earlier one of the same name."""
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> Counter:
+        """Create and register a counter."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """Create and register a histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Union[float, Dict[LabelValues, float]]],
+        labelnames: Sequence[str] = (),
+    ) -> Gauge:
+        """Create and register a gauge reading its values from the callback,
+        which returns a single value or the values by label values."""
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def register_fields(self, prefix: str, documentation: str, stats: Any) -> None:
+        """Expose every numeric field of a statistics dataclass as a gauge named
+        after the prefix and the field."""
+        for field in fields(stats):
+            self.gauge(
+                f"{prefix}_{field.name}",
+                f"{documentation}: {field.name.replace('_', ' ')}",
+                _field_reader(stats, field.name),
+            )
+
+    def expose(self) -> str:
+        """Render all metrics in the Prometheus text format."""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+# The registry of the metrics recorded throughout the service:
+REGISTRY = Registry()
+
+
+def timed(histogram: Histogram) -> Callable[[F], F]:
+    """Decorate a coroutine function to observe its duration in the histogram,
+    labelled by the qualified name of the function."""
+
+    def decorator(func: F) -> F:
+        child = histogram.labels(func.__qualname__)
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+async def serve_metrics(registry: Registry, host: str, port: int) -> asyncio.Server:
+    """Serve the metrics of the registry over HTTP at /metrics."""
+
+    async def handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+                status, content_type = "200 OK", CONTENT_TYPE
+                body = registry.expose().encode()
+            else:
+                status, content_type = "404 Not Found", "text/plain"
+                body = b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,74 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Child processes that can be reattached to after a restart of the service"""
+
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from exec_manager.metrics import REGISTRY
+
+PROCESS_SECONDS = REGISTRY.histogram(
+    "exec_manager_process_seconds",
+    "Runtime of the child processes of executions and of workflow steps",
+    ("kind",),
+)
+
+# Runs the command given as positional parameters and writes its exit code to the
+# file given as $0. Processes that are not children of the service anymore, e.g.
+# after it was restarted, cannot be waited for, so this file is the only way to
+# learn how they ended.
+_WRAPPER_SCRIPT = '"$@"; code=$?; echo $code > "$0.tmp" && mv "$0.tmp" "$0"; exit $code'
+
+
+def wrap_command(command: Sequence[str], status_file: Path) -> List[str]:
+    """Wrap a command so that its exit code is written to the status file."""
+    return ["/bin/sh", "-c", _WRAPPER_SCRIPT, str(status_file), *command]
+
+
+def process_alive(pid: int, status_file: Path) -> bool:
+    """Whether the wrapper process writing the given status file is still alive.
+    Where /proc is available, the command line of the process is checked, so a
+    recycled pid is not mistaken for the original process."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    try:
+        cmdline = Path(f"/proc/{pid}/cmdline").read_bytes()
+    except FileNotFoundError:
+        return not Path("/proc/self").exists()
+    except OSError:
+        return True
+    return str(status_file).encode() in cmdline.split(b"\0")
+
+
+def read_exit_code(status_file: Path) -> Optional[int]:
+    """Read the exit code written by a wrapped command, if any."""
+    try:
+        return int(status_file.read_text().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def remove_status_file(status_file: Path) -> None:
+    """Remove the status file of a process once its outcome is recorded."""
+    try:
+        status_file.unlink()
+    except FileNotFoundError:
+        pass
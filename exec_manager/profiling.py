@@ -0,0 +1,176 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Opt-in profiling of the service and tracing of executions
+
+Both are off by default and can be switched on and off at runtime. While on,
+the thread running the event loop is sampled periodically and the stacks are
+written in the collapsed format read by flame graph tools. The stages of every
+execution are written as spans in the Chrome trace event format, which can be
+opened in Perfetto or chrome://tracing.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import IO, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Tracer:
+    """Writes spans to a trace file while started, does nothing otherwise"""
+
+    def __init__(self):
+        self._file: Optional[IO[str]] = None
+        self._separator = ""
+        self._pid = os.getpid()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether spans are currently written."""
+        return self._file is not None
+
+    def start(self, path: Path) -> None:
+        """Start writing spans to a new trace file."""
+        self._file = open(  # pylint: disable=consider-using-with
+            path, "w", encoding="utf-8"
+        )
+        self._file.write("[")
+        self._separator = "\n"
+
+    def stop(self) -> None:
+        """Finish the trace file."""
+        if self._file is not None:
+            self._file.write("\n]\n")
+            self._file.close()
+            self._file = None
+
+    def span(self, trace_id: str, name: str, start: float, end: float) -> None:
+        """Record a span of the given trace, with start and end times taken from
+        the performance counter. Spans of one trace share a track."""
+        if self._file is None:
+            return
+        for phase, timestamp in (("b", start), ("e", end)):
+            event = {
+                "name": name,
+                "cat": "execution",
+                "ph": phase,
+                "id": trace_id,
+                "ts": round(timestamp * 1e6),
+                "pid": self._pid,
+                "tid": 0,
+            }
+            self._file.write(self._separator + json.dumps(event))
+            self._separator = ",\n"
+
+
+# The tracer used throughout the service:
+TRACER = Tracer()
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread from a background thread"""
+
+    def __init__(self, interval: float):
+        """Initialize with the seconds between samples."""
+        self._interval = interval
+        self._stacks: "Counter[str]" = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, thread_id: int) -> None:
+        """Start sampling the thread with the given id."""
+        self._stacks.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._sample, args=(thread_id,), name="profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> "Counter[str]":
+        """Stop sampling and return the number of samples by collapsed stack."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self._stacks
+
+    def _sample(self, thread_id: int) -> None:
+        """Take samples until stopped."""
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(  # pylint: disable=protected-access
+                thread_id
+            )
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(
+                    f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if names:
+                self._stacks[";".join(reversed(names))] += 1
+
+
+class Profiling:
+    """Switches profiling and tracing of the service on and off together"""
+
+    def __init__(self, profile_dir: Path, *, sample_interval: float):
+        """Initialize with the directory receiving the profiles and traces and
+        the seconds between samples of the event loop thread."""
+        self._profile_dir = profile_dir
+        self._profiler = SamplingProfiler(sample_interval)
+        self._name: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the service is currently being profiled."""
+        return self._name is not None
+
+    def enable(self) -> None:
+        """Start profiling the calling thread and tracing executions."""
+        if self.enabled:
+            return
+        self._profile_dir.mkdir(parents=True, exist_ok=True)
+        self._name = time.strftime("%Y%m%d-%H%M%S")
+        TRACER.start(self._profile_dir / f"trace-{self._name}.json")
+        self._profiler.start(threading.get_ident())
+        logger.info("Profiling enabled, writing to %s.", self._profile_dir)
+
+    def disable(self) -> None:
+        """Stop profiling and write the collected stacks."""
+        if self._name is None:
+            return
+        stacks = self._profiler.stop()
+        TRACER.stop()
+        path = self._profile_dir / f"profile-{self._name}.folded"
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        self._name = None
+        logger.info("Profiling disabled, wrote %s.", path)
+
+    def toggle(self) -> None:
+        """Enable profiling if disabled and vice versa."""
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
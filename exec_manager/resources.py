@@ -0,0 +1,186 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Accounting of the CPU and memory of the host among running jobs"""
+
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+
+
+class InsufficientCapacityError(ValueError):
+    """Thrown when a job requests more resources than the host has in total."""
+
+    def __init__(self, request: "Resources", capacity: "Resources"):
+        message = (
+            f"The request of {request.cpus} CPUs and {request.memory_mb} MB"
+            + f" exceeds the capacity of {capacity.cpus} CPUs and"
+            + f" {capacity.memory_mb} MB."
+        )
+        super().__init__(message)
+
+
+@dataclass(frozen=True)
+class Resources:
+    """CPU cores and memory, either requested by a job or provided by a host"""
+
+    cpus: float = 1.0
+    memory_mb: int = 0
+
+    def fits_into(self, other: "Resources") -> bool:
+        """Whether these resources fit into the other ones."""
+        return self.cpus <= other.cpus and self.memory_mb <= other.memory_mb
+
+
+def host_capacity(
+    cpus: Optional[float] = None, memory_mb: Optional[int] = None
+) -> Resources:
+    """Detect the CPU cores and physical memory of the host. Given values take
+    precedence over the detected ones."""
+    if cpus is None:
+        cpus = float(os.cpu_count() or 1)
+    if memory_mb is None:
+        try:
+            memory_mb = (
+                os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 1024**2
+            )
+        except (AttributeError, ValueError, OSError):
+            memory_mb = sys.maxsize
+    return Resources(cpus=cpus, memory_mb=memory_mb)
+
+
+@dataclass
+class _Waiter:
+    """A job waiting for its resources"""
+
+    request: Resources
+    granted: "asyncio.Future[None]"
+    since: float
+
+
+class ResourceAccountant:
+    """Hands out the resources of the host to jobs.
+
+    CPUs can be overcommitted by the given ratio, since jobs rarely use all their
+    cores all the time. Memory is never overcommitted, as running out of it gets
+    jobs killed.
+
+    Waiting jobs are served in arrival order, but a job that fits into the free
+    resources may start before earlier jobs that do not (backfilling). So small
+    jobs fill the gaps left by large ones. Once the first waiting job has waited
+    for `starvation_timeout` seconds, backfilling stops until it has started, so
+    that large jobs are not starved by a steady stream of small ones.
+    """
+
+    def __init__(
+        self,
+        capacity: Resources,
+        *,
+        cpu_overcommit: float = 1.0,
+        starvation_timeout: float = 300.0,
+    ):
+        """Initialize the accountant with the resources of the host."""
+        self.capacity = Resources(
+            cpus=capacity.cpus * cpu_overcommit, memory_mb=capacity.memory_mb
+        )
+        self._starvation_timeout = starvation_timeout
+        self._used = Resources(cpus=0, memory_mb=0)
+        self._waiters: List[_Waiter] = []
+
+    @property
+    def free(self) -> Resources:
+        """Resources that are currently not given to any job."""
+        return Resources(
+            cpus=self.capacity.cpus - self._used.cpus,
+            memory_mb=self.capacity.memory_mb - self._used.memory_mb,
+        )
+
+    @property
+    def waiting(self) -> int:
+        """Number of jobs waiting for resources."""
+        return len(self._waiters)
+
+    async def acquire(self, request: Resources) -> None:
+        """Wait until the requested resources are available and take them."""
+        if not request.fits_into(self.capacity):
+            raise InsufficientCapacityError(request, self.capacity)
+        if request.fits_into(self.free) and not self._head_is_starving():
+            self._take(request)
+            return
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(
+            request=request, granted=loop.create_future(), since=time.monotonic()
+        )
+        self._waiters.append(waiter)
+        try:
+            await waiter.granted
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif not waiter.granted.cancelled():
+                self.release(request)
+            raise
+
+    def release(self, request: Resources) -> None:
+        """Give back resources taken by `acquire` and start waiting jobs that
+        fit now."""
+        self._used = Resources(
+            cpus=self._used.cpus - request.cpus,
+            memory_mb=self._used.memory_mb - request.memory_mb,
+        )
+        self._grant()
+
+    @asynccontextmanager
+    async def reserve(self, request: Resources) -> AsyncIterator[None]:
+        """Hold the requested resources for the duration of the context."""
+        await self.acquire(request)
+        try:
+            yield
+        finally:
+            self.release(request)
+
+    def _take(self, request: Resources) -> None:
+        """Mark the resources as used."""
+        self._used = Resources(
+            cpus=self._used.cpus + request.cpus,
+            memory_mb=self._used.memory_mb + request.memory_mb,
+        )
+
+    def _head_is_starving(self) -> bool:
+        """Whether the first waiting job has waited too long to be
+        overtaken."""
+        return bool(self._waiters) and (
+            time.monotonic() - self._waiters[0].since >= self._starvation_timeout
+        )
+
+    def _grant(self) -> None:
+        """Start waiting jobs in arrival order, skipping those that do not fit
+        unless the first one is starving."""
+        starving = self._head_is_starving()
+        for waiter in list(self._waiters):
+            if waiter.granted.done():
+                self._waiters.remove(waiter)
+                continue
+            if waiter.request.fits_into(self.free):
+                self._take(waiter.request)
+                self._waiters.remove(waiter)
+                waiter.granted.set_result(None)
+            elif starving:
+                break
@@ -0,0 +1,539 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Asyncio-based scheduler running workflow executions as child processes"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    TypeVar,
+)
+
+from exec_manager.fair_share import FairShareQueue, TenantMetrics
+from exec_manager.logs import capture_rest, capture_while, spool_output
+from exec_manager.metrics import REGISTRY
+from exec_manager.models import ExecutionStatus
+from exec_manager.processes import (
+    PROCESS_SECONDS,
+    process_alive,
+    read_exit_code,
+    remove_status_file,
+    wrap_command,
+)
+from exec_manager.profiling import TRACER
+from exec_manager.workflow import Workflow, WorkflowRunner, build_graph
+
+if TYPE_CHECKING:  # the DB layer is only loaded by the code wiring the service
+    from exec_manager.admission import AdmissionController
+    from exec_manager.dao.change_feed import ChangeFeed
+    from exec_manager.dao.executions import ExecutionDao
+    from exec_manager.dao.job_claims import JobClaimer
+    from exec_manager.dao.state_writer import StateWriter
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_SECONDS = REGISTRY.histogram(
+    "exec_manager_dispatch_seconds",
+    "Time from taking an execution off the queue until it has started",
+)
+EXECUTION_PROCESS_SECONDS = PROCESS_SECONDS.labels("execution")
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class QueuedExecution:
+    """An execution waiting in the queue of the scheduler"""
+
+    execution_id: str
+    command: List[str]
+    workflow: Optional[Dict[str, Any]] = None
+    owner: str = ""
+    priority: int = 0
+    # time of the performance counter at which the execution was queued:
+    queued_at: float = field(default_factory=time.perf_counter, compare=False)
+
+
+class Scheduler:  # pylint: disable=too-many-instance-attributes
+    """Runs executions as child processes with bounded concurrency.
+
+    Submitted executions are put onto a bounded queue. The dispatch loop started by
+    `run` takes them off the queue and launches at most `max_in_flight` child
+    processes at the same time. The queue hands out executions of higher priority
+    first and shares the slots between owners according to `weights`. Waiting
+    for a child process is done by the event loop, so no thread is needed per
+    running execution. Executions of workflows run their steps through the given
+    workflow runner.
+
+    State changes and heartbeats of running executions go through the given
+    state writer, which writes them to the database in batches.
+
+    Several replicas can share one database. Besides the executions submitted to
+    it directly, every replica claims executions from the database whenever it
+    has free slots and holds a lease on all executions it is responsible for.
+    Leases are renewed every third of their duration, so the executions of a
+    crashed replica are picked up by the others once its leases expire.
+
+    When started, the scheduler first recovers the executions that are still
+    leased to its replica from a previous run. Child processes that survived the
+    restart are watched until they exit. Child processes write their exit code
+    to a file in `state_dir`, so the outcome of a process that is no longer a
+    child of the service is known, also if it exited while the service was down.
+    Everything else is queued again.
+
+    If a `logs_dir` is given, the stdout and stderr of child processes are
+    captured into compressed logs there. Processes write their output into spool
+    files rather than pipes of the service, so they are not affected by a
+    restart, and the output of reattached processes is captured from where the
+    previous run of the service stopped.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        dao: "ExecutionDao",
+        writer: "StateWriter",
+        claimer: "JobClaimer",
+        runner: WorkflowRunner,
+        *,
+        max_in_flight: int,
+        max_queued: int,
+        heartbeat_interval: float,
+        claim_interval: float,
+        state_dir: Path,
+        logs_dir: Optional[Path] = None,
+        feed: Optional["ChangeFeed"] = None,
+        weights: Optional[Mapping[str, float]] = None,
+        admission: Optional["AdmissionController"] = None,
+    ):
+        """Initialize the scheduler. Must be called from within a running event
+        loop. If a change feed is given, newly queued executions are claimed as
+        soon as they are announced instead of at the next claim interval."""
+        self._dao = dao
+        self._writer = writer
+        self._claimer = claimer
+        self._runner = runner
+        self._max_in_flight = max_in_flight
+        self._heartbeat_interval = heartbeat_interval
+        self._claim_interval = claim_interval
+        self._state_dir = state_dir
+        self._logs_dir = logs_dir
+        self._queue = FairShareQueue(maxsize=max_queued, weights=weights)
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._held: Set[str] = set()
+        self._feed = feed
+        self._admission = admission
+        self._claim_wakeup = asyncio.Event()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of executions that are currently running."""
+        return len(self._tasks)
+
+    @property
+    def queued(self) -> int:
+        """Number of executions waiting for a free slot."""
+        return self._queue.qsize()
+
+    @property
+    def tenant_metrics(self) -> Dict[str, TenantMetrics]:
+        """Queue depth and wait times by owner."""
+        return self._queue.metrics
+
+    async def submit(
+        self, command: Sequence[str], owner: str, priority: int = 0
+    ) -> str:
+        """Persist a new execution and queue it for running. Waits for space in
+        the queue if it is full. Returns the id of the execution. Raises an
+        AdmissionRejectedError if the admission controller sheds the
+        submission."""
+        return await self._submit(list(command), None, owner, priority)
+
+    async def submit_workflow(
+        self, workflow: Workflow, owner: str, priority: int = 0
+    ) -> str:
+        """Like `submit` but for an execution running the steps of a workflow.
+        Raises a WorkflowError if the steps do not form a valid DAG."""
+        build_graph(workflow)
+        return await self._submit([], workflow.dict(), owner, priority)
+
+    async def _submit(
+        self,
+        command: List[str],
+        workflow: Optional[Dict[str, Any]],
+        owner: str,
+        priority: int,
+    ) -> str:
+        """Persist a new execution leased to this replica and queue it."""
+        if self._admission is not None:
+            await self._admission.admit(owner)
+        execution_id = await self._dao.create(
+            command,
+            owner=owner,
+            workflow=workflow,
+            priority=priority,
+            lease_owner=self._claimer.replica_id,
+            lease_expires_at=self._claimer.lease_deadline(),
+        )
+        self._held.add(execution_id)
+        await self._queue.put(
+            QueuedExecution(execution_id, command, workflow, owner, priority)
+        )
+        return execution_id
+
+    async def join(self) -> None:
+        """Wait until all queued executions have finished."""
+        await self._queue.join()
+
+    async def run(self) -> None:
+        """Recover, claim, dispatch and keep the leases of executions until
+        cancelled."""
+        tasks = [self._recover_and_claim(), self._dispatch(), self._renew_leases()]
+        if self._feed is not None:
+            tasks.append(self._wake_on_queued(self._feed))
+        await asyncio.gather(*tasks)
+
+    async def _recover_and_claim(self) -> None:
+        """Recover the executions of this replica, then claim new ones."""
+        await self.recover()
+        await self._claim()
+
+    async def recover(self) -> None:
+        """Take over the queued and running executions that are still leased to
+        this replica from before a restart."""
+        active = await self._dao.list_active(self._claimer.replica_id)
+        reattached = 0
+        for execution in active:
+            if execution.execution_id in self._held:
+                continue
+            self._held.add(execution.execution_id)
+            status_file = self._status_file(execution.execution_id)
+            running_process = (
+                execution.status == ExecutionStatus.RUNNING
+                and execution.workflow is None
+            )
+            if (
+                running_process
+                and execution.pid is not None
+                and process_alive(execution.pid, status_file)
+            ):
+                await self._slots.acquire()
+                self._track(self._watch(execution.execution_id, execution.pid))
+                reattached += 1
+            elif not (
+                running_process and await self._collect_exited(execution.execution_id)
+            ):
+                await self._queue.put(
+                    QueuedExecution(
+                        execution.execution_id,
+                        execution.command,
+                        execution.workflow,
+                        execution.owner,
+                        execution.priority,
+                    )
+                )
+        logger.info(
+            "Recovered %d executions, reattached to %d running processes.",
+            len(active),
+            reattached,
+        )
+
+    async def _dispatch(self) -> None:
+        """Start queued executions whenever a slot is free."""
+        while True:
+            await self._slots.acquire()
+            try:
+                execution = await self._queue.get()
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+            self._track(self._execute(execution, time.perf_counter()))
+
+    def _track(self, work: Awaitable[None]) -> None:
+        """Run the work of an execution in a task counted as in flight."""
+        task = asyncio.ensure_future(work)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _claim(self) -> None:
+        """Claim executions from the database to fill the free slots. Only as
+        many executions are claimed as can be started right away, so that
+        queued work is spread over all replicas."""
+        while True:
+            free = self._max_in_flight - self.in_flight - self.queued
+            claimed = []
+            try:
+                claimed = await self._claimer.claim(free)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Claiming executions failed.")
+            for execution in claimed:
+                if execution.execution_id in self._held:
+                    continue
+                self._held.add(execution.execution_id)
+                await self._queue.put(
+                    QueuedExecution(
+                        execution_id=execution.execution_id,
+                        command=execution.command,
+                        workflow=execution.workflow,
+                        owner=execution.owner,
+                        priority=execution.priority,
+                    )
+                )
+            if len(claimed) < free or free <= 0:
+                try:
+                    await asyncio.wait_for(
+                        self._claim_wakeup.wait(), timeout=self._claim_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self._claim_wakeup.clear()
+
+    async def _wake_on_queued(self, feed: "ChangeFeed") -> None:
+        """Claim right away whenever an execution is queued."""
+        subscription = feed.subscribe()
+        try:
+            async for event in subscription:
+                if event.status == ExecutionStatus.QUEUED:
+                    self._claim_wakeup.set()
+        finally:
+            subscription.close()
+
+    async def _renew_leases(self) -> None:
+        """Periodically renew the leases of all executions held by this
+        replica."""
+        interval = self._claimer.lease_duration.total_seconds() / 3
+        while True:
+            await asyncio.sleep(interval)
+            held = list(self._held)
+            try:
+                renewed = await self._claimer.renew(held)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Renewing leases failed.")
+                continue
+            if renewed < len(held):
+                logger.warning("Lost the leases of %d executions.", len(held) - renewed)
+
+    async def shutdown(self) -> None:
+        """Wait for all running executions to finish after `run` was cancelled.
+
+        The leases of the running executions keep being renewed until then, so
+        no other replica starts them a second time. Executions still waiting in
+        the queue are not started anymore, their leases are released instead
+        for other replicas to claim them right away.
+        """
+        queued = self._take_queued()
+        if queued:
+            try:
+                await self._claimer.release(queued)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Releasing the leases of queued executions failed.")
+        if not self._tasks:
+            return
+        renewing = asyncio.ensure_future(self._renew_leases())
+        try:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            renewing.cancel()
+            await asyncio.gather(renewing, return_exceptions=True)
+
+    def _take_queued(self) -> List[str]:
+        """Take all executions off the queue and return their ids."""
+        taken = []
+        while not self._queue.empty():
+            execution = self._queue.get_nowait()
+            self._queue.task_done()
+            self._held.discard(execution.execution_id)
+            taken.append(execution.execution_id)
+        return taken
+
+    async def _execute(self, execution: QueuedExecution, dispatched: float) -> None:
+        """Run a single execution taken off the queue at the given time of the
+        performance counter and record its outcome."""
+        try:
+            if execution.workflow is None:
+                await self._run_process(execution, dispatched)
+            else:
+                await self._run_workflow(execution, dispatched)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Execution %s crashed.", execution.execution_id)
+        finally:
+            self._held.discard(execution.execution_id)
+            self._slots.release()
+            self._queue.task_done()
+
+    async def _run_process(self, execution: QueuedExecution, dispatched: float) -> None:
+        """Start the child process of an execution and wait for it to exit."""
+        status_file = self._status_file(execution.execution_id)
+        try:
+            process = await self._start_process(execution, status_file)
+        except OSError:
+            logger.exception(
+                "Could not start the process of execution %s.",
+                execution.execution_id,
+            )
+            self._writer.update(execution.execution_id, status=ExecutionStatus.FAILED)
+            return
+
+        started = time.perf_counter()
+        DISPATCH_SECONDS.observe(started - dispatched)
+        self._trace_start(execution, dispatched, started)
+        self._writer.update(
+            execution.execution_id, status=ExecutionStatus.RUNNING, pid=process.pid
+        )
+        exit_code = await self._with_heartbeats(
+            execution.execution_id,
+            self._capturing(execution.execution_id, process.wait()),
+        )
+        exited = time.perf_counter()
+        EXECUTION_PROCESS_SECONDS.observe(exited - started)
+        status = ExecutionStatus.SUCCEEDED if exit_code == 0 else ExecutionStatus.FAILED
+        self._writer.update(execution.execution_id, status=status, exit_code=exit_code)
+        remove_status_file(status_file)
+        self._trace_end(execution, started, exited)
+
+    async def _start_process(
+        self, execution: QueuedExecution, status_file: Path
+    ) -> "asyncio.subprocess.Process":
+        """Start the wrapped command of an execution in a session of its own,
+        with its output going to the spool files of its logs if there are any."""
+        command = wrap_command(execution.command, status_file)
+        if self._logs_dir is None:
+            return await asyncio.create_subprocess_exec(
+                *command, start_new_session=True
+            )
+        with spool_output(self._logs_dir, execution.execution_id) as (stdout, stderr):
+            return await asyncio.create_subprocess_exec(
+                *command, stdout=stdout, stderr=stderr, start_new_session=True
+            )
+
+    def _capturing(self, execution_id: str, work: Awaitable[T]) -> Awaitable[T]:
+        """Capture the output of the process of an execution into its logs, if
+        there are any, while awaiting the work."""
+        if self._logs_dir is None:
+            return work
+        return capture_while(work, self._logs_dir, execution_id)
+
+    @staticmethod
+    def _trace_start(
+        execution: QueuedExecution, dispatched: float, started: float
+    ) -> None:
+        """Trace the time an execution spent in the queue and being staged."""
+        TRACER.span(execution.execution_id, "queued", execution.queued_at, dispatched)
+        TRACER.span(execution.execution_id, "staged", dispatched, started)
+
+    @staticmethod
+    def _trace_end(execution: QueuedExecution, started: float, exited: float) -> None:
+        """Trace the time an execution ran and its outcome was collected."""
+        TRACER.span(execution.execution_id, "running", started, exited)
+        TRACER.span(execution.execution_id, "collected", exited, time.perf_counter())
+
+    async def _watch(self, execution_id: str, pid: int) -> None:
+        """Wait for a process that survived a restart of the service to exit and
+        record its outcome. As it is not a child of the service anymore, its
+        liveness is polled at the heartbeat interval."""
+        status_file = self._status_file(execution_id)
+        try:
+            await self._capturing(execution_id, self._poll_exit(execution_id, pid))
+            exit_code = read_exit_code(status_file)
+            if exit_code is None:
+                logger.warning(
+                    "The process of execution %s ended without an exit code.",
+                    execution_id,
+                )
+            status = (
+                ExecutionStatus.SUCCEEDED if exit_code == 0 else ExecutionStatus.FAILED
+            )
+            self._writer.update(execution_id, status=status, exit_code=exit_code)
+            remove_status_file(status_file)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Watching execution %s crashed.", execution_id)
+        finally:
+            self._held.discard(execution_id)
+            self._slots.release()
+
+    async def _poll_exit(self, execution_id: str, pid: int) -> None:
+        """Send heartbeats for a process that is not a child of the service until
+        it exits."""
+        status_file = self._status_file(execution_id)
+        while process_alive(pid, status_file):
+            self._writer.heartbeat(execution_id)
+            await asyncio.sleep(self._heartbeat_interval)
+
+    async def _collect_exited(self, execution_id: str) -> bool:
+        """Record the outcome and capture the remaining output of a process that
+        exited while the service was down. Returns whether its exit code was
+        found."""
+        status_file = self._status_file(execution_id)
+        exit_code = read_exit_code(status_file)
+        if exit_code is None:
+            return False
+        if self._logs_dir is not None:
+            await capture_rest(self._logs_dir, execution_id)
+        status = ExecutionStatus.SUCCEEDED if exit_code == 0 else ExecutionStatus.FAILED
+        self._writer.update(execution_id, status=status, exit_code=exit_code)
+        remove_status_file(status_file)
+        self._held.discard(execution_id)
+        return True
+
+    def _status_file(self, execution_id: str) -> Path:
+        """The file the exit code of the process of an execution is written
+        to."""
+        return self._state_dir / f"{execution_id}.exit"
+
+    async def _run_workflow(
+        self, execution: QueuedExecution, dispatched: float
+    ) -> None:
+        """Run the steps of a workflow execution and wait for all of them."""
+        try:
+            graph = build_graph(Workflow.parse_obj(execution.workflow))
+        except ValueError:
+            logger.exception(
+                "The workflow of execution %s is invalid.", execution.execution_id
+            )
+            self._writer.update(execution.execution_id, status=ExecutionStatus.FAILED)
+            return
+
+        started = time.perf_counter()
+        DISPATCH_SECONDS.observe(started - dispatched)
+        self._trace_start(execution, dispatched, started)
+        self._writer.update(execution.execution_id, status=ExecutionStatus.RUNNING)
+        succeeded = await self._with_heartbeats(
+            execution.execution_id, self._runner.run(graph, execution.execution_id)
+        )
+        exited = time.perf_counter()
+        status = ExecutionStatus.SUCCEEDED if succeeded else ExecutionStatus.FAILED
+        self._writer.update(execution.execution_id, status=status)
+        self._trace_end(execution, started, exited)
+
+    async def _with_heartbeats(self, execution_id: str, work: Awaitable[T]) -> T:
+        """Await the work of an execution while sending heartbeats for it."""
+        waiting = asyncio.ensure_future(work)
+        while True:
+            done, _ = await asyncio.wait({waiting}, timeout=self._heartbeat_interval)
+            if done:
+                return waiting.result()
+            self._writer.heartbeat(execution_id)
@@ -0,0 +1,51 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fast JSON encoding of trusted records read from the database"""
+
+import json
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Iterable
+
+if TYPE_CHECKING:
+    from exec_manager.dao.executions import ExecutionSummary
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+
+def _default(value: Any) -> Any:
+    """Encode the types the standard library JSON encoder cannot handle."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Encode a value as compact JSON, using orjson if it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value)  # pylint: disable=no-member
+    return json.dumps(value, separators=(",", ":"), default=_default).encode()
+
+
+def dump_summaries(summaries: Iterable["ExecutionSummary"]) -> bytes:
+    """Encode execution summaries as a JSON array.
+
+    The summaries come straight from the database, so they are converted to
+    plain dicts without being validated again.
+    """
+    return dumps([summary.to_dict() for summary in summaries])
@@ -0,0 +1,208 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Wiring of the service components"""
+
+import asyncio
+import signal
+from pathlib import Path
+
+from exec_manager.admission import AdmissionController
+from exec_manager.call_cache import CallCache
+from exec_manager.checksums import Checksummer
+from exec_manager.config import Config
+from exec_manager.dao.archive import Archiver
+from exec_manager.dao.change_feed import ChangeFeed
+from exec_manager.dao.engine import PoolMetrics, create_engine, create_session_factory
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.dao.job_claims import JobClaimer
+from exec_manager.dao.state_writer import StateWriter
+from exec_manager.dao.step_records import StepRecordDao
+from exec_manager.metrics import REGISTRY, Registry, serve_metrics
+from exec_manager.models import ExecutionStatus
+from exec_manager.profiling import Profiling
+from exec_manager.resources import ResourceAccountant, host_capacity
+from exec_manager.scheduler import Scheduler
+from exec_manager.state_counts import StateCounts
+from exec_manager.workflow import WorkflowRunner
+
+
+def register_metrics(  # pylint: disable=too-many-arguments
+    registry: Registry,
+    scheduler: Scheduler,
+    pool_metrics: PoolMetrics,
+    writer: StateWriter,
+    admission: AdmissionController,
+    call_cache: CallCache,
+    state_counts: StateCounts,
+) -> None:
+    """Expose the state and statistics of the service components."""
+    registry.gauge(
+        "exec_manager_in_flight", "Executions running", lambda: scheduler.in_flight
+    )
+    registry.gauge(
+        "exec_manager_queued", "Executions waiting for a slot", lambda: scheduler.queued
+    )
+    registry.gauge(
+        "exec_manager_owner_queued",
+        "Executions waiting for a slot by owner",
+        lambda: {
+            (owner,): metrics.depth
+            for owner, metrics in scheduler.tenant_metrics.items()
+        },
+        ("owner",),
+    )
+    registry.gauge(
+        "exec_manager_owner_wait_seconds_mean",
+        "Mean time executions waited for a slot by owner",
+        lambda: {
+            (owner,): metrics.wait_seconds_mean
+            for owner, metrics in scheduler.tenant_metrics.items()
+        },
+        ("owner",),
+    )
+    registry.register_fields("exec_manager_db_pool", "Connection pool", pool_metrics)
+    registry.register_fields(
+        "exec_manager_state_writer", "State writer", writer.metrics
+    )
+    registry.register_fields("exec_manager_admission", "Admission", admission.metrics)
+    registry.register_fields(
+        "exec_manager_call_cache", "Call cache", call_cache.metrics
+    )
+    registry.gauge(
+        "exec_manager_call_cache_hit_ratio",
+        "Call cache: share of lookups answered from the cache",
+        lambda: call_cache.metrics.hit_ratio,
+    )
+    registry.gauge(
+        "exec_manager_executions",
+        "Queued and running executions of all replicas and executions finished by"
+        " this replica, by status",
+        lambda: {
+            (status.value,): state_counts.counts.get(status.value, 0)
+            for status in ExecutionStatus
+        },
+        ("status",),
+    )
+
+
+async def serve(config: Config) -> None:  # pylint: disable=too-many-locals
+    """Start the scheduler and keep it running until cancelled."""
+    pool_metrics = PoolMetrics()
+    engine = create_engine(config, pool_metrics)
+    session_factory = create_session_factory(engine)
+    feed = ChangeFeed(
+        engine,
+        session_factory,
+        poll_interval=config.change_feed_poll_interval,
+        retention=config.change_feed_retention,
+    )
+    writer = StateWriter(
+        session_factory,
+        flush_interval=config.state_flush_interval,
+        max_batch=config.state_flush_max_batch,
+        feed=feed,
+    )
+    claimer = JobClaimer(
+        session_factory,
+        replica_id=config.replica_id,
+        lease_duration=config.lease_duration,
+        weights=config.owner_weights,
+    )
+    state_dir = Path(config.state_dir)
+    state_dir.mkdir(parents=True, exist_ok=True)
+    logs_dir = Path(config.logs_dir)
+    call_cache = CallCache(
+        session_factory,
+        cache_dir=Path(config.call_cache_dir),
+        max_bytes=config.call_cache_max_bytes,
+    )
+    checksummer = Checksummer(max_workers=config.checksum_workers)
+    dao = ExecutionDao(session_factory, feed)
+    admission = AdmissionController(
+        dao,
+        max_queued_per_owner=config.max_queued_per_owner,
+        max_queued_total=config.max_queued_total,
+        retry_after=config.admission_retry_after,
+    )
+    scheduler = Scheduler(
+        dao,
+        writer,
+        claimer,
+        WorkflowRunner(
+            ResourceAccountant(
+                host_capacity(config.host_cpus, config.host_memory_mb),
+                cpu_overcommit=config.cpu_overcommit,
+                starvation_timeout=config.backfill_starvation_timeout,
+            ),
+            StepRecordDao(session_factory),
+            retry_backoff=config.step_retry_backoff,
+            retry_backoff_max=config.step_retry_backoff_max,
+            logs_dir=logs_dir,
+            call_cache=call_cache,
+            checksummer=checksummer,
+        ),
+        max_in_flight=config.max_in_flight_executions,
+        max_queued=config.max_queued_executions,
+        heartbeat_interval=config.heartbeat_interval,
+        claim_interval=config.claim_interval,
+        state_dir=state_dir,
+        logs_dir=logs_dir,
+        feed=feed,
+        weights=config.owner_weights,
+        admission=admission,
+    )
+    archiver = Archiver(
+        session_factory,
+        retention=config.archive_after,
+        batch_size=config.archive_batch_size,
+    )
+    state_counts = StateCounts(dao, interval=config.status_count_interval)
+    register_metrics(
+        REGISTRY,
+        scheduler,
+        pool_metrics,
+        writer,
+        admission,
+        call_cache,
+        state_counts,
+    )
+    metrics_server = None
+    if config.metrics_port is not None:
+        metrics_server = await serve_metrics(
+            REGISTRY, config.metrics_host, config.metrics_port
+        )
+    profiling = Profiling(
+        Path(config.profile_dir), sample_interval=config.profile_sample_interval
+    )
+    if config.profiling:
+        profiling.enable()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, profiling.toggle)
+    writer.start()
+    try:
+        await asyncio.gather(
+            scheduler.run(),
+            archiver.run(interval=config.archive_interval),
+            feed.run(),
+            state_counts.run(),
+        )
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        await scheduler.shutdown()
+        await writer.close()
+        await engine.dispose()
+        checksummer.close()
+        profiling.disable()
@@ -0,0 +1,66 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Number of executions in every state"""
+
+import asyncio
+import logging
+from typing import Dict
+
+from exec_manager.dao.executions import STATUS_CHANGES, ExecutionDao
+from exec_manager.models import ExecutionStatus
+
+logger = logging.getLogger(__name__)
+
+
+ACTIVE_STATUSES = (ExecutionStatus.QUEUED, ExecutionStatus.RUNNING)
+
+
+class StateCounts:
+    """The number of executions in every status.
+
+    Queued and running executions are counted over all replicas. Metrics are
+    collected synchronously while being exposed, so they are not counted then
+    but in the database every `interval` seconds, and the counts exposed are at
+    most that old. Counting finished executions would read the whole history,
+    so their counts are the status changes this replica has written instead.
+    """
+
+    def __init__(self, dao: ExecutionDao, *, interval: float = 1.0):
+        """Initialize with the number of seconds between counts."""
+        self._dao = dao
+        self._interval = interval
+        self.counts: Dict[str, int] = {}
+
+    async def refresh(self) -> None:
+        """Count the executions in every status now."""
+        active = await self._dao.active_counts()
+        self.counts = {
+            status.value: (
+                active.get(status.value, 0)
+                if status in ACTIVE_STATUSES
+                else int(STATUS_CHANGES.labels(status.value).value)
+            )
+            for status in ExecutionStatus
+        }
+
+    async def run(self) -> None:
+        """Count the executions every interval seconds until cancelled."""
+        while True:
+            try:
+                await self.refresh()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to count the executions by status")
+            await asyncio.sleep(self._interval)
@@ -0,0 +1,438 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Step-level parsing and dispatch of workflows"""
+
+import asyncio
+import logging
+import shutil
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from exec_manager.checksums import Checksummer
+from exec_manager.logs import capture_while, spool_output
+from exec_manager.processes import PROCESS_SECONDS
+from exec_manager.resources import (
+    InsufficientCapacityError,
+    ResourceAccountant,
+    Resources,
+)
+
+if TYPE_CHECKING:
+    from exec_manager.call_cache import CachedCall, CallCache
+    from exec_manager.dao.step_records import StepRecordDao
+
+logger = logging.getLogger(__name__)
+
+STEP_PROCESS_SECONDS = PROCESS_SECONDS.labels("step")
+
+# placeholder in the command of a scattered step replaced by the scattered item:
+SCATTER_PLACEHOLDER = "{item}"
+
+
+class WorkflowError(ValueError):
+    """Thrown when a workflow does not describe a valid step DAG."""
+
+
+class Step(BaseModel):
+    """A step of a workflow. A step with scatter items is run once per item with
+    the item substituted into its command, inputs and outputs. Every invocation
+    of the step gets the declared CPUs and memory and is retried up to `retries`
+    times if it fails. The inputs are the files the step reads, the outputs are
+    the files it creates. Unless `cache` is disabled, the outputs are reused from
+    the call cache if the step was run with the same command on inputs with the
+    same content before."""
+
+    id: str
+    command: List[str]
+    depends_on: List[str] = []
+    scatter: List[str] = []
+    inputs: List[str] = []
+    outputs: List[str] = []
+    cache: bool = True
+    retries: int = 0
+    cpus: float = 1.0
+    memory_mb: int = 0
+
+
+class Workflow(BaseModel):
+    """A workflow consisting of steps that depend on each other"""
+
+    steps: List[Step]
+
+
+@dataclass
+class StepNode:  # pylint: disable=too-many-instance-attributes
+    """A single invocation of a step, i.e. one shard of a scattered step"""
+
+    id: str
+    step_id: str
+    command: List[str]
+    resources: Resources
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    retries: int = 0
+    cache: bool = True
+    dependents: List[str] = field(default_factory=list)
+
+
+@dataclass
+class StepGraph:
+    """The DAG of step invocations of a workflow. `in_degree` counts the
+    unfinished dependencies of every node."""
+
+    nodes: Dict[str, StepNode]
+    in_degree: Dict[str, int]
+
+
+def _expand(step: Step) -> List[StepNode]:
+    """Create the nodes of a step, one per scatter item."""
+    resources = Resources(cpus=step.cpus, memory_mb=step.memory_mb)
+    if not step.scatter:
+        return [
+            StepNode(
+                id=step.id,
+                step_id=step.id,
+                command=list(step.command),
+                resources=resources,
+                inputs=list(step.inputs),
+                outputs=list(step.outputs),
+                retries=step.retries,
+                cache=step.cache,
+            )
+        ]
+    return [
+        StepNode(
+            id=f"{step.id}[{index}]",
+            step_id=step.id,
+            command=[arg.replace(SCATTER_PLACEHOLDER, item) for arg in step.command],
+            resources=resources,
+            inputs=[path.replace(SCATTER_PLACEHOLDER, item) for path in step.inputs],
+            outputs=[path.replace(SCATTER_PLACEHOLDER, item) for path in step.outputs],
+            retries=step.retries,
+            cache=step.cache,
+        )
+        for index, item in enumerate(step.scatter)
+    ]
+
+
+def build_graph(workflow: Workflow) -> StepGraph:
+    """Expand the steps of a workflow into a DAG of step invocations. Every
+    shard of a step depends on all shards of the steps it depends on."""
+    shards: Dict[str, List[StepNode]] = {}
+    for step in workflow.steps:
+        if step.id in shards:
+            raise WorkflowError(f"The step id '{step.id}' is used more than once.")
+        shards[step.id] = _expand(step)
+
+    nodes = {node.id: node for step_nodes in shards.values() for node in step_nodes}
+    in_degree = {node_id: 0 for node_id in nodes}
+    for step in workflow.steps:
+        for dependency in step.depends_on:
+            if dependency not in shards:
+                raise WorkflowError(
+                    f"The step '{step.id}' depends on the unknown step"
+                    + f" '{dependency}'."
+                )
+            for upstream in shards[dependency]:
+                for node in shards[step.id]:
+                    upstream.dependents.append(node.id)
+                    in_degree[node.id] += 1
+
+    graph = StepGraph(nodes=nodes, in_degree=in_degree)
+    _check_acyclic(graph)
+    return graph
+
+
+def _check_acyclic(graph: StepGraph) -> None:
+    """Make sure that every node can be reached by resolving dependencies."""
+    in_degree = dict(graph.in_degree)
+    ready = deque(node_id for node_id, degree in in_degree.items() if degree == 0)
+    visited = 0
+    while ready:
+        node_id = ready.popleft()
+        visited += 1
+        for dependent in graph.nodes[node_id].dependents:
+            in_degree[dependent] -= 1
+            if in_degree[dependent] == 0:
+                ready.append(dependent)
+    if visited < len(graph.nodes):
+        raise WorkflowError("The dependencies between the steps form a cycle.")
+
+
+def _outputs_present(outputs: Optional[List[str]]) -> bool:
+    """Whether a step has a completion record and all of its outputs still
+    exist."""
+    return outputs is not None and all(Path(path).exists() for path in outputs)
+
+
+def _already_completed(node: StepNode, completed: Dict[str, List[str]]) -> bool:
+    """Whether a node can be skipped because an earlier run completed it."""
+    if not _outputs_present(completed.get(node.id)):
+        return False
+    logger.info("Skipping the completed step %s.", node.id)
+    return True
+
+
+def _release_dependents(
+    graph: StepGraph, node_id: str, in_degree: Dict[str, int], ready: Deque[str]
+) -> None:
+    """Mark a node as finished, making the dependents whose dependencies are
+    all finished ready."""
+    for dependent in graph.nodes[node_id].dependents:
+        in_degree[dependent] -= 1
+        if in_degree[dependent] == 0:
+            ready.append(dependent)
+
+
+async def _wait_for_any(
+    running: Dict["asyncio.Task[bool]", str]
+) -> Tuple[List[str], bool]:
+    """Wait until at least one of the running nodes finished and remove the
+    finished ones. Returns the ids of those that succeeded and whether any
+    failed."""
+    done: Set["asyncio.Task[bool]"]
+    done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+    succeeded = []
+    failed = False
+    for task in done:
+        node_id = running.pop(task)
+        if task.result():
+            succeeded.append(node_id)
+        else:
+            failed = True
+    return succeeded, failed
+
+
+def _restore_outputs(cached: "CachedCall", paths: List[str]) -> None:
+    """Copy the files of a cached call to the output paths of a node."""
+    for index, path in enumerate(paths):
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(cached.files[str(index)], target)
+
+
+class WorkflowRunner:
+    """Runs the nodes of step graphs as child processes.
+
+    All nodes whose dependencies are satisfied are started at once, limited only by
+    the CPUs and memory they declare, which are handed out by an accountant shared
+    by all workflows run on this host. The readiness of nodes is tracked by
+    decrementing the in-degree of the dependents of a node when it finishes, so
+    the graph is never rescanned.
+
+    If step records are given, every completed node is recorded. When an execution
+    is run again, e.g. after a failure or a restart of the service, nodes that
+    have a record and whose outputs are still present are skipped. Failed nodes
+    are retried as often as their step allows, waiting exponentially longer
+    between attempts.
+
+    If a `logs_dir` is given, the output of every step is captured into the logs
+    of the execution, prefixed by the node id.
+
+    If a call cache is given, the outputs of cacheable nodes are stored in it
+    under a key derived from the command, the outputs and the checksums of the
+    inputs, which are computed by the given checksummer. Nodes whose key is
+    cached get their outputs copied from the cache instead of being run.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        accountant: ResourceAccountant,
+        records: Optional["StepRecordDao"] = None,
+        *,
+        retry_backoff: float = 1.0,
+        retry_backoff_max: float = 60.0,
+        logs_dir: Optional[Path] = None,
+        call_cache: Optional["CallCache"] = None,
+        checksummer: Optional[Checksummer] = None,
+    ):
+        """Initialize the runner, starting steps once their resources are
+        available."""
+        if call_cache is not None and checksummer is None:
+            raise ValueError("A call cache requires a checksummer for the inputs.")
+        self._accountant = accountant
+        self._records = records
+        self._retry_backoff = retry_backoff
+        self._retry_backoff_max = retry_backoff_max
+        self._logs_dir = logs_dir
+        self._call_cache = call_cache
+        self._checksummer = checksummer
+
+    async def run(self, graph: StepGraph, execution_id: Optional[str] = None) -> bool:
+        """Run all nodes of the graph for the given execution. After the first
+        failure no new nodes are started, but running ones are awaited. Returns
+        whether all nodes succeeded."""
+        completed: Dict[str, List[str]] = {}
+        if self._records is not None and execution_id is not None:
+            completed = await self._records.completed(execution_id)
+
+        in_degree = dict(graph.in_degree)
+        ready: Deque[str] = deque(
+            node_id for node_id, degree in in_degree.items() if degree == 0
+        )
+        running: Dict["asyncio.Task[bool]", str] = {}
+        failed = False
+
+        while ready or running:
+            while ready and not failed:
+                node = graph.nodes[ready.popleft()]
+                if _already_completed(node, completed):
+                    _release_dependents(graph, node.id, in_degree, ready)
+                    continue
+                task = asyncio.create_task(self._run_node(node, execution_id))
+                running[task] = node.id
+            if not running:
+                continue
+
+            succeeded, any_failed = await _wait_for_any(running)
+            for node_id in succeeded:
+                _release_dependents(graph, node_id, in_degree, ready)
+            failed = failed or any_failed
+            if failed:
+                ready.clear()
+
+        return not failed
+
+    async def _run_node(self, node: StepNode, execution_id: Optional[str]) -> bool:
+        """Run a single node, unless its outputs can be taken from the call
+        cache, and record its completion. Returns whether it succeeded."""
+        key = await self._cache_key(node)
+        if key is not None and await self._reuse_cached(key, node):
+            await self._record(node, execution_id)
+            return True
+        if not await self._run_attempts(node, execution_id):
+            return False
+        if key is not None:
+            await self._store_cached(key, node)
+        await self._record(node, execution_id)
+        return True
+
+    async def _record(self, node: StepNode, execution_id: Optional[str]) -> None:
+        """Record the completion of a node if step records are kept."""
+        if self._records is not None and execution_id is not None:
+            await self._records.record(execution_id, node.id, node.outputs)
+
+    async def _cache_key(self, node: StepNode) -> Optional[str]:
+        """Get the call cache key of a node, or None if it is not cached."""
+        if self._call_cache is None or self._checksummer is None:
+            return None
+        if not node.cache or not node.outputs:
+            return None
+        # only reached if a call cache was created, which loaded its module:
+        from exec_manager.call_cache import (  # pylint: disable=import-outside-toplevel
+            call_cache_key,
+        )
+
+        try:
+            checksums = await self._checksummer.checksum_files_async(
+                [Path(path) for path in node.inputs], ("sha256",)
+            )
+        except OSError:
+            logger.exception("Could not checksum the inputs of the step %s.", node.id)
+            return None
+        return call_cache_key(
+            {"command": node.command, "outputs": node.outputs},
+            {"inputs": node.inputs},
+            {str(path): digests["sha256"] for path, digests in checksums.items()},
+            None,
+        )
+
+    async def _reuse_cached(self, key: str, node: StepNode) -> bool:
+        """Copy the cached outputs of a node into place. Returns whether the
+        node was cached."""
+        if self._call_cache is None:
+            return False
+        try:
+            cached = await self._call_cache.lookup(key)
+            if cached is None:
+                return False
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, _restore_outputs, cached, node.outputs)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Could not reuse the cached outputs of %s.", node.id)
+            return False
+        logger.info("Reusing the cached outputs of the step %s.", node.id)
+        return True
+
+    async def _store_cached(self, key: str, node: StepNode) -> None:
+        """Store the outputs of a node that has just succeeded in the cache."""
+        if self._call_cache is None:
+            return
+        try:
+            await self._call_cache.store(
+                key,
+                {"paths": node.outputs},
+                {str(index): Path(path) for index, path in enumerate(node.outputs)},
+            )
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Could not cache the outputs of the step %s.", node.id)
+
+    async def _run_attempts(self, node: StepNode, execution_id: Optional[str]) -> bool:
+        """Run a node, retrying it if it fails. Returns whether it succeeded."""
+        for attempt in range(node.retries + 1):
+            if attempt:
+                delay = min(
+                    self._retry_backoff * 2 ** (attempt - 1), self._retry_backoff_max
+                )
+                logger.info("Retrying the step %s in %.1f seconds.", node.id, delay)
+                await asyncio.sleep(delay)
+            try:
+                succeeded = await self._run_once(node, execution_id)
+            except InsufficientCapacityError:
+                logger.exception("The step %s can never run on this host.", node.id)
+                return False
+            if succeeded:
+                return True
+        return False
+
+    async def _start_step(
+        self, node: StepNode, execution_id: Optional[str]
+    ) -> "asyncio.subprocess.Process":
+        """Start the process of a step, with its output going to the spool files
+        of its logs if there are any."""
+        if self._logs_dir is None or execution_id is None:
+            return await asyncio.create_subprocess_exec(*node.command)
+        spools = spool_output(self._logs_dir, execution_id, f"{node.id}.")
+        with spools as (stdout, stderr):
+            return await asyncio.create_subprocess_exec(
+                *node.command, stdout=stdout, stderr=stderr
+            )
+
+    async def _run_once(self, node: StepNode, execution_id: Optional[str]) -> bool:
+        """Run a single attempt of a node once its resources are available.
+        Returns whether it succeeded."""
+        async with self._accountant.reserve(node.resources):
+            try:
+                process = await self._start_step(node, execution_id)
+            except OSError:
+                logger.exception("Could not start the step %s.", node.id)
+                return False
+            started = time.perf_counter()
+            if self._logs_dir is not None and execution_id is not None:
+                exit_code = await capture_while(
+                    process.wait(), self._logs_dir, execution_id, f"{node.id}."
+                )
+            else:
+                exit_code = await process.wait()
+            STEP_PROCESS_SECONDS.observe(time.perf_counter() - started)
+        if exit_code != 0:
+            logger.warning("The step %s failed with exit code %d.", node.id, exit_code)
+        return exit_code == 0
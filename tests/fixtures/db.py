@@ -0,0 +1,36 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fixtures providing a throwaway database"""
+
+from typing import AsyncGenerator
+
+import pytest_asyncio
+from sqlalchemy.orm import sessionmaker
+
+from exec_manager.config import Config
+from exec_manager.dao.db_models import Base
+from exec_manager.dao.engine import create_engine, create_session_factory
+
+
+@pytest_asyncio.fixture
+async def session_factory(tmp_path) -> AsyncGenerator[sessionmaker, None]:
+    """Provides a session factory bound to a fresh SQLite database containing all
+    tables."""
+    engine = create_engine(Config(db_url=f"sqlite+aiosqlite:///{tmp_path / 'test.db'}"))
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    yield create_session_factory(engine)
+    await engine.dispose()
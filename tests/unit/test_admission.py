@@ -0,0 +1,54 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the admission control of new executions"""
+
+import pytest
+
+from exec_manager.admission import AdmissionController, AdmissionRejectedError
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.models import ExecutionStatus
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+@pytest.mark.asyncio
+async def test_limits_are_enforced(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that submissions beyond the per owner and total limits are rejected
+    with a retry hint, counting queued executions only."""
+    dao = ExecutionDao(session_factory)
+    finished = await dao.create(["true"], "alice")
+    await dao.set_status(finished, ExecutionStatus.SUCCEEDED)
+    await dao.create(["true"], "alice")
+    admission = AdmissionController(
+        dao, max_queued_per_owner=2, max_queued_total=3, retry_after=5, count_ttl=60
+    )
+
+    await admission.admit("alice")
+    with pytest.raises(AdmissionRejectedError) as owner_error:
+        await admission.admit("alice")
+    assert owner_error.value.retry_after == 5
+    assert "alice" in str(owner_error.value)
+
+    await admission.admit("bob")
+    with pytest.raises(AdmissionRejectedError):
+        await admission.admit("carol")
+
+    assert admission.metrics.admitted == 2
+    assert admission.metrics.rejected_owner == 1
+    assert admission.metrics.rejected_total == 1
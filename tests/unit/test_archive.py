@@ -0,0 +1,120 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the archival of finished executions"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, func, select
+
+from exec_manager.dao.archive import Archiver
+from exec_manager.dao.db_models import ArchivedExecution, Execution, StepCompletion
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.models import ExecutionStatus
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+@pytest.mark.asyncio
+async def test_archive_moves_old_finished_executions(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that only finished executions older than the retention period are
+    moved, in batches, together with dropping their step records."""
+    old = datetime.utcnow() - timedelta(days=2)
+    statuses = [ExecutionStatus.SUCCEEDED, ExecutionStatus.FAILED] * 3 + [
+        ExecutionStatus.RUNNING
+    ]
+    async with session_factory() as session:
+        async with session.begin():
+            for index, status in enumerate(statuses):
+                session.add(
+                    Execution(
+                        id=f"old-{index}",
+                        owner="alice",
+                        status=status.value,
+                        command=["true"],
+                        created_at=old,
+                        updated_at=old,
+                    )
+                )
+            session.add(
+                Execution(
+                    id="recent", owner="alice", status="succeeded", command=["true"]
+                )
+            )
+        async with session.begin():
+            session.add(StepCompletion(execution_id="old-0", node_id="a", outputs=[]))
+
+    archiver = Archiver(session_factory, retention=24 * 3600, batch_size=4)
+    assert await archiver.archive() == 6
+    assert await archiver.archive() == 0
+
+    async with session_factory() as session:
+        remaining = await session.execute(select(Execution.id).order_by(Execution.id))
+        assert list(remaining.scalars()) == ["old-6", "recent"]
+        archived = await session.execute(select(func.count(ArchivedExecution.id)))
+        assert archived.scalar_one() == 6
+        steps = await session.execute(select(func.count()).select_from(StepCompletion))
+        assert steps.scalar_one() == 0
+
+    execution = await ExecutionDao(session_factory).get("old-1")
+    assert execution.status == ExecutionStatus.FAILED.value
+    assert execution.command == ["true"]
+    assert execution.created_at == old
+
+
+@pytest.mark.asyncio
+async def test_batches_are_read_from_the_index(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that every batch is read from the partial index of finished
+    executions in archival order instead of sorting all finished executions."""
+    async with session_factory() as session:
+        async with session.begin():
+            for index in range(200):
+                session.add(
+                    Execution(
+                        id=f"execution-{index}",
+                        owner="alice",
+                        status=ExecutionStatus.SUCCEEDED.value,
+                        command=["true"],
+                    )
+                )
+    engine = session_factory.kw["bind"]
+    async with engine.begin() as connection:
+        await connection.exec_driver_sql("ANALYZE")
+    statements = []
+
+    def capture(_conn, _cursor, statement, parameters, _context, _executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        await Archiver(session_factory, retention=24 * 3600, batch_size=10).archive()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+    statement, parameters = statements[0]
+    async with engine.connect() as connection:
+        result = await connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        )
+        plan = " ".join(row[-1] for row in result)
+
+    assert "ix_executions_archivable" in plan
+    assert "TEMP B-TREE" not in plan
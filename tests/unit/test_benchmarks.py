@@ -0,0 +1,41 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Smoke tests of the benchmark suite"""
+
+import pytest
+
+from benchmarks.dao_latency import bench_dao
+from benchmarks.scheduler_throughput import bench_scheduler
+
+
+@pytest.mark.asyncio
+async def test_bench_scheduler_runs_all_jobs(tmp_path):
+    """Test that the throughput benchmark completes every queued job."""
+    result = await bench_scheduler(f"sqlite+aiosqlite:///{tmp_path / 'b.db'}", 50)
+    assert result["queued"] == 50
+    assert result["executions_per_second"] > 0
+    assert set(result["dispatch_latency_seconds"]) == {"p50", "p99", "max"}
+
+
+@pytest.mark.asyncio
+async def test_bench_dao_times_every_query(tmp_path):
+    """Test that the DAO benchmark reports latencies for each query."""
+    result = await bench_dao(f"sqlite+aiosqlite:///{tmp_path / 'b.db'}", 20, 3)
+    assert "get_status" in result["latency_seconds"]
+    assert all(
+        timings["max"] >= timings["p50"]
+        for timings in result["latency_seconds"].values()
+    )
@@ -0,0 +1,67 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the call cache"""
+
+import asyncio
+
+import pytest
+
+from exec_manager.call_cache import CallCache, call_cache_key
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+def test_key_is_canonical():
+    """Test that the key does not depend on the order of mapping entries but on
+    every part of the call."""
+    key = call_cache_key({"a": 1, "b": 2}, {"x": "y"}, {"in.bam": "abc"}, "img:1")
+    assert key == call_cache_key(
+        {"b": 2, "a": 1}, {"x": "y"}, {"in.bam": "abc"}, "img:1"
+    )
+    assert key != call_cache_key(
+        {"a": 1, "b": 2}, {"x": "y"}, {"in.bam": "abd"}, "img:1"
+    )
+    assert key != call_cache_key({"a": 1, "b": 2}, {"x": "y"}, {"in.bam": "abc"}, None)
+
+
+@pytest.mark.asyncio
+async def test_store_lookup_and_evict(
+    session_factory, tmp_path  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that stored outputs are found again and that the least recently used
+    entry is evicted once the size limit is exceeded."""
+    output = tmp_path / "output.txt"
+    output.write_bytes(b"x" * 100)
+    cache = CallCache(session_factory, cache_dir=tmp_path / "cache", max_bytes=250)
+
+    assert await cache.lookup("first") is None
+    await cache.store("first", {"count": 1}, {"out": output})
+    await cache.store("second", {"count": 2}, {"out": output})
+    await asyncio.sleep(0.01)
+    hit = await cache.lookup("first")
+    assert hit is not None
+    assert hit.outputs == {"count": 1}
+    assert hit.files["out"].read_bytes() == output.read_bytes()
+
+    await cache.store("third", {"count": 3}, {"out": output})
+    assert await cache.lookup("second") is None
+    assert await cache.lookup("first") is not None
+    assert await cache.lookup("third") is not None
+    assert not (tmp_path / "cache" / "se" / "second").exists()
+
+    assert (cache.metrics.hits, cache.metrics.misses) == (3, 2)
+    assert (cache.metrics.evictions, cache.metrics.bytes_evicted) == (1, 100)
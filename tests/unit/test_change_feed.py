@@ -0,0 +1,199 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the change feed of execution status changes"""
+
+import asyncio
+from typing import List
+
+import pytest
+from sqlalchemy import func, select
+
+from exec_manager.dao.change_feed import ChangeFeed, ExecutionEvent, Subscription
+from exec_manager.dao.db_models import OutboxEvent
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.dao.state_writer import StateWriter
+from exec_manager.models import ExecutionStatus
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+def make_feed(session_factory_, poll_interval: float = 60.0) -> ChangeFeed:
+    """Create a change feed on the engine of the given session factory."""
+    engine = session_factory_.kw["bind"]
+    return ChangeFeed(
+        engine, session_factory_, poll_interval=poll_interval, retention=3600
+    )
+
+
+async def take(subscription: Subscription, count: int) -> List[ExecutionEvent]:
+    """Wait for the given number of events of a subscription."""
+    events: List[ExecutionEvent] = []
+    async for event in subscription:
+        events.append(event)
+        if len(events) == count:
+            break
+    return events
+
+
+@pytest.mark.asyncio
+async def test_changes_are_delivered_in_order(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that status changes of the DAO and the state writer are delivered in
+    the order in which they were committed."""
+    feed = make_feed(session_factory)
+    await feed.deliver()
+    subscription = feed.subscribe()
+    dao = ExecutionDao(session_factory, feed)
+    writer = StateWriter(session_factory, flush_interval=1, max_batch=10, feed=feed)
+
+    execution_id = await dao.create(["true"], "alice")
+    writer.update(execution_id, status=ExecutionStatus.RUNNING, pid=1)
+    writer.heartbeat(execution_id)
+    await writer.flush()
+    writer.heartbeat(execution_id)
+    await writer.flush()
+    await dao.set_status(execution_id, ExecutionStatus.SUCCEEDED, exit_code=0)
+
+    assert await feed.deliver() == 3
+    assert [event.status for event in await take(subscription, 3)] == [
+        ExecutionStatus.QUEUED,
+        ExecutionStatus.RUNNING,
+        ExecutionStatus.SUCCEEDED,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_relay_wakes_up_on_commit(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that a running relay delivers changes without waiting for the poll
+    interval."""
+    feed = make_feed(session_factory)
+    subscription = feed.subscribe()
+    relay = asyncio.create_task(feed.run())
+    await asyncio.sleep(0.1)
+
+    execution_id = await ExecutionDao(session_factory, feed).create(["true"], "bob")
+    (event,) = await asyncio.wait_for(take(subscription, 1), timeout=5)
+    assert event.execution_id == execution_id
+
+    relay.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await relay
+
+
+@pytest.mark.asyncio
+async def test_outbox_is_pruned_while_busy(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that expired events are pruned even if changes keep waking up the
+    relay more often than the poll interval."""
+    feed = ChangeFeed(
+        session_factory.kw["bind"], session_factory, poll_interval=0.2, retention=0
+    )
+    dao = ExecutionDao(session_factory, feed)
+    relay = asyncio.create_task(feed.run())
+    for _ in range(40):
+        await dao.create(["true"], "bob")
+        await asyncio.sleep(0.02)
+    relay.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await relay
+
+    async with session_factory() as session:
+        remaining = await session.scalar(select(func.count()).select_from(OutboxEvent))
+    assert remaining < 40
+
+
+async def commit_events(session_factory_, *seqs: int) -> None:
+    """Commit outbox events with the given sequence numbers, as if they had
+    been taken by transactions committing in this order."""
+    async with session_factory_() as session:
+        async with session.begin():
+            for seq in seqs:
+                session.add(
+                    OutboxEvent(
+                        seq=seq, execution_id=f"execution-{seq}", status="running"
+                    )
+                )
+
+
+@pytest.mark.asyncio
+async def test_events_committed_out_of_order_are_delivered(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that an event whose sequence number was skipped because it was
+    committed after a higher one is delivered late rather than lost."""
+    feed = make_feed(session_factory)
+    await feed.deliver()
+    subscription = feed.subscribe()
+
+    await commit_events(session_factory, 1, 3, 4)
+    assert await feed.deliver() == 3
+    await commit_events(session_factory, 2)
+    assert await feed.deliver() == 1
+
+    events = await take(subscription, 4)
+    assert [event.seq for event in events] == [1, 3, 4, 2]
+    assert feed.skipped == 0
+    subscription.close()
+
+
+@pytest.mark.asyncio
+async def test_gaps_are_given_up_after_the_timeout(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that sequence numbers which never show up, as their transactions
+    were rolled back, are not read again forever."""
+    engine = session_factory.kw["bind"]
+    feed = ChangeFeed(
+        engine, session_factory, poll_interval=60, retention=3600, gap_timeout=0
+    )
+    await feed.deliver()
+
+    await commit_events(session_factory, 1, 3)
+    await feed.deliver()
+    assert feed.skipped == 0
+    await feed.deliver()
+    assert feed.skipped == 1
+
+    await commit_events(session_factory, 2)
+    assert await feed.deliver() == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_drops_oldest(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that a subscriber keeps only the newest events when it falls
+    behind, without affecting other subscribers."""
+    feed = make_feed(session_factory)
+    slow = feed.subscribe(max_queue=2)
+    fast = feed.subscribe(max_queue=10)
+
+    for seq in range(5):
+        event = ExecutionEvent(seq=seq, execution_id="x", status=ExecutionStatus.QUEUED)
+        slow.push(event)
+        fast.push(event)
+
+    assert slow.dropped == 3
+    assert [event.seq for event in await take(slow, 2)] == [3, 4]
+    assert fast.dropped == 0
+
+    slow.close()
+    fast.close()
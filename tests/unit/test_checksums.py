@@ -0,0 +1,122 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the checksumming of input files"""
+
+import hashlib
+import os
+
+from exec_manager.checksums import Checksummer
+
+
+def test_checksums_match_hashlib(tmp_path):
+    """Test that all algorithms are computed correctly, including files that span
+    several chunks and empty files."""
+    content = os.urandom(10_000)
+    large = tmp_path / "large.bam"
+    large.write_bytes(content)
+    empty = tmp_path / "empty.fastq"
+    empty.touch()
+
+    checksummer = Checksummer(max_workers=4, chunk_size=1024)
+    result = checksummer.checksum_files([large, empty], ["md5", "sha256"])
+    checksummer.close()
+
+    assert result[large] == {
+        "md5": hashlib.md5(content).hexdigest(),  # nosec
+        "sha256": hashlib.sha256(content).hexdigest(),
+    }
+    assert result[empty]["sha256"] == hashlib.sha256(b"").hexdigest()
+
+
+def test_unchanged_files_are_memoized(tmp_path, monkeypatch):
+    """Test that a file is only hashed again after it was modified."""
+    path = tmp_path / "input.cram"
+    path.write_bytes(b"first")
+    checksummer = Checksummer(max_workers=2)
+    calls = []
+    executor = checksummer._executor  # pylint: disable=protected-access
+    original = executor.submit
+
+    def counting_submit(function, *args):
+        calls.append(args)
+        return original(function, *args)
+
+    monkeypatch.setattr(executor, "submit", counting_submit)
+
+    first = checksummer.checksum(path, ["sha256"])
+    assert checksummer.checksum(path, ["sha256"]) == first
+    assert len(calls) == 1
+
+    path.write_bytes(b"second, longer")
+    assert checksummer.checksum(path, ["sha256"]) != first
+    assert len(calls) == 2
+    checksummer.close()
+
+
+def test_more_files_than_the_memo_holds(tmp_path):
+    """Test that checksumming more files than the memo holds returns all of
+    them."""
+    paths = []
+    for index in range(3):
+        path = tmp_path / f"input-{index}"
+        path.write_bytes(str(index).encode())
+        paths.append(path)
+    checksummer = Checksummer(max_workers=2, memo_size=2)
+
+    result = checksummer.checksum_files(paths, ["md5"])
+    checksummer.close()
+
+    assert result == {
+        path: {"md5": hashlib.md5(path.read_bytes()).hexdigest()}  # nosec
+        for path in paths
+    }
+
+
+def test_each_file_is_hashed_in_one_pass(tmp_path, monkeypatch):
+    """Test that every file is hashed by a single job computing all algorithms
+    that are not memoized yet."""
+    paths = []
+    for index in range(2):
+        path = tmp_path / f"input-{index}"
+        path.write_bytes(os.urandom(5000))
+        paths.append(path)
+    checksummer = Checksummer(max_workers=2, chunk_size=1024)
+    calls = []
+    executor = checksummer._executor  # pylint: disable=protected-access
+    original = executor.submit
+
+    def counting_submit(function, *args):
+        calls.append(args)
+        return original(function, *args)
+
+    monkeypatch.setattr(executor, "submit", counting_submit)
+
+    checksummer.checksum_files(paths[:1], ["md5"])
+    result = checksummer.checksum_files(paths, ["md5", "sha1", "sha256"])
+    checksummer.close()
+
+    assert [(path, list(algorithms)) for path, algorithms, _ in calls] == [
+        (paths[0], ["md5"]),
+        (paths[0], ["sha1", "sha256"]),
+        (paths[1], ["md5", "sha1", "sha256"]),
+    ]
+    for path in paths:
+        content = path.read_bytes()
+        assert result[path] == {
+            "md5": hashlib.md5(content).hexdigest(),  # nosec
+            "sha1": hashlib.sha1(content).hexdigest(),  # nosec
+            "sha256": hashlib.sha256(content).hexdigest(),
+        }
@@ -0,0 +1,59 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the construction of the pooled engine"""
+
+import pytest
+from sqlalchemy import exc, text
+
+from exec_manager.config import Config
+from exec_manager.dao.engine import PoolMetrics, create_engine
+
+
+@pytest.mark.asyncio
+async def test_pool_is_configured_and_measured(tmp_path):
+    """Test that the pool follows the config and reports checkouts and
+    timeouts."""
+    config = Config(
+        db_url=f"sqlite+aiosqlite:///{tmp_path / 'test.db'}",
+        db_pool_size=1,
+        db_max_overflow=0,
+        db_pool_timeout=0.1,
+    )
+    metrics = PoolMetrics()
+    engine = create_engine(config, metrics)
+    assert engine.sync_engine.pool.size() == 1
+
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+        with pytest.raises(exc.TimeoutError):
+            async with engine.connect():
+                pass
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+    await engine.dispose()
+
+    assert metrics.checkouts == 2
+    assert metrics.timeouts == 1
+    assert 0 < metrics.checkout_seconds_max <= metrics.checkout_seconds_total
+
+
+@pytest.mark.asyncio
+async def test_in_memory_sqlite_keeps_default_pool():
+    """Test that an in-memory database is not put behind a queue pool."""
+    engine = create_engine(Config(db_url="sqlite+aiosqlite:///:memory:"))
+    async with engine.connect() as connection:
+        assert (await connection.execute(text("SELECT 1"))).scalar() == 1
+    await engine.dispose()
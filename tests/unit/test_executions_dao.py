@@ -0,0 +1,232 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the execution DAO"""
+
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from sqlalchemy import event, text, tuple_
+
+from exec_manager.dao.db_models import Execution
+from exec_manager.dao.executions import (
+    ExecutionDao,
+    ExecutionNotFoundError,
+    ExecutionNotResumableError,
+    InvalidCursorError,
+    _summary_query,
+)
+from exec_manager.models import ExecutionStatus
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+async def add_executions(session_factory_, count: int):
+    """Insert executions alternating between two owners and statuses. Every two
+    executions share the same creation time to exercise the tie breaker."""
+    start = datetime(2022, 1, 1)
+    async with session_factory_() as session:
+        async with session.begin():
+            for index in range(count):
+                session.add(
+                    Execution(
+                        id=f"{index:04d}",
+                        owner="alice" if index % 2 else "bob",
+                        status=(
+                            ExecutionStatus.SUCCEEDED.value
+                            if index % 2
+                            else ExecutionStatus.FAILED.value
+                        ),
+                        command=["true"],
+                        created_at=start + timedelta(minutes=index // 2),
+                    )
+                )
+
+
+@pytest.mark.asyncio
+async def test_list_walks_all_pages(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that following the cursors yields every execution exactly once,
+    newest first."""
+    await add_executions(session_factory, 25)
+    dao = ExecutionDao(session_factory)
+
+    seen: List[str] = []
+    cursor = None
+    while True:
+        page = await dao.list(limit=10, cursor=cursor)
+        seen.extend(execution.id for execution in page.items)
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+
+    assert seen == [f"{index:04d}" for index in reversed(range(25))]
+
+
+@pytest.mark.asyncio
+async def test_list_filters(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test filtering by status and owner across pages."""
+    await add_executions(session_factory, 10)
+    dao = ExecutionDao(session_factory)
+
+    first = await dao.list(status=ExecutionStatus.SUCCEEDED, limit=3)
+    second = await dao.list(
+        status=ExecutionStatus.SUCCEEDED, limit=3, cursor=first.next_cursor
+    )
+    assert [execution.id for execution in first.items + second.items] == [
+        "0009",
+        "0007",
+        "0005",
+        "0003",
+        "0001",
+    ]
+    assert second.next_cursor is None
+
+    page = await dao.list(owner="bob", limit=10)
+    assert {execution.owner for execution in page.items} == {"bob"}
+    assert len(page.items) == 5
+
+
+@pytest.mark.asyncio
+async def test_list_invalid_cursor(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that a malformed cursor is rejected."""
+    with pytest.raises(InvalidCursorError):
+        await ExecutionDao(session_factory).list(cursor="not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_resume(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that only failed or cancelled executions can be resumed and that
+    resuming puts them back into the queue without a lease."""
+    dao = ExecutionDao(session_factory)
+    execution_id = await dao.create(["true"], owner="alice", lease_owner="replica")
+    with pytest.raises(ExecutionNotResumableError):
+        await dao.resume(execution_id)
+
+    await dao.set_status(execution_id, ExecutionStatus.FAILED, exit_code=1)
+    await dao.resume(execution_id)
+    execution = await dao.get(execution_id)
+    assert execution.status == ExecutionStatus.QUEUED
+    assert (execution.exit_code, execution.lease_owner) == (None, None)
+
+    with pytest.raises(ExecutionNotFoundError):
+        await dao.resume("missing")
+
+
+@pytest.mark.asyncio
+async def test_payload_is_compressed_and_deferred(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that the payload is stored compressed on SQLite, is loaded by get and
+    is left out of listings."""
+    dao = ExecutionDao(session_factory)
+    workflow = {"steps": [{"id": "step", "command": ["echo", "x" * 1000]}]}
+    execution_id = await dao.create(["true"], "alice", workflow=workflow)
+
+    async with session_factory() as session:
+        raw = await session.execute(
+            text("SELECT workflow FROM executions WHERE id = :id"),
+            {"id": execution_id},
+        )
+        assert len(raw.scalar_one()) < 100
+
+    execution = await dao.get(execution_id)
+    assert execution.command == ["true"]
+    assert execution.workflow == workflow
+
+    page = await dao.list()
+    assert not hasattr(page.items[0], "workflow")
+
+
+@pytest.mark.asyncio
+async def test_export_streams_batches(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that exporting yields every matching execution in bounded batches."""
+    await add_executions(session_factory, 25)
+    dao = ExecutionDao(session_factory)
+
+    batches = [batch async for batch in dao.export(owner="alice", batch_size=5)]
+    assert [len(batch) for batch in batches] == [5, 5, 2]
+    summaries = [summary for batch in batches for summary in batch]
+    assert summaries[0].id == "0023"
+    assert {summary.status for summary in summaries} == {ExecutionStatus.SUCCEEDED}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "status, owner", [(None, None), (ExecutionStatus.QUEUED, None), (None, "alice")]
+)
+@pytest.mark.parametrize("after_cursor", [False, True])
+async def test_list_pages_are_read_from_an_index(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+    status,
+    owner,
+    after_cursor,
+):
+    """Test that every page of a listing is read in index order instead of
+    sorting the whole table."""
+    query = _summary_query(status=status, owner=owner)
+    if after_cursor:
+        query = query.where(
+            tuple_(Execution.created_at, Execution.id) < (datetime(2022, 1, 1), "x")
+        )
+    engine = session_factory.kw["bind"]
+    sql = query.limit(51).compile(
+        engine.sync_engine, compile_kwargs={"literal_binds": True}
+    )
+    async with session_factory() as session:
+        result = await session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))
+        plan = " ".join(row[-1] for row in result)
+
+    assert "USING INDEX" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.asyncio
+async def test_list_active_uses_the_partial_index(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that the statement listing the active executions of a replica can be
+    answered from the partial index on the lease owner."""
+    engine = session_factory.kw["bind"]
+    statements = []
+
+    def capture(_conn, _cursor, statement, parameters, _context, _executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        await ExecutionDao(session_factory).list_active("replica-1")
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+    statement, parameters = statements[-1]
+    async with engine.connect() as connection:
+        result = await connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        )
+        plan = " ".join(row[-1] for row in result)
+
+    assert "ix_executions_active_lease_owner" in plan
@@ -0,0 +1,98 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the fair sharing of the queue between owners"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import List
+
+import pytest
+
+from exec_manager.fair_share import FairShareHeap, FairShareQueue
+
+
+@dataclass
+class Item:
+    """A queued item"""
+
+    owner: str
+    priority: int = 0
+
+
+def drain(heap: FairShareHeap) -> List[str]:
+    """Take all items and return their owners in order."""
+    return [heap.get().owner for _ in range(len(heap))]
+
+
+def test_owners_share_by_weight():
+    """Test that a backlog of one owner does not starve the others and that
+    weights scale the shares."""
+    heap = FairShareHeap({"carol": 2})
+    for _ in range(6):
+        heap.put(Item("alice"))
+    for _ in range(2):
+        heap.put(Item("bob"))
+    for _ in range(4):
+        heap.put(Item("carol"))
+
+    owners = drain(heap)
+    assert owners[:4].count("alice") == 1
+    assert owners[:4].count("bob") == 1
+    assert owners[:4].count("carol") == 2
+    assert owners[-3:] == ["alice"] * 3
+
+
+def test_priorities_come_first():
+    """Test that higher priorities are taken first, across owners."""
+    heap = FairShareHeap()
+    heap.put(Item("alice"))
+    heap.put(Item("alice", priority=2))
+    heap.put(Item("bob", priority=1))
+
+    assert [item.priority for item in (heap.get(), heap.get(), heap.get())] == [
+        2,
+        1,
+        0,
+    ]
+
+
+def test_late_owner_gets_no_credit_for_idling():
+    """Test that an owner becoming active alternates with the others instead of
+    catching up on the time it was idle."""
+    heap = FairShareHeap()
+    for _ in range(10):
+        heap.put(Item("alice"))
+    for _ in range(4):
+        heap.get()
+    for _ in range(4):
+        heap.put(Item("bob"))
+
+    assert drain(heap)[:4] == ["bob", "alice", "bob", "alice"]
+
+
+@pytest.mark.asyncio
+async def test_queue_metrics():
+    """Test that the asyncio queue tracks depth and wait time by owner."""
+    queue = FairShareQueue(maxsize=2)
+    await queue.put(Item("alice"))
+    await queue.put(Item("bob"))
+    assert queue.full()
+
+    await asyncio.sleep(0.01)
+    assert (await queue.get()).owner == "alice"
+    assert queue.metrics["alice"].depth == 0
+    assert queue.metrics["alice"].wait_seconds_max > 0
+    assert queue.metrics["bob"].depth == 1
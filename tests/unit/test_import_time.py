@@ -0,0 +1,79 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test that the entrypoints start without importing the heavy dependencies"""
+
+import subprocess  # nosec
+import sys
+
+import pytest
+
+from exec_manager import __version__
+
+# seconds the cold import of the service entrypoint may take, several times what
+# it takes on a developer machine so that slow CI runners do not fail the test:
+IMPORT_BUDGET_SECONDS = 0.15
+
+
+def run_python(*args: str) -> str:
+    """Run a fresh interpreter with the given arguments and return its stderr."""
+    return subprocess.run(  # nosec
+        [sys.executable, *args], capture_output=True, check=True, text=True
+    ).stderr
+
+
+def cold_import_seconds(module: str) -> float:
+    """Measure the cumulative import time of a module in a fresh interpreter."""
+    for line in run_python("-X", "importtime", "-c", f"import {module}").splitlines():
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative) / 1e6
+    raise AssertionError(f"The import time of {module} was not reported.")
+
+
+@pytest.mark.parametrize(
+    "module, heavy_modules",
+    [
+        ("exec_manager.__main__", ["sqlalchemy", "pydantic"]),
+        ("exec_manager.loadgen", ["sqlalchemy", "exec_manager.dao.db_models"]),
+        ("exec_manager.scheduler", ["sqlalchemy", "exec_manager.dao.db_models"]),
+    ],
+)
+def test_heavy_modules_are_imported_lazily(module, heavy_modules):
+    """Test that importing an entrypoint does not import the DB layer."""
+    imported = run_python(
+        "-c",
+        f"import sys, {module}; print(*sys.modules, file=sys.stderr)",
+    ).split()
+    assert module in imported
+    assert not set(heavy_modules) & set(imported)
+
+
+def test_entrypoint_import_time_is_within_budget():
+    """Test that the cold import of the service entrypoint stays fast. The
+    best of a few runs is taken to rule out noise."""
+    seconds = min(cold_import_seconds("exec_manager.__main__") for _ in range(3))
+    assert seconds < IMPORT_BUDGET_SECONDS
+
+
+def test_version_is_printed():
+    """Test that the version can be queried without starting the service."""
+    output = subprocess.run(  # nosec
+        [sys.executable, "-m", "exec_manager", "--version"],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    assert output.strip() == __version__
@@ -0,0 +1,180 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test lease-based claiming of executions"""
+
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, update
+
+from exec_manager.dao.db_models import Execution
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.dao.job_claims import JobClaimer
+from exec_manager.models import ExecutionStatus
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+@pytest.mark.asyncio
+async def test_claims_are_disjoint(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that replicas never claim the same execution twice and that only
+    active executions are claimed."""
+    dao = ExecutionDao(session_factory)
+    ids = [await dao.create(["true"], owner="alice") for _ in range(5)]
+    await dao.set_status(ids[4], ExecutionStatus.SUCCEEDED)
+    first = JobClaimer(session_factory, replica_id="first", lease_duration=60)
+    second = JobClaimer(session_factory, replica_id="second", lease_duration=60)
+
+    claimed_first = await first.claim(2)
+    claimed_second = await second.claim(10)
+
+    assert [claim.execution_id for claim in claimed_first] == ids[:2]
+    assert [claim.execution_id for claim in claimed_second] == ids[2:4]
+    assert claimed_first[0].command == ["true"]
+    assert await first.claim(10) == []
+
+
+@pytest.mark.asyncio
+async def test_expired_leases_are_reclaimed(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that an execution is reclaimed once the lease of a crashed replica
+    expires, and that the crashed replica cannot renew it afterwards."""
+    dao = ExecutionDao(session_factory)
+    execution_id = await dao.create(["true"], owner="alice")
+    crashed = JobClaimer(session_factory, replica_id="crashed", lease_duration=60)
+    survivor = JobClaimer(session_factory, replica_id="survivor", lease_duration=60)
+
+    await crashed.claim(1)
+    await dao.set_status(execution_id, ExecutionStatus.RUNNING)
+    assert await survivor.claim(1) == []
+
+    async with session_factory() as session:
+        async with session.begin():
+            await session.execute(
+                update(Execution).values(
+                    lease_expires_at=datetime.utcnow() - timedelta(seconds=1)
+                )
+            )
+
+    reclaimed = await survivor.claim(1)
+    assert [claim.execution_id for claim in reclaimed] == [execution_id]
+    assert await crashed.renew([execution_id]) == 0
+    assert await survivor.renew([execution_id]) == 1
+    assert (await dao.get(execution_id)).lease_expires_at > datetime.utcnow()
+
+
+@pytest.mark.asyncio
+async def test_claims_follow_priority_and_fair_share(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that higher priorities are claimed first and that owners get shares
+    according to their weights regardless of how much they have queued."""
+    dao = ExecutionDao(session_factory)
+    for _ in range(6):
+        await dao.create(["true"], owner="alice")
+    for _ in range(4):
+        await dao.create(["true"], owner="bob")
+    for _ in range(4):
+        await dao.create(["true"], owner="carol")
+    await dao.create(["true"], owner="dave", priority=1)
+    claimer = JobClaimer(
+        session_factory, replica_id="replica", lease_duration=60, weights={"carol": 2}
+    )
+
+    first = await claimer.claim(1)
+    assert [claim.owner for claim in first] == ["dave"]
+    second = await claimer.claim(4)
+    assert Counter(claim.owner for claim in second) == {
+        "alice": 1,
+        "bob": 1,
+        "carol": 2,
+    }
+
+
+@pytest.mark.asyncio
+async def test_concurrent_claimers_both_get_executions(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that replicas claiming at the same time both get executions instead
+    of one of them skipping everything the other one claims."""
+    dao = ExecutionDao(session_factory)
+    for index in range(10):
+        await dao.create(["true"], owner=f"owner-{index % 2}")
+    first = JobClaimer(session_factory, replica_id="first", lease_duration=60)
+    second = JobClaimer(session_factory, replica_id="second", lease_duration=60)
+
+    claimed_first, claimed_second = await asyncio.gather(
+        first.claim(3), second.claim(3)
+    )
+
+    ids_first = {claim.execution_id for claim in claimed_first}
+    ids_second = {claim.execution_id for claim in claimed_second}
+    assert len(ids_first) == len(ids_second) == 3
+    assert not ids_first & ids_second
+
+
+@pytest.mark.asyncio
+async def test_claim_reads_candidates_from_the_index(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that the candidates of a claim are read in index order from the
+    partial index of active executions instead of ranking the whole table."""
+    dao = ExecutionDao(session_factory)
+    # like in production, most executions have finished:
+    for _ in range(200):
+        await dao.create(["true"], owner="owner")
+    async with session_factory() as session:
+        async with session.begin():
+            await session.execute(
+                update(Execution).values(status=ExecutionStatus.SUCCEEDED.value)
+            )
+    for _ in range(10):
+        await dao.create(["true"], owner="owner")
+    engine = session_factory.kw["bind"]
+    async with engine.begin() as connection:
+        await connection.exec_driver_sql("ANALYZE")
+    statements = []
+
+    def capture(_conn, _cursor, statement, parameters, _context, _executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        await JobClaimer(session_factory, replica_id="r", lease_duration=60).claim(5)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+    statement, parameters = next(
+        (statement, parameters)
+        for statement, parameters in statements
+        if statement.startswith("UPDATE")
+    )
+    async with engine.connect() as connection:
+        result = await connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        )
+        plan = [row[-1] for row in result]
+
+    assert any("ix_executions_claimable" in step for step in plan)
+    assert not any(
+        "executions" in step and "SCAN" in step and "INDEX" not in step for step in plan
+    )
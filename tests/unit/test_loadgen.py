@@ -0,0 +1,98 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the synthetic workload generator"""
+
+import asyncio
+import random
+
+import pytest
+
+from exec_manager.dao.change_feed import ChangeFeed
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.dao.job_claims import JobClaimer
+from exec_manager.dao.state_writer import StateWriter
+from exec_manager.loadgen import LoadGenerator, LoadProfile, synthetic_workflow
+from exec_manager.resources import ResourceAccountant, Resources
+from exec_manager.scheduler import Scheduler
+from exec_manager.workflow import WorkflowRunner, build_graph
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+def test_synthetic_workflow_follows_profile():
+    """Test that generated workflows are valid DAGs with the requested fan-out
+    and failure rate."""
+    rng = random.Random(0)
+    profile = LoadProfile(min_fan_out=2, max_fan_out=5, failure_rate=1.0)
+    for _ in range(20):
+        workflow = synthetic_workflow(rng, profile)
+        graph = build_graph(workflow)
+        work = [node for node in graph.nodes.values() if node.id.startswith("work")]
+        assert 2 <= len(work) <= 5
+        assert all(node.command[-1].endswith("exit 1") for node in work)
+        assert graph.nodes["gather"].command[-1].endswith("exit 0")
+
+
+@pytest.mark.asyncio
+async def test_load_is_tracked_until_finished(
+    session_factory, tmp_path  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that the workflows submitted to a running replica are reported once
+    the replica processed them."""
+    feed = ChangeFeed(
+        session_factory.kw["bind"], session_factory, poll_interval=0.05, retention=60
+    )
+    writer = StateWriter(session_factory, flush_interval=0.05, max_batch=100, feed=feed)
+    scheduler = Scheduler(
+        ExecutionDao(session_factory, feed),
+        writer,
+        JobClaimer(session_factory, replica_id="replica-1", lease_duration=60),
+        WorkflowRunner(ResourceAccountant(Resources(cpus=8, memory_mb=1024))),
+        max_in_flight=4,
+        max_queued=10,
+        heartbeat_interval=0.05,
+        claim_interval=0.05,
+        state_dir=tmp_path,
+        feed=feed,
+    )
+    writer.start()
+    replica = asyncio.create_task(scheduler.run())
+
+    profile = LoadProfile(
+        rate=20,
+        duration=0.2,
+        min_fan_out=1,
+        max_fan_out=2,
+        step_seconds=0.01,
+        distribution="fixed",
+        sample_interval=0.05,
+        drain_timeout=30,
+    )
+    generator = LoadGenerator(ExecutionDao(session_factory, feed), feed, profile)
+    try:
+        report = await generator.run()
+    finally:
+        replica.cancel()
+        await scheduler.shutdown()
+        await writer.close()
+
+    assert report.submitted == 4
+    assert report.succeeded == 4
+    assert report.unfinished == 0
+    assert report.workflows_per_second > 0
+    assert report.latency_seconds["max"] >= report.latency_seconds["p50"] > 0
+    assert report.queue_depth
@@ -0,0 +1,140 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test capturing and reading compressed logs"""
+
+import asyncio
+import sys
+from typing import AsyncIterator, List
+
+import pytest
+
+from exec_manager.logs import (
+    LogReader,
+    LogWriter,
+    capture,
+    capture_rest,
+    follow,
+    log_prefix,
+    spool_output,
+)
+
+
+def write_log(prefix, lines: int, chunk_lines: int) -> bytes:
+    """Write numbered lines into a log, several lines per chunk."""
+    content = b"".join(f"line {index}\n".encode() for index in range(lines))
+    writer = LogWriter(prefix)
+    chunks = content.splitlines(keepends=True)
+    for start in range(0, lines, chunk_lines):
+        writer.append(b"".join(chunks[start : start + chunk_lines]))
+    writer.close()
+    return content
+
+
+async def collect(chunks: AsyncIterator[bytes], received: List[bytes]) -> None:
+    """Append all chunks yielded by an iterator to a list."""
+    async for chunk in chunks:
+        received.append(chunk)
+
+
+def test_random_access_and_tail(tmp_path):
+    """Test reading byte ranges spanning several chunks and the last lines."""
+    prefix = tmp_path / "run" / "stdout"
+    content = write_log(prefix, lines=1000, chunk_lines=64)
+    reader = LogReader(prefix)
+
+    assert reader.size == len(content)
+    assert reader.closed
+    for offset, length in [(0, 10), (500, 3000), (len(content) - 5, 100)]:
+        assert reader.read(offset, length) == content[offset : offset + length]
+    assert reader.read(len(content), 10) == b""
+    assert reader.tail(3) == b"line 997\nline 998\nline 999\n"
+    assert reader.tail(200) == b"".join(content.splitlines(keepends=True)[-200:])
+
+
+def test_writer_continues_after_crash(tmp_path):
+    """Test that a reopened log drops a partially written frame and continues
+    after the last complete one."""
+    prefix = tmp_path / "stderr"
+    content = write_log(prefix, lines=10, chunk_lines=5)
+    with open(tmp_path / "stderr.zst", "ab") as data:
+        data.write(b"garbage")
+    with open(tmp_path / "stderr.idx", "ab") as index:
+        index.write(b"partial")
+
+    writer = LogWriter(prefix)
+    writer.append(b"more\n")
+    writer.close()
+
+    reader = LogReader(prefix)
+    assert reader.read(0, reader.size) == content + b"more\n"
+
+
+@pytest.mark.asyncio
+async def test_follow_live_output(tmp_path):
+    """Test that following a log yields output while the process is still
+    writing it."""
+    prefix = log_prefix(tmp_path, "run", "stdout")
+    code = (
+        "import sys, time\n"
+        + "for index in range(3):\n"
+        + "    print(index, flush=True)\n"
+        + "    time.sleep(0.2)\n"
+    )
+    with spool_output(tmp_path, "run") as (stdout, stderr):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", code, stdout=stdout, stderr=stderr
+        )
+    finished = asyncio.Event()
+    capturing = asyncio.create_task(
+        capture(prefix, finished, chunk_size=1024, flush_interval=0.05)
+    )
+
+    received: List[bytes] = []
+    following = asyncio.create_task(
+        collect(follow(prefix, poll_interval=0.02), received)
+    )
+    await process.wait()
+    finished.set()
+    await capturing
+    await following
+
+    assert b"".join(received) == b"0\n1\n2\n"
+    assert len(received) == 3
+
+
+@pytest.mark.asyncio
+async def test_capture_continues_after_restart(tmp_path):
+    """Test that output written while nothing captured it, as the service was
+    restarted, is picked up by the next capture where the previous one
+    stopped."""
+    prefix = log_prefix(tmp_path, "run", "stdout")
+    with spool_output(tmp_path, "run") as (stdout, _):
+        stdout.write(b"before\n")
+    first = asyncio.create_task(capture(prefix, asyncio.Event(), flush_interval=0.01))
+    await asyncio.sleep(0.1)
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert not LogReader(prefix).closed
+
+    with spool_output(tmp_path, "run") as (stdout, _):
+        stdout.write(b"while down\n")
+    await capture_rest(tmp_path, "run")
+
+    reader = LogReader(prefix)
+    assert reader.read(0, reader.size) == b"before\nwhile down\n"
+    assert reader.closed
+    assert not list(tmp_path.glob("run/*.spool"))
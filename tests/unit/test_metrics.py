@@ -0,0 +1,86 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the metrics subsystem"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from exec_manager.metrics import Registry, serve_metrics, timed
+
+
+def test_counter_shards_add_up():
+    """Test that increments from several threads are all counted."""
+    registry = Registry()
+    counter = registry.counter("test_events", "Events", ("kind",))
+    child = counter.labels("a")
+
+    def work():
+        for _ in range(1000):
+            child.inc()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for _ in range(8):
+            executor.submit(work)
+
+    assert child.value == 8000
+    assert 'test_events_total{kind="a"} 8000.0' in registry.expose()
+
+
+def test_histogram_exposition():
+    """Test that histograms are rendered with cumulative buckets."""
+    registry = Registry()
+    histogram = registry.histogram("test_seconds", "Durations", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+    registry.gauge("test_level", "A level", lambda: 3)
+
+    lines = registry.expose().splitlines()
+    assert "# TYPE test_seconds histogram" in lines
+    assert 'test_seconds_bucket{le="0.1"} 1.0' in lines
+    assert 'test_seconds_bucket{le="1.0"} 3.0' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 4.0' in lines
+    assert "test_seconds_count 4.0" in lines
+    assert "test_seconds_sum 6.05" in lines
+    assert "test_level 3.0" in lines
+
+
+@pytest.mark.asyncio
+async def test_timed_and_served():
+    """Test that decorated coroutines are timed and that the metrics are served
+    over HTTP."""
+    registry = Registry()
+    histogram = registry.histogram("test_call_seconds", "Calls", ("method",))
+
+    @timed(histogram)
+    async def call():
+        await asyncio.sleep(0)
+
+    await call()
+    assert histogram.labels(call.__qualname__).count == 1
+
+    server = await serve_metrics(registry, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    response = await reader.read()
+    writer.close()
+    server.close()
+    await server.wait_closed()
+
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert b"test_call_seconds_count" in response
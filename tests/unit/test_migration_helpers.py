@@ -0,0 +1,70 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the helpers for online migrations"""
+
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+from exec_manager.dao.migration_helpers import (
+    backfill,
+    create_index_concurrently,
+    drop_index_concurrently,
+    lock_timeout,
+)
+
+metadata = sa.MetaData()
+items = sa.Table(
+    "items",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("flag", sa.Boolean, nullable=True),
+)
+
+
+def test_helpers_on_sqlite(tmp_path):
+    """Test that the helpers fall back to regular operations on SQLite and that
+    the backfill updates exactly the matching rows across chunks."""
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    with engine.connect() as connection:
+        metadata.create_all(connection)
+        connection.execute(
+            items.insert(),
+            [
+                {"id": index, "flag": None if index % 3 else False}
+                for index in range(25)
+            ],
+        )
+        context = MigrationContext.configure(connection)
+        with Operations.context(context):
+            with context.begin_transaction():
+                with lock_timeout(1.0):
+                    create_index_concurrently("ix_items_flag", "items", ["flag"])
+                updated = backfill(
+                    items, {"flag": True}, where=items.c.flag.is_(None), chunk_size=4
+                )
+            assert "ix_items_flag" in {
+                index["name"] for index in sa.inspect(connection).get_indexes("items")
+            }
+            with context.begin_transaction():
+                drop_index_concurrently("ix_items_flag", "items")
+
+        assert updated == 16
+        flags = connection.execute(sa.select(items.c.flag).order_by(items.c.id))
+        assert [flag for (flag,) in flags] == [
+            not index % 3 == 0 for index in range(25)
+        ]
+        assert not sa.inspect(connection).get_indexes("items")
@@ -0,0 +1,53 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the profiling and tracing hooks"""
+
+import json
+import time
+
+from exec_manager.profiling import TRACER, Profiling
+
+
+def busy(seconds: float) -> None:
+    """Keep the calling thread busy."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_profile_and_trace(tmp_path):
+    """Test that enabling profiling samples the calling thread and writes the
+    traced spans to a valid trace file."""
+    profiling = Profiling(tmp_path, sample_interval=0.001)
+    assert not TRACER.enabled
+    profiling.toggle()
+    assert TRACER.enabled
+
+    start = time.perf_counter()
+    busy(0.1)
+    TRACER.span("execution-1", "running", start, time.perf_counter())
+    profiling.toggle()
+    TRACER.span("execution-2", "running", start, time.perf_counter())
+
+    (profile,) = tmp_path.glob("profile-*.folded")
+    assert "busy" in profile.read_text()
+    (trace,) = tmp_path.glob("trace-*.json")
+    events = json.loads(trace.read_text())
+    assert [(event["id"], event["ph"]) for event in events] == [
+        ("execution-1", "b"),
+        ("execution-1", "e"),
+    ]
+    assert events[1]["ts"] - events[0]["ts"] >= 100000
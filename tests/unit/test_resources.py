@@ -0,0 +1,84 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the accounting of host resources"""
+
+import asyncio
+
+import pytest
+
+from exec_manager.resources import (
+    InsufficientCapacityError,
+    ResourceAccountant,
+    Resources,
+)
+
+
+async def settle():
+    """Let all runnable tasks proceed."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_small_jobs_backfill():
+    """Test that a small job starts while a large one waits for resources."""
+    accountant = ResourceAccountant(Resources(cpus=4, memory_mb=1000))
+    running = Resources(cpus=3, memory_mb=100)
+    await accountant.acquire(running)
+
+    large = asyncio.create_task(accountant.acquire(Resources(cpus=4)))
+    small = asyncio.create_task(accountant.acquire(Resources(cpus=1)))
+    await settle()
+    assert small.done() and not large.done()
+
+    accountant.release(running)
+    accountant.release(Resources(cpus=1))
+    await asyncio.wait_for(large, timeout=1)
+    assert accountant.free == Resources(cpus=0, memory_mb=1000)
+
+
+@pytest.mark.asyncio
+async def test_starving_job_stops_backfill():
+    """Test that no job overtakes one that has waited for too long."""
+    accountant = ResourceAccountant(
+        Resources(cpus=4, memory_mb=1000), starvation_timeout=0
+    )
+    await accountant.acquire(Resources(cpus=3))
+
+    large = asyncio.create_task(accountant.acquire(Resources(cpus=4)))
+    await settle()
+    small = asyncio.create_task(accountant.acquire(Resources(cpus=1)))
+    await settle()
+    assert not small.done() and not large.done()
+
+    accountant.release(Resources(cpus=3))
+    await asyncio.wait_for(large, timeout=1)
+    assert not small.done()
+    small.cancel()
+
+
+@pytest.mark.asyncio
+async def test_overcommit_applies_to_cpus_only():
+    """Test that CPUs are overcommitted by the ratio but memory is not and that
+    requests beyond the capacity are rejected."""
+    accountant = ResourceAccountant(
+        Resources(cpus=2, memory_mb=1000), cpu_overcommit=2.0
+    )
+    assert accountant.capacity == Resources(cpus=4, memory_mb=1000)
+    async with accountant.reserve(Resources(cpus=4, memory_mb=1000)):
+        assert accountant.free == Resources(cpus=0, memory_mb=0)
+    with pytest.raises(InsufficientCapacityError):
+        await accountant.acquire(Resources(cpus=1, memory_mb=1001))
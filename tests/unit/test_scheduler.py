@@ -0,0 +1,287 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the execution scheduler"""
+
+import asyncio
+import subprocess  # nosec
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.dao.job_claims import JobClaimer
+from exec_manager.dao.state_writer import StateWriter
+from exec_manager.logs import LogReader, log_prefix
+from exec_manager.models import ExecutionStatus
+from exec_manager.processes import wrap_command
+from exec_manager.resources import ResourceAccountant, Resources
+from exec_manager.scheduler import Scheduler
+from exec_manager.workflow import Step, Workflow, WorkflowRunner
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+def make_scheduler(
+    session_factory_,
+    state_dir,
+    replica_id: str = "replica-1",
+    lease_duration: float = 60,
+):
+    """Create a scheduler together with the state writer it uses."""
+    writer = StateWriter(session_factory_, flush_interval=0.05, max_batch=100)
+    claimer = JobClaimer(
+        session_factory_, replica_id=replica_id, lease_duration=lease_duration
+    )
+    scheduler = Scheduler(
+        ExecutionDao(session_factory_),
+        writer,
+        claimer,
+        WorkflowRunner(ResourceAccountant(Resources(cpus=4, memory_mb=1024))),
+        max_in_flight=2,
+        max_queued=10,
+        heartbeat_interval=0.05,
+        claim_interval=0.05,
+        state_dir=state_dir,
+        logs_dir=state_dir / "logs",
+    )
+    return scheduler, writer
+
+
+@pytest.mark.asyncio
+async def test_run_records_outcome(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+    tmp_path,
+):
+    """Test that finished executions are persisted with their exit code."""
+    dao = ExecutionDao(session_factory)
+    scheduler, writer = make_scheduler(session_factory, tmp_path)
+    writer.start()
+    dispatcher = asyncio.create_task(scheduler.run())
+
+    succeeding = await scheduler.submit(
+        [sys.executable, "-c", "print('hello')"], owner="alice"
+    )
+    failing = await scheduler.submit(
+        [sys.executable, "-c", "raise SystemExit(3)"], owner="alice"
+    )
+    missing = await scheduler.submit(["/non/existing/executable"], owner="bob")
+    sleeping = await scheduler.submit(
+        [sys.executable, "-c", "import time; time.sleep(0.2)"], owner="bob"
+    )
+    workflow = await scheduler.submit_workflow(
+        Workflow(
+            steps=[
+                Step(id="a", command=[sys.executable, "-c", "pass"]),
+                Step(id="b", command=[sys.executable, "-c", "pass"], depends_on=["a"]),
+            ]
+        ),
+        owner="bob",
+    )
+    await scheduler.join()
+    dispatcher.cancel()
+    await writer.close()
+
+    assert (await dao.get(succeeding)).status == ExecutionStatus.SUCCEEDED
+    stdout = LogReader(log_prefix(tmp_path / "logs", succeeding, "stdout"))
+    assert stdout.tail(1) == b"hello\n"
+    failed = await dao.get(failing)
+    assert failed.status == ExecutionStatus.FAILED
+    assert failed.exit_code == 3
+    assert failed.pid is not None
+    assert (await dao.get(missing)).status == ExecutionStatus.FAILED
+    assert (await dao.get(sleeping)).heartbeat_at is not None
+    assert (await dao.get(workflow)).status == ExecutionStatus.SUCCEEDED
+
+
+@pytest.mark.asyncio
+async def test_in_flight_is_bounded(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+    tmp_path,
+):
+    """Test that no more than `max_in_flight` executions run at the same time."""
+    scheduler, _ = make_scheduler(session_factory, tmp_path)
+    dispatcher = asyncio.create_task(scheduler.run())
+
+    for _ in range(5):
+        await scheduler.submit(
+            [sys.executable, "-c", "import time; time.sleep(0.2)"], owner="alice"
+        )
+
+    peak = 0
+    while scheduler.queued or scheduler.in_flight:
+        peak = max(peak, scheduler.in_flight)
+        await asyncio.sleep(0.01)
+    dispatcher.cancel()
+
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_replicas_share_executions(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+    tmp_path,
+):
+    """Test that executions stored in the database are run exactly once by
+    several replicas claiming from it."""
+    dao = ExecutionDao(session_factory)
+    marker_file = tmp_path / "markers"
+    ids = [
+        await dao.create(
+            [
+                sys.executable,
+                "-c",
+                f"open({str(marker_file)!r}, 'a').write('{index}\\n')",
+            ],
+            owner="alice",
+        )
+        for index in range(6)
+    ]
+
+    replicas = [
+        make_scheduler(session_factory, tmp_path, f"replica-{n}") for n in range(2)
+    ]
+    tasks = []
+    for scheduler, writer in replicas:
+        writer.start()
+        tasks.append(asyncio.create_task(scheduler.run()))
+
+    while True:
+        statuses = [(await dao.get(id_)).status for id_ in ids]
+        if all(status == ExecutionStatus.SUCCEEDED for status in statuses):
+            break
+        await asyncio.sleep(0.05)
+
+    for task in tasks:
+        task.cancel()
+    for _, writer in replicas:
+        await writer.close()
+
+    markers = marker_file.read_text().split()
+    assert sorted(markers) == [str(index) for index in range(6)]
+    lease_owners = {(await dao.get(id_)).lease_owner for id_ in ids}
+    assert lease_owners == {"replica-0", "replica-1"}
+
+
+@pytest.mark.asyncio
+async def test_shutdown_keeps_the_leases_of_running_executions(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+    tmp_path,
+):
+    """Test that executions running during a shutdown stay leased to the replica
+    until they finished, while queued ones are handed to other replicas."""
+    scheduler, writer = make_scheduler(session_factory, tmp_path, lease_duration=0.6)
+    writer.start()
+    dispatcher = asyncio.create_task(scheduler.run())
+    command = [sys.executable, "-c", "import time; time.sleep(1.5)"]
+    running = [await scheduler.submit(command, owner="alice") for _ in range(2)]
+    queued = await scheduler.submit(command, owner="alice")
+    while scheduler.in_flight < 2:
+        await asyncio.sleep(0.01)
+    dispatcher.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await dispatcher
+
+    shutdown = asyncio.create_task(scheduler.shutdown())
+    await asyncio.sleep(1.0)
+    other = JobClaimer(session_factory, replica_id="replica-2", lease_duration=60)
+    claimed = await other.claim(5)
+    await shutdown
+    await writer.close()
+
+    assert [claim.execution_id for claim in claimed] == [queued]
+    dao = ExecutionDao(session_factory)
+    for execution_id in running:
+        execution = await dao.get(execution_id)
+        assert execution.status == ExecutionStatus.SUCCEEDED
+        assert execution.lease_owner == "replica-1"
+
+
+@pytest.mark.asyncio
+async def test_recovery_after_restart(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+    tmp_path,
+):
+    """Test that a restarted replica reattaches to processes that are still
+    alive, requeues its other executions and leaves those of others alone."""
+    dao = ExecutionDao(session_factory)
+    lease = datetime.utcnow() + timedelta(minutes=1)
+    alive = await dao.create([], owner="alice", lease_owner="replica-1")
+    status_file = tmp_path / f"{alive}.exit"
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        wrap_command(
+            [sys.executable, "-c", "import time; time.sleep(0.3); raise SystemExit(4)"],
+            status_file,
+        )
+    )
+    await dao.set_status(alive, ExecutionStatus.RUNNING, pid=process.pid)
+    crashed = await dao.create(
+        [sys.executable, "-c", "pass"],
+        owner="alice",
+        lease_owner="replica-1",
+        lease_expires_at=lease,
+    )
+    await dao.set_status(crashed, ExecutionStatus.RUNNING, pid=2**22 + 1)
+    foreign = await dao.create(
+        ["true"], owner="alice", lease_owner="replica-2", lease_expires_at=lease
+    )
+
+    scheduler, writer = make_scheduler(session_factory, tmp_path)
+    writer.start()
+    dispatcher = asyncio.create_task(scheduler.run())
+    while scheduler.in_flight or scheduler.queued or not process.poll():
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.1)
+    dispatcher.cancel()
+    await writer.close()
+
+    reattached = await dao.get(alive)
+    assert (reattached.status, reattached.exit_code) == (ExecutionStatus.FAILED, 4)
+    assert (await dao.get(crashed)).status == ExecutionStatus.SUCCEEDED
+    assert (await dao.get(foreign)).status == ExecutionStatus.QUEUED
+    assert not status_file.exists()
+
+
+@pytest.mark.asyncio
+async def test_recovery_collects_processes_exited_while_down(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+    tmp_path,
+):
+    """Test that the outcome of a process that exited while the service was down
+    is taken from its status file instead of running the command again."""
+    dao = ExecutionDao(session_factory)
+    runs = tmp_path / "runs"
+    exited = await dao.create(
+        [sys.executable, "-c", f"open({str(runs)!r}, 'a').write('run')"],
+        owner="alice",
+        lease_owner="replica-1",
+        lease_expires_at=datetime.utcnow() + timedelta(minutes=1),
+    )
+    await dao.set_status(exited, ExecutionStatus.RUNNING, pid=2**22 + 1)
+    status_file = tmp_path / f"{exited}.exit"
+    status_file.write_text("0\n")
+
+    scheduler, writer = make_scheduler(session_factory, tmp_path)
+    writer.start()
+    await scheduler.recover()
+    await writer.close()
+
+    execution = await dao.get(exited)
+    assert (execution.status, execution.exit_code) == (ExecutionStatus.SUCCEEDED, 0)
+    assert scheduler.queued == 0
+    assert not runs.exists()
+    assert not status_file.exists()
@@ -0,0 +1,48 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the JSON encoding of database records"""
+
+import json
+from datetime import datetime
+
+import pytest
+
+from exec_manager import serialization
+from exec_manager.dao.executions import ExecutionSummary
+from exec_manager.serialization import dump_summaries
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_dump_summaries(fast: bool, monkeypatch):
+    """Test that both the orjson and the standard library encoders produce the
+    same documents."""
+    if not fast:
+        monkeypatch.setattr(serialization, "orjson", None)
+    summary = ExecutionSummary(
+        "0001", "alice", "succeeded", 42, 0, datetime(2022, 1, 1), datetime(2022, 1, 2)
+    )
+
+    assert json.loads(dump_summaries([summary])) == [
+        {
+            "id": "0001",
+            "owner": "alice",
+            "status": "succeeded",
+            "pid": 42,
+            "exit_code": 0,
+            "created_at": "2022-01-01T00:00:00",
+            "updated_at": "2022-01-02T00:00:00",
+        }
+    ]
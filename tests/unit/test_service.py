@@ -0,0 +1,127 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the wiring of the service components"""
+
+import asyncio
+import os
+import signal
+import subprocess  # nosec
+import sys
+from pathlib import Path
+
+import pytest
+
+from exec_manager.config import Config
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.logs import LogReader, log_prefix
+from exec_manager.metrics import REGISTRY
+from exec_manager.models import ExecutionStatus
+from exec_manager.service import serve
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+def make_config(session_factory_, tmp_path: Path) -> Config:
+    """Create the config of a service using the database of the session factory
+    and keeping its files in the given directory."""
+    return Config(
+        db_url=str(session_factory_.kw["bind"].url),
+        replica_id="replica-1",
+        state_dir=str(tmp_path / "state"),
+        logs_dir=str(tmp_path / "logs"),
+        call_cache_dir=str(tmp_path / "call_cache"),
+        profile_dir=str(tmp_path / "profiles"),
+        metrics_port=None,
+        claim_interval=0.05,
+        heartbeat_interval=0.1,
+    )
+
+
+@pytest.mark.asyncio
+async def test_serve_exposes_component_metrics(
+    session_factory, tmp_path  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that the service starts with all components wired up and exposes
+    their statistics."""
+    config = make_config(session_factory, tmp_path)
+    service = asyncio.create_task(serve(config))
+    await asyncio.sleep(0.5)
+    exposed = REGISTRY.expose()
+    service.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await service
+
+    for name in [
+        "exec_manager_call_cache_hits",
+        "exec_manager_call_cache_hit_ratio",
+    ]:
+        assert f"\n{name} " in exposed
+    assert '\nexec_manager_executions{status="queued"} 0' in exposed
+
+
+@pytest.mark.asyncio
+async def test_restart_during_an_execution_writing_output(
+    session_factory, tmp_path  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that an execution writing output keeps running when the service is
+    killed and restarted, and that its output is captured completely."""
+    config = make_config(session_factory, tmp_path)
+    dao = ExecutionDao(session_factory)
+    code = (
+        "import time\n"
+        + "for index in range(30):\n"
+        + "    print(index, flush=True)\n"
+        + "    time.sleep(0.05)\n"
+    )
+    execution_id = await dao.create([sys.executable, "-c", code], owner="alice")
+    environment = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(sys.path),
+        **{
+            f"EXEC_MANAGER_{name.upper()}": str(value)
+            for name, value in config.dict().items()
+            if isinstance(value, (str, float, int))
+        },
+        EXEC_MANAGER_METRICS_PORT="0",
+    )
+    first = subprocess.Popen(  # nosec pylint: disable=consider-using-with
+        [sys.executable, "-m", "exec_manager"], env=environment
+    )
+    try:
+        while (await dao.get(execution_id)).status != ExecutionStatus.RUNNING:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.3)
+    finally:
+        first.send_signal(signal.SIGKILL)
+        first.wait()
+
+    second = asyncio.create_task(serve(config))
+    try:
+        while (await dao.get(execution_id)).status == ExecutionStatus.RUNNING:
+            await asyncio.sleep(0.05)
+    finally:
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+
+    execution = await dao.get(execution_id)
+    assert (execution.status, execution.exit_code) == (ExecutionStatus.SUCCEEDED, 0)
+    stdout = LogReader(log_prefix(Path(config.logs_dir), execution_id, "stdout"))
+    assert stdout.read(0, stdout.size).split() == [
+        str(index).encode() for index in range(30)
+    ]
+    assert stdout.closed
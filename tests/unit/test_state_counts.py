@@ -0,0 +1,94 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the counts of executions by state"""
+
+import pytest
+from sqlalchemy import event
+
+from exec_manager.dao.db_models import Execution
+from exec_manager.dao.executions import STATUS_CHANGES, ExecutionDao
+from exec_manager.models import ExecutionStatus
+from exec_manager.state_counts import StateCounts
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+@pytest.mark.asyncio
+async def test_executions_are_counted_by_status(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that the active executions of all owners are counted in the database,
+    that finished executions are counted by their status changes and that the
+    counts are only updated when refreshed."""
+    dao = ExecutionDao(session_factory)
+    succeeded_before = STATUS_CHANGES.labels(ExecutionStatus.SUCCEEDED.value).value
+    finished = await dao.create(["true"], "alice")
+    await dao.set_status(finished, ExecutionStatus.SUCCEEDED)
+    await dao.create(["true"], "alice")
+    await dao.create(["true"], "bob")
+    state_counts = StateCounts(dao, interval=60)
+    assert state_counts.counts == {}
+
+    await state_counts.refresh()
+    await dao.create(["true"], "bob")
+
+    assert state_counts.counts[ExecutionStatus.QUEUED.value] == 2
+    assert state_counts.counts[ExecutionStatus.RUNNING.value] == 0
+    assert state_counts.counts[ExecutionStatus.SUCCEEDED.value] == succeeded_before + 1
+    assert set(state_counts.counts) == {status.value for status in ExecutionStatus}
+
+
+@pytest.mark.asyncio
+async def test_active_executions_are_counted_from_an_index(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that counting the active executions does not read the finished
+    ones."""
+    async with session_factory() as session:
+        async with session.begin():
+            for index in range(200):
+                session.add(
+                    Execution(
+                        id=f"execution-{index}",
+                        owner="alice",
+                        status=ExecutionStatus.SUCCEEDED.value,
+                        command=["true"],
+                    )
+                )
+    engine = session_factory.kw["bind"]
+    async with engine.begin() as connection:
+        await connection.exec_driver_sql("ANALYZE")
+    statements = []
+
+    def capture(_conn, _cursor, statement, parameters, _context, _executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        await ExecutionDao(session_factory).active_counts()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+    statement, parameters = statements[-1]
+    async with engine.connect() as connection:
+        result = await connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        )
+        plan = " ".join(row[-1] for row in result)
+
+    assert "SEARCH executions USING" in plan
+    assert "SCAN executions" not in plan
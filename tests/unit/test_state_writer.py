@@ -0,0 +1,77 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the batching state writer"""
+
+import asyncio
+
+import pytest
+
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.dao.state_writer import StateWriter
+from exec_manager.models import ExecutionStatus
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+@pytest.mark.asyncio
+async def test_updates_are_coalesced(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that updates of one execution are merged in submission order and
+    written together with those of other executions in one flush."""
+    dao = ExecutionDao(session_factory)
+    first = await dao.create(["true"], owner="alice")
+    second = await dao.create(["true"], owner="alice")
+    writer = StateWriter(session_factory, flush_interval=60, max_batch=100)
+
+    writer.update(first, status=ExecutionStatus.RUNNING, pid=42)
+    writer.heartbeat(first)
+    writer.update(first, status=ExecutionStatus.SUCCEEDED, exit_code=0)
+    writer.update(second, status=ExecutionStatus.RUNNING)
+    assert writer.pending == 2
+    await writer.flush()
+
+    finished = await dao.get(first)
+    assert finished.status == ExecutionStatus.SUCCEEDED
+    assert (finished.pid, finished.exit_code) == (42, 0)
+    assert finished.heartbeat_at is not None
+    assert (await dao.get(second)).status == ExecutionStatus.RUNNING
+    assert writer.metrics.flushes == 1
+    assert writer.metrics.batch_size_max == 2
+
+
+@pytest.mark.asyncio
+async def test_full_batch_and_close_flush(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that a full batch is written early and that closing writes the
+    rest."""
+    dao = ExecutionDao(session_factory)
+    ids = [await dao.create(["true"], owner="alice") for _ in range(3)]
+    writer = StateWriter(session_factory, flush_interval=60, max_batch=2)
+    writer.start()
+
+    writer.update(ids[0], status=ExecutionStatus.RUNNING)
+    writer.update(ids[1], status=ExecutionStatus.RUNNING)
+    while writer.metrics.flushes == 0:
+        await asyncio.sleep(0.01)
+    writer.update(ids[2], status=ExecutionStatus.CANCELLED)
+    await writer.close()
+
+    assert writer.metrics.flushes == 2
+    assert writer.metrics.updates_written == 3
+    assert (await dao.get(ids[2])).status == ExecutionStatus.CANCELLED
@@ -0,0 +1,83 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test the cache of execution statuses"""
+
+import pytest
+
+from exec_manager.dao.change_feed import ChangeFeed
+from exec_manager.dao.executions import ExecutionDao, ExecutionNotFoundError
+from exec_manager.dao.status_cache import LruBackend, StatusCache
+from exec_manager.models import ExecutionStatus
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+@pytest.mark.asyncio
+async def test_cache_is_invalidated_on_commit(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that reads are answered from the cache until the status changes."""
+    feed = ChangeFeed(
+        session_factory.kw["bind"], session_factory, poll_interval=60, retention=60
+    )
+    dao = ExecutionDao(session_factory, feed)
+    cache = StatusCache(dao, ttl=60)
+    cache.attach(feed)
+    execution_id = await dao.create(["true"], "alice")
+
+    assert await cache.get_status(execution_id) == ExecutionStatus.QUEUED
+    assert await cache.get_status(execution_id) == ExecutionStatus.QUEUED
+    await dao.set_status(execution_id, ExecutionStatus.RUNNING, pid=1)
+    assert await cache.get_status(execution_id) == ExecutionStatus.RUNNING
+
+    assert cache.metrics.hits == 1
+    assert cache.metrics.misses == 2
+    assert cache.metrics.invalidations == 2
+    assert cache.metrics.hit_ratio == pytest.approx(1 / 3)
+    assert cache.metrics.staleness_seconds_max < 60
+
+    with pytest.raises(ExecutionNotFoundError):
+        await cache.get_status("missing")
+
+
+@pytest.mark.asyncio
+async def test_cache_expires_entries(
+    session_factory,  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that entries are not used beyond their TTL."""
+    dao = ExecutionDao(session_factory)
+    cache = StatusCache(dao, ttl=0)
+    execution_id = await dao.create(["true"], "alice")
+
+    await cache.get_status(execution_id)
+    await cache.get_status(execution_id)
+
+    assert cache.metrics.hits == 0
+    assert cache.metrics.expirations == 1
+
+
+def test_lru_backend_evicts_least_recently_used():
+    """Test that the backend keeps the most recently used entries."""
+    backend = LruBackend(max_entries=2)
+    backend.set("a", ExecutionStatus.QUEUED, 0)
+    backend.set("b", ExecutionStatus.QUEUED, 0)
+    backend.get("a")
+
+    assert backend.set("c", ExecutionStatus.QUEUED, 0) == 1
+    assert backend.get("b") is None
+    assert backend.get("a") is not None
+    assert len(backend) == 2
@@ -0,0 +1,232 @@
+# Copyright 2021 - 2022 Universität Tübingen, DKFZ and EMBL
+# for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Test parsing and dispatching workflows"""
+
+import asyncio
+import sys
+import time
+
+import pytest
+
+from exec_manager.call_cache import CallCache
+from exec_manager.checksums import Checksummer
+from exec_manager.dao.executions import ExecutionDao
+from exec_manager.dao.step_records import StepRecordDao
+from exec_manager.resources import ResourceAccountant, Resources
+from exec_manager.workflow import (
+    Step,
+    Workflow,
+    WorkflowError,
+    WorkflowRunner,
+    build_graph,
+)
+from tests.fixtures.db import (  # noqa: F401 pylint: disable=unused-import
+    session_factory,
+)
+
+
+def append_step(step_id: str, path, text: str, **kwargs) -> Step:
+    """Create a step appending the text to a file."""
+    code = f"open({str(path)!r}, 'a').write({text!r} + '\\n')"
+    return Step(id=step_id, command=[sys.executable, "-c", code], **kwargs)
+
+
+def test_build_graph_expands_scatter():
+    """Test that scattered steps become one node per item and that every shard
+    depends on all shards upstream."""
+    workflow = Workflow(
+        steps=[
+            Step(id="split", command=["split"], scatter=["a", "b"]),
+            Step(id="align", command=["align", "{item}"], scatter=["1", "2", "3"]),
+            Step(id="merge", command=["merge"], depends_on=["split", "align"]),
+        ]
+    )
+    graph = build_graph(workflow)
+
+    assert len(graph.nodes) == 6
+    assert graph.nodes["align[2]"].command == ["align", "3"]
+    assert graph.nodes["split[0]"].dependents == ["merge"]
+    assert graph.in_degree["merge"] == 5
+    assert graph.in_degree["align[0]"] == 0
+
+
+@pytest.mark.parametrize(
+    "steps",
+    [
+        [Step(id="a", command=["a"]), Step(id="a", command=["a"])],
+        [Step(id="a", command=["a"], depends_on=["missing"])],
+        [
+            Step(id="a", command=["a"], depends_on=["b"]),
+            Step(id="b", command=["b"], depends_on=["a"]),
+        ],
+    ],
+)
+def test_build_graph_rejects_invalid(steps):
+    """Test that duplicate ids, unknown dependencies and cycles are rejected."""
+    with pytest.raises(WorkflowError):
+        build_graph(Workflow(steps=steps))
+
+
+@pytest.mark.asyncio
+async def test_runner_respects_dependencies(tmp_path):
+    """Test that steps run after their dependencies and that nothing is started
+    after a failure."""
+    log = tmp_path / "log"
+    workflow = Workflow(
+        steps=[
+            append_step("first", log, "first"),
+            append_step("second", log, "second", depends_on=["first"]),
+            Step(id="broken", command=["/non/existing"], depends_on=["second"]),
+            append_step("never", log, "never", depends_on=["broken"]),
+        ]
+    )
+    runner = WorkflowRunner(ResourceAccountant(Resources(cpus=4, memory_mb=1024)))
+
+    assert not await runner.run(build_graph(workflow))
+    assert log.read_text().split() == ["first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_runner_drains_running_steps_after_failure(tmp_path):
+    """Test that steps still running when another one fails are awaited, but
+    their dependents are not started."""
+    log = tmp_path / "log"
+    slow = f"import time; time.sleep(0.2); open({str(log)!r}, 'a').write('slow')"
+    workflow = Workflow(
+        steps=[
+            Step(id="broken", command=["/non/existing"]),
+            Step(id="slow", command=[sys.executable, "-c", slow]),
+            append_step("after", log, "after", depends_on=["slow"]),
+        ]
+    )
+    runner = WorkflowRunner(ResourceAccountant(Resources(cpus=4, memory_mb=1024)))
+
+    assert not await asyncio.wait_for(runner.run(build_graph(workflow)), 10)
+    assert log.read_text().split() == ["slow"]
+
+
+@pytest.mark.asyncio
+async def test_runner_runs_scatter_in_parallel():
+    """Test that all shards of a scattered step run at the same time if there
+    are enough slots."""
+    sleep = [sys.executable, "-c", "import time; time.sleep(0.5)"]
+    workflow = Workflow(steps=[Step(id="wide", command=sleep, scatter=["1"] * 4)])
+    runner = WorkflowRunner(ResourceAccountant(Resources(cpus=4, memory_mb=1024)))
+
+    start = time.monotonic()
+    assert await runner.run(build_graph(workflow))
+    assert time.monotonic() - start < 1.5
+
+
+@pytest.mark.asyncio
+async def test_resume_skips_completed_steps(
+    session_factory, tmp_path  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that a rerun skips recorded steps whose outputs exist and reruns those
+    whose outputs are gone, recording every step that completes."""
+    execution_id = await ExecutionDao(session_factory).create([], owner="alice")
+    log = tmp_path / "log"
+    output = tmp_path / "output"
+    touch = [sys.executable, "-c", f"open({str(output)!r}, 'w')"]
+    workflow = Workflow(
+        steps=[
+            Step(id="produce", command=touch, outputs=[str(output)]),
+            append_step("first", log, "first", depends_on=["produce"]),
+            append_step("last", log, "last", depends_on=["first"]),
+        ]
+    )
+    records = StepRecordDao(session_factory)
+    runner = WorkflowRunner(
+        ResourceAccountant(Resources(cpus=4, memory_mb=1024)), records
+    )
+    await records.record(execution_id, "produce", [str(output)])
+    await records.record(execution_id, "first", [])
+
+    assert await runner.run(build_graph(workflow), execution_id)
+    assert log.read_text().split() == ["last"]
+    assert output.exists()
+
+    output.unlink()
+    assert await runner.run(build_graph(workflow), execution_id)
+    assert log.read_text().split() == ["last"]
+    assert output.exists()
+
+
+@pytest.mark.asyncio
+async def test_cached_steps_are_not_run_again(
+    session_factory, tmp_path  # noqa: F811 pylint: disable=redefined-outer-name
+):
+    """Test that a step run on inputs with the same content as before gets its
+    outputs from the call cache, while changed inputs make it run again."""
+    source = tmp_path / "source"
+    output = tmp_path / "out" / "output"
+    runs = tmp_path / "runs"
+    code = (
+        f"open({str(runs)!r}, 'a').write('run\\n');"
+        + f"open({str(output)!r}, 'w').write(open({str(source)!r}).read().upper())"
+    )
+    workflow = Workflow(
+        steps=[
+            Step(
+                id="upper",
+                command=[sys.executable, "-c", code],
+                inputs=[str(source)],
+                outputs=[str(output)],
+            )
+        ]
+    )
+    cache = CallCache(session_factory, cache_dir=tmp_path / "cache", max_bytes=1024)
+    checksummer = Checksummer(max_workers=2)
+    runner = WorkflowRunner(
+        ResourceAccountant(Resources(cpus=4, memory_mb=1024)),
+        call_cache=cache,
+        checksummer=checksummer,
+    )
+    output.parent.mkdir()
+    try:
+        source.write_text("a")
+        assert await runner.run(build_graph(workflow))
+        output.unlink()
+        assert await runner.run(build_graph(workflow))
+        assert output.read_text() == "A"
+        assert runs.read_text().split() == ["run"]
+
+        source.write_text("b")
+        assert await runner.run(build_graph(workflow))
+        assert output.read_text() == "B"
+        assert runs.read_text().split() == ["run", "run"]
+    finally:
+        checksummer.close()
+    assert (cache.metrics.hits, cache.metrics.misses) == (1, 2)
+
+
+@pytest.mark.asyncio
+async def test_failed_steps_are_retried(tmp_path):
+    """Test that a failing step is retried until it succeeds."""
+    attempts = tmp_path / "attempts"
+    code = (
+        f"f = open({str(attempts)!r}, 'a+'); f.write('x'); f.seek(0);"
+        + " raise SystemExit(len(f.read()) < 3)"
+    )
+    runner = WorkflowRunner(
+        ResourceAccountant(Resources(cpus=4, memory_mb=1024)), retry_backoff=0.01
+    )
+    flaky = Step(id="flaky", command=[sys.executable, "-c", code], retries=1)
+
+    assert not await runner.run(build_graph(Workflow(steps=[flaky])))
+    flaky.retries = 2
+    assert await runner.run(build_graph(Workflow(steps=[flaky])))
+    assert attempts.read_text() == "xxx"